@@ -0,0 +1,164 @@
+import csv
+import io
+import json
+import time
+from xml.sax.saxutils import escape
+
+# columns of exported rows
+FIELDS = ("position", "index", "received", "delivered", "delivery_ratio", "update_rate",
+          "activations", "on_time", "peak", "mean")
+HEATMAP_METRICS = ("received", "delivered", "update_rate", "activations", "on_time", "peak", "mean")
+
+CELL = 48
+GAP = 24
+
+
+class ActuatorStats:
+    def __init__(self, _offsets: dict, _clock=time.monotonic):
+        """
+        Activity statistics of every actuator, kept in flat lists laid out like EnvelopeEngine.
+
+        received counts updates that reach HapticsPlayer.set(), delivered counts changes of output level
+        that are submitted to device. on-time and mean intensity are integrated per update().
+        :param _offsets: (Dictionary) position name -> (start, end) in flat lists
+        :param _clock: [optional] callable that returns monotonic time
+        """
+        self.offsets = _offsets
+        self.clock = _clock
+        self.total = max((end for _start, end in _offsets.values()), default=0)
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        clear every statistic
+        :return: None
+        """
+        total = self.total
+        self.started = self.clock()
+        self.received = [0] * total
+        self.delivered = [0] * total
+        self.activations = [0] * total
+        self.on_time = [0.0] * total
+        # integral of intensity over on-time
+        self.energy = [0.0] * total
+        self.peak = [0] * total
+        self.__last = [0] * total
+
+    def receive(self, _position: str, _index: int) -> None:
+        """
+        count update received for actuator
+        :param _position: (String) position name
+        :param _index: (Int) actuator index
+        :return: None
+        """
+        self.received[self.offsets[_position][0] + _index] += 1
+
+    def observe(self, _levels: list, _dt: float) -> None:
+        """
+        account output levels of every actuator after dt
+        :param _levels: (List) current levels in flat layout
+        :param _dt: (Float) seconds since previous observe()
+        :return: None
+        """
+        last = self.__last
+
+        # only actuators that are active or just changed need work
+        for i in [i for i, (level, prev) in enumerate(zip(_levels, last)) if level or prev]:
+            level, prev = _levels[i], last[i]
+            if prev:
+                self.on_time[i] += _dt
+                self.energy[i] += prev * _dt
+            if level != prev:
+                self.delivered[i] += 1
+                if not prev:
+                    self.activations[i] += 1
+                if level > self.peak[i]:
+                    self.peak[i] = level
+
+        self.__last = list(_levels)
+
+    def rows(self) -> list:
+        """
+        get statistics of every actuator
+        :return: (List) dictionaries with FIELDS
+        """
+        elapsed = max(self.clock() - self.started, 1e-9)
+        rows = []
+
+        for key, (start, end) in self.offsets.items():
+            for i in range(start, end):
+                on_time = self.on_time[i]
+                rows.append({
+                    "position": key,
+                    "index": i - start,
+                    "received": self.received[i],
+                    "delivered": self.delivered[i],
+                    "delivery_ratio": round(self.delivered[i] / self.received[i], 4) if self.received[i] else None,
+                    "update_rate": round(self.received[i] / elapsed, 4),
+                    "activations": self.activations[i],
+                    "on_time": round(on_time, 4),
+                    "peak": self.peak[i],
+                    "mean": round(self.energy[i] / on_time, 2) if on_time else 0,
+                })
+
+        return rows
+
+    def to_json(self) -> str:
+        """
+        :return: (String) statistics as JSON
+        """
+        return json.dumps({"elapsed": round(self.clock() - self.started, 3), "actuators": self.rows()}, indent=4)
+
+    def to_csv(self) -> str:
+        """
+        :return: (String) statistics as CSV, one row per actuator
+        """
+        out = io.StringIO()
+        writer = csv.DictWriter(out, FIELDS, lineterminator="\n")
+        writer.writeheader()
+        writer.writerows(self.rows())
+        return out.getvalue()
+
+    def heatmap(self, _layouts, _device: str, _metric: str = "on_time") -> str:
+        """
+        render statistic of every motor of device as heatmap
+        :param _layouts: (DeviceLayouts) layouts that give device positions and grid shapes
+        :param _device: (String) device name of layout
+        :param _metric: [optional] (String) one of HEATMAP_METRICS
+        :return: (String) SVG image
+        :raise: ValueError if device or metric is unknown
+        """
+        if _metric not in HEATMAP_METRICS:
+            raise ValueError(f"metric must be one of {HEATMAP_METRICS}")
+
+        positions = [key for key, family in _layouts.families.items() if family == _device and key in self.offsets]
+        if not positions:
+            raise ValueError(f"unknown device {_device}")
+
+        values = {(row["position"], row["index"]): row[_metric] for row in self.rows() if row["position"] in positions}
+        highest = max(values.values(), default=0) or 1
+
+        parts = []
+        x = GAP
+        height = 0
+        for key in positions:
+            columns, rows = _layouts.grids.get(key, (_layouts.size_of(key), 1))
+            parts.append(f'<text x="{x}" y="{GAP - 6}" font-size="14">{escape(key)}</text>')
+
+            for index in range(_layouts.size_of(key)):
+                value = values[(key, index)]
+                # white (idle) to red (most active)
+                shade = int(255 * (1 - value / highest))
+                cx = x + index % columns * CELL
+                cy = GAP + index // columns * CELL
+                parts.append(f'<rect x="{cx}" y="{cy}" width="{CELL - 2}" height="{CELL - 2}" '
+                             f'fill="rgb(255,{shade},{shade})" stroke="#888"/>')
+                parts.append(f'<text x="{cx + 4}" y="{cy + CELL / 2 + 4}" font-size="11">{value:g}</text>')
+
+            x += columns * CELL + GAP
+            height = max(height, rows * CELL)
+
+        header = (f'<svg xmlns="http://www.w3.org/2000/svg" width="{x}" height="{height + GAP * 2 + 16}" '
+                  f'font-family="sans-serif">')
+        title = f'<text x="{GAP}" y="{height + GAP * 2 + 8}" font-size="14">{escape(_device)} - {_metric}</text>'
+        return "\n".join([header] + parts + [title, "</svg>"]) + "\n"
@@ -1,13 +1,18 @@
 import json
 import socket
+import time
+from collections import deque
 from websocket import create_connection, WebSocket
 import threading
 from enum import Enum
+from log import Flag
+from output_backend import OutputBackend
 
-ws = None
-
-active_keys = set([])
-connected_positions = set([])
+DEFAULT_URL = "ws://localhost:15881/v2/feedbacks?app_id={0}&app_name={1}"
+# requests (registrations and pattern plays) waiting to be sent, oldest are dropped beyond this
+MAX_REQUESTS = 1024
+# seconds between attempts to reconnect to bHaptics Player, last one repeats
+RECONNECT_DELAYS = (1, 2, 4, 8)
 
 class BhapticsPosition(Enum):
     Vest = "Vest"
@@ -24,9 +29,10 @@ class BhapticsPosition(Enum):
     GloveR = "GloveR"
 
 class WebSocketReceiver(WebSocket):
+    # backend whose state is updated by received frames
+    backend = None
+
     def recv_frame(self):
-        global active_keys
-        global connected_positions
         frame = super().recv_frame()
         try:
             frame_obj = json.loads(frame.data)
@@ -34,8 +40,8 @@ class WebSocketReceiver(WebSocket):
 
             # if len(active) > 0:
             #     print (active)
-            active_keys = set(active)
-            connected_positions = set(frame_obj['ConnectedPositions'])
+            self.backend.active_keys = set(active)
+            self.backend.connected_positions = set(frame_obj['ConnectedPositions'])
         except:
             # active_keys = set([])
             # connected_positions = set([])
@@ -45,135 +51,246 @@ class WebSocketReceiver(WebSocket):
         return frame
 
 
-def thread_function(name):
-    while True:
-        if ws is not None:
-            ws.recv_frame()
-
-
-def initialize(appId: str, appName: str):
-    global ws
-    try:
-        ws = create_connection("ws://localhost:15881/v2/feedbacks?app_id={0}&app_name={1}".format(appId,appName),
-                               sockopt=((socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),),
-                               class_=WebSocketReceiver)
-
-        x = threading.Thread(target=thread_function, args=(1,))
+class BhapticsV2Backend(OutputBackend):
+    name = "bhaptics"
+
+    def __init__(self, appId: str, appName: str, url: str = DEFAULT_URL):
+        """
+        Output backend of bHaptics Player websocket API v2.
+
+        frames are queued with one slot per frame key (latest wins) and other requests in FIFO,
+        and are sent by send thread so that event loop never waits for socket.
+        when send fails, queues are cleared and frames are dropped until send thread reconnects.
+        """
+        super().__init__()
+        self.ws = None
+        self.url = None
+        self.connected = False
+        self.closed = False
+
+        # outbound queue: one slot per frame key (latest wins) and FIFO for other requests
+        self._outbox = threading.Condition()
+        self._frames = {}
+        self._requests = deque()
+
+        self.initialize(appId, appName, url)
+
+    def initialize(self, appId: str, appName: str, url: str = DEFAULT_URL):
+        self.url = url.format(appId, appName)
+        if not self.connect():
+            print("Couldn't connect")
+            return
+
+        y = threading.Thread(target=self.send_thread_function, args=(2,), daemon=True)
+        y.start()
+
+    def connect(self) -> bool:
+        """
+        open websocket to bHaptics Player and start its receive thread
+        :return: (Bool) False if player can't be reached
+        """
+        try:
+            ws = create_connection(self.url, sockopt=((socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),),
+                                   class_=WebSocketReceiver)
+        except Exception:
+            return False
+
+        ws.backend = self
+        with self._outbox:
+            if self.closed:
+                ws.close()
+                return False
+            self.ws = ws
+            self.connection_id += 1
+            self.connected = True
+
+        x = threading.Thread(target=self.thread_function, args=(ws,), daemon=True)
         x.start()
-    except:
-        print("Couldn't connect")
-        return
-
-
-def destroy():
-    if ws is not None:
-        ws.close()
-
-
-def is_playing():
-    return len(active_keys) > 0
-
-
-def is_playing_key(key):
-    return key in active_keys
-
-
-# position Vest Head ForeamrL ForearmR HandL HandR FootL FootR
-def is_device_connected(position):
-    return position in connected_positions
-
-
-def register(key, file_directory):
-    json_data = open(file_directory).read()
-
-    print(json_data)
-
-    data = json.loads(json_data)
-    project = data["project"]
-
-    layout = project["layout"]
-    tracks = project["tracks"]
-
-    request = {
-        "Register": [{
-            "Key": key,
-            "Project": {
-                "Tracks": tracks,
-                "Layout": layout
-            }
-        }]
-    }
-
-    json_str = json.dumps(request)
-    __submit(json_str)
-
-
-def submit_registered(key):
-    request = {
-        "Submit": [{
-            "Type": "key",
-            "Key": key,
-        }]
-    }
-
-    json_str = json.dumps(request)
-
-    __submit(json_str)
-
-
-def submit_registered_with_option(
-        key, alt_key,
-        scale_option,
-        rotation_option):
-    # scaleOption: {"intensity": 1, "duration": 1}
-    # rotationOption: {"offsetAngleX": 90, "offsetY": 0}
-    request = {
-        "Submit": [{
-            "Type": "key",
-            "Key": key,
-            "Parameters": {
+        return True
+
+    def thread_function(self, ws):
+        while not self.closed:
+            try:
+                ws.recv_frame()
+            except Exception:
+                break
+
+    def reconnect(self, error: Exception):
+        """
+        drop everything queued for lost connection and connect again until it succeeds or backend is closed.
+        runs on send thread, so nothing is sent meanwhile
+        """
+        with self._outbox:
+            if self.closed:
+                return
+            self.connected = False
+            self.send_stats["dropped"] += len(self._requests)
+            self._frames.clear()
+            self._requests.clear()
+        self.connected_positions = set()
+        self.active_keys = set()
+        print(Flag.Error.value + f"connection to bHaptics Player is lost ({error}), reconnecting")
+
+        # connection is already broken, so closing handshake isn't waited for
+        self.ws.shutdown()
+
+        attempt = 0
+        while True:
+            with self._outbox:
+                if self._outbox.wait_for(lambda: self.closed,
+                                         RECONNECT_DELAYS[min(attempt, len(RECONNECT_DELAYS) - 1)]):
+                    return
+            if self.connect():
+                print(Flag.Info.value + "reconnected to bHaptics Player")
+                return
+            attempt += 1
+
+    def send_thread_function(self, name):
+        send_stats = self.send_stats
+
+        while True:
+            with self._outbox:
+                while not self._frames and not self._requests and not self.closed:
+                    self._outbox.wait()
+                if self.closed:
+                    return
+
+                if self._requests:
+                    key = None
+                    json_str, deadline = self._requests.popleft()
+                else:
+                    key = next(iter(self._frames))
+                    json_str, deadline = self._frames.pop(key)
+
+            # frame that would end before it arrives is not worth sending late
+            if deadline is not None and time.monotonic() > deadline:
+                send_stats["stale"] += 1
+                continue
+
+            span = self.tracer.start()
+            start = time.perf_counter()
+            try:
+                self.ws.send(json_str)
+            except Exception as e:
+                self.reconnect(e)
+                continue
+            blocked = time.perf_counter() - start
+            if span:
+                self.tracer.end("ws.send", span, {"key": key, "bytes": len(json_str)})
+
+            send_stats["sent"] += 1
+            send_stats["blocked_seconds"] += blocked
+            if key is not None:
+                stats = self.position_stats[key]
+                stats["sent"] += 1
+                stats["bytes"] += len(json_str)
+            if blocked > send_stats["max_blocked_seconds"]:
+                send_stats["max_blocked_seconds"] = blocked
+
+    def close(self):
+        with self._outbox:
+            self.closed = True
+            self._outbox.notify_all()
+        if self.ws is not None:
+            self.ws.close()
+
+    def is_playing_key(self, key):
+        return key in self.active_keys
+
+    def get_send_stats(self):
+        stats = dict(self.send_stats)
+        with self._outbox:
+            stats["queue_depth"] = len(self._frames) + len(self._requests)
+        return stats
+
+    # position Vest Head ForeamrL ForearmR HandL HandR FootL FootR
+    def is_device_connected(self, position):
+        return position in self.connected_positions
+
+    def register(self, key, file_directory):
+        with open(file_directory) as f:
+            data = json.load(f)
+
+        self.register_project(key, data["project"])
+
+    def register_project(self, key, project):
+        layout = project["layout"]
+        tracks = project["tracks"]
+
+        request = {
+            "Register": [{
+                "Key": key,
+                "Project": {
+                    "Tracks": tracks,
+                    "Layout": layout
+                }
+            }]
+        }
+
+        json_str = json.dumps(request)
+        self.__submit(json_str)
+
+    def submit_registered(self, key, alt_key=None, scale_option=None, rotation_option=None):
+        # scaleOption: {"intensity": 1, "duration": 1}
+        # rotationOption: {"offsetAngleX": 90, "offsetY": 0}
+        request = {
+            "Submit": [{
+                "Type": "key",
+                "Key": key,
+            }]
+        }
+        if alt_key is not None or scale_option is not None or rotation_option is not None:
+            request["Submit"][0]["Parameters"] = {
                 "altKey": alt_key,
                 "rotationOption": rotation_option,
                 "scaleOption": scale_option,
             }
-        }]
-    }
-
-    json_str = json.dumps(request)
-
-    __submit(json_str)
-
-
-def submit(key, frame):
-    request = {
-        "Submit": [{
-            "Type": "frame",
-            "Key": key,
-            "Frame": frame
-        }]
-    }
-
-    json_str = json.dumps(request)
-
-    __submit(json_str)
-
-
-def submit_dot(key, position, dot_points, duration_millis):
-    front_frame = {
-        "position": position,
-        "dotPoints": dot_points,
-        "durationMillis": duration_millis
-    }
-    submit(key, front_frame)
-
-def submit_path(key, position, path_points, duration_millis):
-    front_frame = {
-        "position": position,
-        "pathPoints": path_points,
-        "durationMillis": duration_millis
-    }
-    submit(key, front_frame)
 
-def __submit(json_str):
-    if ws is not None:
-        ws.send(json_str)
+        json_str = json.dumps(request)
+
+        self.__submit(json_str)
+
+    def submit(self, key, frame):
+        span = self.tracer.start()
+        request = {
+            "Submit": [{
+                "Type": "frame",
+                "Key": key,
+                "Frame": frame
+            }]
+        }
+
+        json_str = json.dumps(request)
+        if span:
+            self.tracer.end("json.encode", span, {"key": key})
+
+        self.__submit_frame(key, json_str, frame.get("durationMillis"))
+
+    def __submit(self, json_str):
+        with self._outbox:
+            if not self.connected:
+                self.send_stats["dropped"] += 1
+                return
+            if len(self._requests) >= MAX_REQUESTS:
+                self._requests.popleft()
+                self.send_stats["dropped"] += 1
+            self._requests.append((json_str, None))
+            self._outbox.notify()
+
+    def __submit_frame(self, key, json_str, duration_millis):
+        # a frame still waiting in the queue is superseded by the newer one of same key
+        if self.connected:
+            deadline = None
+            if duration_millis:
+                deadline = time.monotonic() + duration_millis / 1000
+
+            with self._outbox:
+                stats = self.position_stats.get(key)
+                if stats is None:
+                    stats = self.position_stats[key] = {"submitted": 0, "sent": 0, "bytes": 0}
+                stats["submitted"] += 1
+
+                if key in self._frames:
+                    self.send_stats["superseded"] += 1
+                self._frames[key] = (json_str, deadline)
+                self._outbox.notify()
@@ -0,0 +1,492 @@
+import os
+import json
+import errno
+import math
+import time
+import asyncio
+
+from log import Flag
+from bhaptics.better_haptic_player import BhapticsPosition, DEFAULT_URL
+from intensity_curve import DEFAULT_CURVE
+from profiler import PROFILE_MODES
+from output_backend import BACKENDS, DEFAULT_FRAME_FILE
+from discovery_cache import DEFAULT_CACHE_FILE
+
+CONFIG_FILE = "./config.json"
+POLL_INTERVAL = 1.0
+
+INPUT_MODES = ("udp", "websocket")
+OUTPUT_MODES = ("dot", "path")
+LOG_LEVELS = ("debug", "info", "warn")
+DEBUG_ROUTE_MODES = ("off", "local", "all")
+
+
+def is_number(*_values) -> bool:
+    """
+    check that every value is int or float (bool isn't number here) and finite
+    :param _values: values to check
+    :return: (Bool) result
+    """
+    return all(type(value) in (int, float) and math.isfinite(value) for value in _values)
+
+
+class Config:
+    CONFIG_VERSION = 3
+
+    def __init__(self, _file: str = CONFIG_FILE, _create: bool = True):
+        """
+        Create config with default value and load config file.
+        :param _file: [optional] (String) config file path
+        :param _create: [optional] (Bool) create config file if it doesn't exist or is broken
+        """
+        self.file = _file
+        # mtime of config file when it was loaded (ns)
+        self.mtime = None
+
+        # <NETWORK>
+        self.ip_addr: str = "127.0.0.1"
+        self.service_name: str = "bHapticsOSCQ"  # OSCQuery service and bHaptics app name, unique per session
+        self.vrchat_client: str = "VRChat-Client"  # OSCQuery service name of VRChat client that session serves
+        self.player_url: str = DEFAULT_URL  # bHaptics Player websocket, formatted with app id and app name
+        self.discovery_cache: str = DEFAULT_CACHE_FILE  # last found VRChat endpoint and own ports, empty to disable
+        self.debug_routes: str = "local"  # who is served /profile, /trace, /stats and /live: "off", "local" or "all"
+        # </NETWORK>
+
+        # <INPUT>
+        self.input_mode: str = "udp"  # "udp" or "websocket"
+        self.honor_timetag: bool = False
+        self.record_file: str = ""  # strftime path of OSC session log, {name} is NETWORK.name. empty to disable
+        # </INPUT>
+
+        # <TICK>
+        self.tick_rate: float = 10  # refresh of every position per second
+        self.frame_duration: int = 100  # durationMillis of frame
+        # </TICK>
+
+        # <ENVELOPE>
+        self.attack_ms: float = 0
+        self.hold_ms: float = 0
+        self.decay_ms: float = 0
+        self.timeout_ms: float = 0  # contact drops after this time without update, 0 to keep it until next update
+        # </ENVELOPE>
+
+        # <CURVES>
+        # position name (or "default") -> {gain, gamma, floor, ceiling, deadzone, resolution, hysteresis}
+        self.curves: dict = {"default": dict(DEFAULT_CURVE)}
+        # </CURVES>
+
+        # <OUTPUT>
+        self.output_mode: str = "dot"  # "dot" or "path"
+        self.path_max_density: float = 0.3
+        self.path_max_points: int = 3
+        self.output_backends: list = ["bhaptics"]  # "bhaptics", "null" or "file", more than one to send to every one
+        self.frame_file: str = DEFAULT_FRAME_FILE  # strftime path of "file" backend log, {name} is NETWORK.name
+        # </OUTPUT>
+
+        # <DEVICES>
+        self.enabled_devices: list = [pos.value for pos in BhapticsPosition]
+        # </DEVICES>
+
+        # <LOGGING>
+        self.log_level: str = "info"  # "debug", "info" or "warn"
+        # </LOGGING>
+
+        # <STATUS>
+        self.status_enabled: bool = True
+        self.status_port: int = 9000  # used when VRChat HOST_INFO has no OSC_PORT
+        self.status_rate: float = 2.0  # publish per second
+        # </STATUS>
+
+        # <PROFILING>
+        self.profile_mode: str = "sample"  # "sample" or "cprofile"
+        self.profile_seconds: float = 10
+        self.profile_interval_ms: float = 5
+        self.profile_dir: str = "./profiles"
+        # </PROFILING>
+
+        # <TRACE>
+        self.trace_enabled: bool = False
+        self.trace_capacity: int = 65536  # number of spans kept
+        # </TRACE>
+
+        # <SHARED_STATE>
+        self.shared_enabled: bool = False
+        self.shared_name: str = "{name}_state"  # name of shared memory block, {name} is NETWORK.name
+        # </SHARED_STATE>
+
+        if _create and self.load(_file) == errno.ENOENT:
+            print(Flag.Info.value + "there's no config file. now create new one.")
+            self.save(_file)
+
+    @classmethod
+    def read(cls, _file: str = CONFIG_FILE):
+        """
+        read and validate config file without creating or fixing it
+        :param _file: [optional] (String) config file path
+        :return: (Config) new config
+        :raise: IOError, KeyError, TypeError, ValueError if config file can't be used
+        """
+        new = cls(_file, _create=False)
+        mtime = os.stat(_file).st_mtime_ns
+
+        with open(_file, 'r', encoding='utf-8') as f:
+            raw = json.load(f)
+
+        new.fromdict(raw)
+        new.validate()
+        new.mtime = mtime
+
+        return new
+
+    def load(self, _file: str = CONFIG_FILE) -> int:
+        """
+        load config file
+        :param _file: [optional] (String) file path that have setting value (json format)
+        :return: (Int) errno more information see this page https://docs.python.org/3/library/errno.html
+        """
+        try:
+            self.mtime = os.stat(_file).st_mtime_ns
+            with open(_file, 'r', encoding='utf-8') as f:
+                raw = json.load(f)
+
+                self.fromdict(raw)
+                self.validate()
+
+                if self.CONFIG_VERSION != raw["CONFIG_VERSION"]:
+                    print(Flag.Info.value + "Config file version is not match. Now create new one. \033")
+                    self.save(_file)
+
+                return 0
+        except IOError as e:
+            return e.errno
+        except (KeyError, TypeError, ValueError) as e:
+            # keep user's file, so settings that were valid can be copied back
+            backup = _file + time.strftime(".%Y%m%d-%H%M%S.bak")
+            os.replace(_file, backup)
+            print(Flag.Warn.value + f"Config file is not correct format ({e}). It is moved to {backup}. Now create new one. \033")
+            ip_addr = self.ip_addr
+            self.__init__(_file, _create=False)
+            self.ip_addr = ip_addr
+            self.save(_file)
+        except Exception as e:
+            raise e
+
+    def fromdict(self, raw: dict) -> None:
+        """
+        set class variables from dictionary. missing sections keep default value
+        :param raw: (Dictionary) parsed config file
+        :return: None
+        """
+        self.ip_addr = raw["NETWORK"]["ip"]
+        self.service_name = raw["NETWORK"].get("name", self.service_name)
+        self.vrchat_client = raw["NETWORK"].get("vrchat_client", self.vrchat_client)
+        self.player_url = raw["NETWORK"].get("player_url", self.player_url)
+        self.discovery_cache = raw["NETWORK"].get("discovery_cache", self.discovery_cache)
+        self.debug_routes = raw["NETWORK"].get("debug_routes", self.debug_routes)
+
+        d_input = raw.get("INPUT", {})
+        self.input_mode = d_input.get("mode", self.input_mode)
+        self.honor_timetag = d_input.get("honor_timetag", self.honor_timetag)
+        self.record_file = d_input.get("record_file", self.record_file)
+
+        d_tick = raw.get("TICK", {})
+        self.tick_rate = d_tick.get("rate", self.tick_rate)
+        self.frame_duration = d_tick.get("frame_duration", self.frame_duration)
+
+        d_envelope = raw.get("ENVELOPE", {})
+        self.attack_ms = d_envelope.get("attack_ms", self.attack_ms)
+        self.hold_ms = d_envelope.get("hold_ms", self.hold_ms)
+        self.decay_ms = d_envelope.get("decay_ms", self.decay_ms)
+        self.timeout_ms = d_envelope.get("timeout_ms", self.timeout_ms)
+
+        self.curves = raw.get("CURVES", self.curves)
+
+        d_output = raw.get("OUTPUT", {})
+        self.output_mode = d_output.get("mode", self.output_mode)
+        self.path_max_density = d_output.get("path_max_density", self.path_max_density)
+        self.path_max_points = d_output.get("path_max_points", self.path_max_points)
+        self.output_backends = d_output.get("backends", self.output_backends)
+        self.frame_file = d_output.get("frame_file", self.frame_file)
+
+        self.enabled_devices = raw.get("DEVICES", {}).get("enabled", self.enabled_devices)
+        self.log_level = raw.get("LOGGING", {}).get("level", self.log_level)
+
+        d_status = raw.get("STATUS", {})
+        self.status_enabled = d_status.get("enabled", self.status_enabled)
+        self.status_port = d_status.get("port", self.status_port)
+        self.status_rate = d_status.get("rate", self.status_rate)
+
+        d_profiling = raw.get("PROFILING", {})
+        self.profile_mode = d_profiling.get("mode", self.profile_mode)
+        self.profile_seconds = d_profiling.get("seconds", self.profile_seconds)
+        self.profile_interval_ms = d_profiling.get("interval_ms", self.profile_interval_ms)
+        self.profile_dir = d_profiling.get("directory", self.profile_dir)
+
+        d_trace = raw.get("TRACE", {})
+        self.trace_enabled = d_trace.get("enabled", self.trace_enabled)
+        self.trace_capacity = d_trace.get("capacity", self.trace_capacity)
+
+        d_shared = raw.get("SHARED_STATE", {})
+        self.shared_enabled = d_shared.get("enabled", self.shared_enabled)
+        self.shared_name = d_shared.get("name", self.shared_name)
+
+    def expand(self, _template: str) -> str:
+        """
+        fill {name} of per session file path or name with NETWORK.name
+        :param _template: (String) path or name
+        :return: (String) path or name of this session
+        """
+        return _template.replace("{name}", self.service_name)
+
+    def validate(self) -> None:
+        """
+        check every value is usable
+        :return: None
+        :raise: ValueError with the reason
+        """
+        positions = [pos.value for pos in BhapticsPosition]
+
+        if not all(isinstance(value, str) and value for value in (self.service_name, self.vrchat_client, self.player_url)):
+            raise ValueError("NETWORK.name, NETWORK.vrchat_client and NETWORK.player_url must be non-empty string")
+        if not isinstance(self.ip_addr, str) or not isinstance(self.discovery_cache, str):
+            raise ValueError("NETWORK.ip and NETWORK.discovery_cache must be string")
+        if self.debug_routes not in DEBUG_ROUTE_MODES:
+            raise ValueError(f"NETWORK.debug_routes must be one of {DEBUG_ROUTE_MODES}")
+        if self.input_mode not in INPUT_MODES:
+            raise ValueError(f"INPUT.mode must be one of {INPUT_MODES}")
+        if not isinstance(self.record_file, str):
+            raise ValueError("INPUT.record_file must be string")
+        if not all(type(value) is bool for value in (self.honor_timetag, self.status_enabled, self.trace_enabled,
+                                                      self.shared_enabled)):
+            raise ValueError("INPUT.honor_timetag, STATUS.enabled, TRACE.enabled and SHARED_STATE.enabled must be boolean")
+        if self.output_mode not in OUTPUT_MODES:
+            raise ValueError(f"OUTPUT.mode must be one of {OUTPUT_MODES}")
+        if self.log_level not in LOG_LEVELS:
+            raise ValueError(f"LOGGING.level must be one of {LOG_LEVELS}")
+        if not is_number(self.tick_rate, self.frame_duration) or not self.tick_rate > 0 or not self.frame_duration > 0:
+            raise ValueError("TICK.rate and TICK.frame_duration must be positive number")
+        if type(self.status_port) is not int or not 0 < self.status_port < 65536:
+            raise ValueError("STATUS.port must be port number")
+        if not is_number(self.status_rate) or not self.status_rate > 0:
+            raise ValueError("STATUS.rate must be positive number")
+        if self.profile_mode not in PROFILE_MODES:
+            raise ValueError(f"PROFILING.mode must be one of {PROFILE_MODES}")
+        if not is_number(self.profile_seconds, self.profile_interval_ms) or not self.profile_seconds > 0 \
+                or not self.profile_interval_ms > 0:
+            raise ValueError("PROFILING.seconds and PROFILING.interval_ms must be positive number")
+        if not isinstance(self.profile_dir, str) or not self.profile_dir:
+            raise ValueError("PROFILING.directory must be non-empty string")
+        if type(self.trace_capacity) is not int or self.trace_capacity < 1:
+            raise ValueError("TRACE.capacity must be positive integer")
+        if not isinstance(self.shared_name, str) or not self.shared_name:
+            raise ValueError("SHARED_STATE.name must be non-empty string")
+        if not is_number(self.attack_ms, self.hold_ms, self.decay_ms, self.timeout_ms) \
+                or min(self.attack_ms, self.hold_ms, self.decay_ms, self.timeout_ms) < 0:
+            raise ValueError("ENVELOPE times must be number that is not negative")
+        if not is_number(self.path_max_density) or not 0 <= self.path_max_density <= 1 \
+                or type(self.path_max_points) is not int or self.path_max_points < 1:
+            raise ValueError("OUTPUT.path_max_density must be 0 ~ 1 and OUTPUT.path_max_points positive integer")
+        if not isinstance(self.output_backends, list) or not self.output_backends \
+                or any(name not in BACKENDS for name in self.output_backends):
+            raise ValueError(f"OUTPUT.backends must be non-empty list of {BACKENDS}")
+        if not isinstance(self.frame_file, str) or not self.frame_file:
+            raise ValueError("OUTPUT.frame_file must be non-empty string")
+
+        if not isinstance(self.enabled_devices, list):
+            raise ValueError("DEVICES.enabled must be list")
+        for device in self.enabled_devices:
+            if device not in positions:
+                raise ValueError(f"DEVICES.enabled has unknown device {device}")
+
+        if not isinstance(self.curves, dict):
+            raise ValueError("CURVES must be object")
+        for key, params in self.curves.items():
+            if key != "default" and key not in positions:
+                raise ValueError(f"CURVES has unknown device {key}")
+            if not isinstance(params, dict):
+                raise ValueError(f"CURVES.{key} must be object")
+
+            curve = dict(DEFAULT_CURVE, **params)
+            if len(curve) != len(DEFAULT_CURVE):
+                raise ValueError(f"CURVES.{key} has unknown parameter")
+            if not is_number(*curve.values()):
+                raise ValueError(f"CURVES.{key} must have number parameters")
+            if not curve["gain"] >= 0 or not curve["gamma"] > 0 or not curve["hysteresis"] >= 0:
+                raise ValueError(f"CURVES.{key} must have gain and hysteresis that are not negative and positive gamma")
+            if not 0 <= curve["deadzone"] < 1 or type(curve["resolution"]) is not int or curve["resolution"] < 1:
+                raise ValueError(f"CURVES.{key} must have deadzone 0 ~ 1 and positive integer resolution")
+            if not 0 <= curve["floor"] <= curve["ceiling"] <= 100:
+                raise ValueError(f"CURVES.{key} must have 0 <= floor <= ceiling <= 100")
+
+    def save(self, _file: str = CONFIG_FILE) -> int:
+        """
+        create or update config file
+        :param _file: [optional] (String) file path that config file saved
+        :return: (Int) errno, You can get more information from this page https://docs.python.org/3/library/errno.html
+        """
+
+        try:
+            with open(_file, "w", encoding='utf-8') as f:
+                f.write(self.tojson())
+                print(Flag.Info.value + '**CONFIG DATA SAVE COMPLETE**')
+            self.mtime = os.stat(_file).st_mtime_ns
+            return 0
+        except IOError as e:
+            return e.errno
+        except Exception as e:
+            print(e)
+            raise e
+
+    def tojson(self) -> str:
+        """
+        convert config class to json
+        :return: (String) convert class variable to json format string
+        """
+
+        d_net = {
+            "ip": self.ip_addr,
+            "name": self.service_name,
+            "vrchat_client": self.vrchat_client,
+            "player_url": self.player_url,
+            "discovery_cache": self.discovery_cache,
+            "debug_routes": self.debug_routes,
+        }
+
+        d_input = {
+            "mode": self.input_mode,
+            "honor_timetag": self.honor_timetag,
+            "record_file": self.record_file,
+        }
+
+        d_tick = {
+            "rate": self.tick_rate,
+            "frame_duration": self.frame_duration,
+        }
+
+        d_envelope = {
+            "attack_ms": self.attack_ms,
+            "hold_ms": self.hold_ms,
+            "decay_ms": self.decay_ms,
+            "timeout_ms": self.timeout_ms,
+        }
+
+        d_output = {
+            "mode": self.output_mode,
+            "path_max_density": self.path_max_density,
+            "path_max_points": self.path_max_points,
+            "backends": self.output_backends,
+            "frame_file": self.frame_file,
+        }
+
+        d_devices = {
+            "enabled": self.enabled_devices,
+        }
+
+        d_logging = {
+            "level": self.log_level,
+        }
+
+        d_status = {
+            "enabled": self.status_enabled,
+            "port": self.status_port,
+            "rate": self.status_rate,
+        }
+
+        d_profiling = {
+            "mode": self.profile_mode,
+            "seconds": self.profile_seconds,
+            "interval_ms": self.profile_interval_ms,
+            "directory": self.profile_dir,
+        }
+
+        d_trace = {
+            "enabled": self.trace_enabled,
+            "capacity": self.trace_capacity,
+        }
+
+        d_shared = {
+            "enabled": self.shared_enabled,
+            "name": self.shared_name,
+        }
+
+        result = {
+            "CONFIG_VERSION": self.CONFIG_VERSION,
+            "NETWORK": d_net,
+            "INPUT": d_input,
+            "TICK": d_tick,
+            "ENVELOPE": d_envelope,
+            "CURVES": self.curves,
+            "OUTPUT": d_output,
+            "DEVICES": d_devices,
+            "LOGGING": d_logging,
+            "STATUS": d_status,
+            "PROFILING": d_profiling,
+            "TRACE": d_trace,
+            "SHARED_STATE": d_shared,
+        }
+
+        return json.dumps(result, sort_keys=False, indent=4)
+
+    def todict(self):
+        s_json: str = self.tojson()
+        return json.loads(s_json)
+
+
+class ConfigWatcher:
+    def __init__(self, _config: Config, _interval: float = POLL_INTERVAL):
+        """
+        Watch config file and swap in new config when it changes.
+
+        file is polled by mtime, new file is read and validated in executor thread and
+        listeners are called with (new config, old config) on event loop.
+        :param _config: (Config) current config
+        :param _interval: [optional] (Float) polling interval in seconds
+        """
+        self.config = _config
+        self.interval = _interval
+        self.listeners = []
+
+    def add_listener(self, _callback) -> None:
+        """
+        Register callback that is called with (new config, old config) after swap.
+
+        :param _callback: callable
+        :return: None
+        """
+        self.listeners.append(_callback)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            await asyncio.sleep(self.interval)
+
+            try:
+                mtime = os.stat(self.config.file).st_mtime_ns
+            except OSError:
+                continue
+
+            if mtime == self.config.mtime:
+                continue
+
+            try:
+                new = await loop.run_in_executor(None, Config.read, self.config.file)
+            except (IOError, KeyError, TypeError, ValueError) as e:
+                # keep current config until file is fixed
+                print(Flag.Warn.value + f"Config file is not applied: {e}")
+                self.config.mtime = mtime
+                continue
+
+            old = self.config
+            self.config = new
+            try:
+                for callback in self.listeners:
+                    callback(new, old)
+            except Exception as e:
+                # listeners leave their part as it was when they raise, so old config stays in use
+                print(Flag.Warn.value + f"Config file is not applied: {e}")
+                old.mtime = mtime
+                self.config = old
+                continue
+
+            print(Flag.Info.value + "Config file has been reloaded")
@@ -0,0 +1,147 @@
+import os
+import sys
+import json
+
+from bhaptics.better_haptic_player import BhapticsPosition
+from log import Flag
+
+# layout files are bundled next to executable by PyInstaller
+LAYOUT_DIR = os.path.join(getattr(sys, "_MEIPASS", os.path.dirname(os.path.abspath(__file__))), "layouts")
+
+AVATAR_PARAMETER_PATH = "/avatar/parameters/"
+
+
+def grid_coordinates(_columns: int, _rows: int) -> list:
+    """
+    get (x, y) of every motor of grid, normalized to 0.0 ~ 1.0
+    :param _columns: (Int) number of columns
+    :param _rows: (Int) number of rows
+    :return: (List) coordinates by motor index
+    """
+    return [
+        (col / (_columns - 1) if _columns > 1 else 0.5, row / (_rows - 1) if _rows > 1 else 0.5)
+        for row in range(_rows) for col in range(_columns)
+    ]
+
+
+class DeviceLayouts:
+    def __init__(self, _directory: str = LAYOUT_DIR):
+        """
+        Device layouts read from layout files and compiled into lookup tables.
+
+        each layout file describes one device: motor count, grid shape and coordinates of its positions,
+        and how avatar parameters of every schema map to motor index.
+        :param _directory: [optional] (String) directory of layout files
+        """
+        self.directory = _directory
+
+        # position name -> number of motors
+        self.sizes = {}
+        # position name -> device name
+        self.families = {}
+        # position name -> (columns, rows) of motor grid. motor index is row * columns + column
+        self.grids = {}
+        # position name -> (x, y) by motor index
+        self.coordinates = {}
+        # parameter prefix -> (position, number of motors, first index of parameter name)
+        self.parameters = {}
+        # full address -> (position, motor index, binary, device name)
+        self.routes = {}
+
+        self.load()
+
+    def load(self) -> None:
+        """
+        read every layout file of directory and compile it
+        :return: None
+        :raise: ValueError if layout file is broken
+        """
+        self.sizes.clear()
+        self.families.clear()
+        self.grids.clear()
+        self.coordinates.clear()
+        self.parameters.clear()
+        self.routes.clear()
+
+        for file in sorted(os.listdir(self.directory)):
+            if not file.endswith(".json"):
+                continue
+
+            with open(os.path.join(self.directory, file), 'r', encoding='utf-8') as f:
+                try:
+                    self.compile(json.load(f))
+                except (KeyError, TypeError, ValueError) as e:
+                    raise ValueError(f"layout {file} is not correct format ({e})") from e
+
+        print(Flag.Info.value + f"{len(self.sizes)} positions, {len(self.routes)} parameters are loaded from layouts")
+
+    def compile(self, _layout: dict) -> None:
+        """
+        add one device layout to lookup tables
+        :param _layout: (Dictionary) parsed layout file
+        :return: None
+        """
+        for key, position in _layout["positions"].items():
+            BhapticsPosition(key)
+            size = position["motors"]
+
+            grid = position.get("grid")
+            if grid is not None:
+                columns, rows = grid
+                if columns * rows != size:
+                    raise ValueError(f"grid of {key} doesn't match number of motors")
+                self.grids[key] = (columns, rows)
+
+            coordinates = position.get("coordinates")
+            if coordinates is None and grid is not None:
+                coordinates = grid_coordinates(*grid)
+            if coordinates is not None:
+                if len(coordinates) != size:
+                    raise ValueError(f"coordinates of {key} don't match number of motors")
+                self.coordinates[key] = [tuple(c) for c in coordinates]
+
+            self.sizes[key] = size
+            self.families[key] = _layout["device"]
+
+        for schema in _layout.get("schemas", {}).values():
+            for key, mapping in schema.items():
+                position = BhapticsPosition(key)
+                size = self.sizes[key]
+                prefix = mapping["prefix"]
+                first = mapping.get("first", 1)
+                binary = mapping.get("binary", False)
+                # motor index by parameter number - first
+                motors = mapping.get("motors", list(range(size)))
+
+                if sorted(motors) != list(range(size)):
+                    raise ValueError(f"motors of {prefix} must use every motor of {key} once")
+
+                self.parameters[prefix] = (position, size, first)
+                for i, motor in enumerate(motors):
+                    address = AVATAR_PARAMETER_PATH + prefix + str(first + i)
+                    self.routes[address] = (position, motor, binary, self.families[key])
+
+    def size_of(self, _position: str) -> int:
+        """
+        get number of motors of position
+        :param _position: (String) position name
+        :return: (Int) number of motors, 0 if position has no layout
+        """
+        return self.sizes.get(_position, 0)
+
+    def family_of(self, _address: str) -> str:
+        """
+        get device name of avatar parameter by its prefix, even if its index is out of layout
+        :param _address: (String) full address
+        :return: (String) device name, "unknown" if no layout has its prefix
+        """
+        prefix = _address[len(AVATAR_PARAMETER_PATH):].rsplit("_", 1)[0] + "_"
+        parameter = self.parameters.get(prefix)
+        return self.families[parameter[0].value] if parameter is not None else "unknown"
+
+    def parameter_names(self) -> list:
+        """
+        list every avatar parameter name that layouts define
+        :return: (List) parameter names without path
+        """
+        return [address[len(AVATAR_PARAMETER_PATH):] for address in self.routes]
@@ -0,0 +1,117 @@
+import json
+import os
+import socket
+import time
+
+import requests
+from zeroconf import ServiceInfo
+
+from log import Flag
+from tinyoscquery.query import OSCQueryClient, OSCQUERY_SERVICE_TYPE
+
+DEFAULT_CACHE_FILE = "cache/discovery-{name}.json"  # formatted with service name
+FORMAT_VERSION = 1
+# HOST_INFO of cached endpoint must answer within this time, otherwise zeroconf discovery is used
+VALIDATE_TIMEOUT = 0.3
+
+
+class DiscoveryCache:
+    def __init__(self, _file: str):
+        """
+        Last known VRChat OSCQuery endpoint, own ports and host info of session, kept across restarts.
+
+        every field is None until loaded or saved.
+        :param _file: (String) cache file path
+        """
+        self.file = _file
+
+        self.osc_port = None
+        self.http_port = None
+        # {"name", "ip", "port"} of VRChat OSCQuery service
+        self.vrchat = None
+        # HOST_INFO of VRChat OSCQuery service
+        self.host_info = None
+
+    def load(self) -> bool:
+        """
+        read cache file
+        :return: (Bool) False if file doesn't exist or can't be used
+        """
+        try:
+            with open(self.file, 'r', encoding='utf-8') as f:
+                raw = json.load(f)
+
+            if raw["version"] != FORMAT_VERSION:
+                return False
+            self.osc_port = raw["osc_port"]
+            self.http_port = raw["http_port"]
+            self.vrchat = raw["vrchat"]
+            self.host_info = raw["host_info"]
+        except (IOError, KeyError, TypeError, ValueError):
+            return False
+
+        return True
+
+    def save(self) -> None:
+        """
+        write cache file. file is replaced at once, so it's never left half written
+        :return: None
+        """
+        raw = {
+            "version": FORMAT_VERSION,
+            "saved": time.time(),
+            "osc_port": self.osc_port,
+            "http_port": self.http_port,
+            "vrchat": self.vrchat,
+            "host_info": self.host_info,
+        }
+
+        try:
+            if os.path.dirname(self.file):
+                os.makedirs(os.path.dirname(self.file), exist_ok=True)
+            temp = self.file + ".tmp"
+            with open(temp, 'w', encoding='utf-8') as f:
+                json.dump(raw, f, indent=4)
+            os.replace(temp, self.file)
+        except OSError as e:
+            print(Flag.Warn.value + f"Couldn't save discovery cache: {e}")
+
+    def remember(self, _client: OSCQueryClient, _host_info: dict, _osc_port: int, _http_port: int) -> None:
+        """
+        keep endpoint and ports that session uses now
+        :param _client: (OSCQueryClient) client of VRChat's OSCQuery service
+        :param _host_info: (Dictionary) HOST_INFO of VRChat, None if unknown
+        :param _osc_port: (Int) own OSC port
+        :param _http_port: (Int) own oscjson port
+        :return: None
+        """
+        self.vrchat = {"name": _client.service_info.name, "ip": _client._get_ip_str(), "port": _client.service_info.port}
+        self.host_info = _host_info
+        self.osc_port = _osc_port
+        self.http_port = _http_port
+
+    def validate(self, _session: requests.Session, _client_name: str, _timeout: float = VALIDATE_TIMEOUT):
+        """
+        check that cached VRChat endpoint still answers as same client
+        :param _session: (requests.Session) http session
+        :param _client_name: (String) part of service name of VRChat client to serve
+        :param _timeout: [optional] (Float) seconds to wait for HOST_INFO
+        :return: (Tuple) (OSCQueryClient, HOST_INFO), None if endpoint isn't usable
+        """
+        if not self.vrchat or _client_name not in self.vrchat["name"]:
+            return None
+
+        try:
+            response = _session.get(f"http://{self.vrchat['ip']}:{self.vrchat['port']}/HOST_INFO", timeout=_timeout)
+            host_info = response.json() if response.status_code == 200 else None
+        except (requests.exceptions.RequestException, ValueError):
+            return None
+
+        # VRChat reuses ports, so name tells whether it's the same client
+        if not isinstance(host_info, dict) or host_info.get("NAME") != (self.host_info or {}).get("NAME"):
+            return None
+
+        info = ServiceInfo(OSCQUERY_SERVICE_TYPE, self.vrchat["name"], port=self.vrchat["port"],
+                           addresses=[socket.inet_aton(self.vrchat["ip"])])
+        return OSCQueryClient(info), host_info
+
@@ -0,0 +1,133 @@
+class EnvelopeEngine:
+    # step used instead of infinity when a stage is disabled (0 ms)
+    INSTANT = 1e9
+
+    def __init__(self, _sizes: dict, _attack_ms: float = 0, _hold_ms: float = 0, _decay_ms: float = 0,
+                 _timeout_ms: float = 0):
+        """
+        Attack / hold / decay envelope of every actuator, with timeout to zero.
+
+        state of all positions is kept in flat lists and evaluated together once per tick.
+        :param _sizes: (Dictionary) position name -> number of actuators
+        :param _attack_ms: [optional] (Float) time to rise from zero to target, 0 is immediate
+        :param _hold_ms: [optional] (Float) time to keep level after target drops
+        :param _decay_ms: [optional] (Float) time to fall from released level to zero, 0 is immediate
+        :param _timeout_ms: [optional] (Float) target drops to zero when not updated for this time, 0 is never
+        """
+        # position name -> (start, end) in flat lists
+        self.offsets = {}
+        total = 0
+        for key, size in _sizes.items():
+            self.offsets[key] = (total, total + size)
+            total += size
+
+        self.target = [0] * total
+        self.level = [0] * total
+        # time of last update / release, level at release
+        self.updated = [0.0] * total
+        self.released = [0.0] * total
+        self.peak = [0] * total
+
+        self.attack = 0.0
+        self.hold = 0.0
+        self.decay = 0.0
+        self.timeout = 0.0
+        self.configure(_attack_ms, _hold_ms, _decay_ms, _timeout_ms)
+
+    def configure(self, _attack_ms: float, _hold_ms: float, _decay_ms: float, _timeout_ms: float) -> None:
+        """
+        change envelope times
+        :return: None
+        """
+        self.attack = _attack_ms / 1000
+        self.hold = _hold_ms / 1000
+        self.decay = _decay_ms / 1000
+        self.timeout = _timeout_ms / 1000
+
+    def set(self, _position: str, _index: int, _value, _now: float) -> None:
+        """
+        set target of actuator
+        :param _position: (String) position name
+        :param _index: (Int) actuator index
+        :param _value: target intensity
+        :param _now: (Float) monotonic time
+        :return: None
+        """
+        i = self.offsets[_position][0] + _index
+
+        if _value < self.target[i]:
+            self.released[i] = _now
+            self.peak[i] = self.level[i]
+
+        self.target[i] = _value
+        self.updated[i] = _now
+
+    def target_of(self, _position: str, _index: int):
+        """
+        get target of actuator
+        :param _position: (String) position name
+        :param _index: (Int) actuator index
+        :return: target intensity
+        """
+        return self.target[self.offsets[_position][0] + _index]
+
+    def touch(self, _position: str, _index: int, _now: float) -> None:
+        """
+        refresh update time of actuator without changing its target
+        :param _position: (String) position name
+        :param _index: (Int) actuator index
+        :param _now: (Float) monotonic time
+        :return: None
+        """
+        self.updated[self.offsets[_position][0] + _index] = _now
+
+    def reset(self) -> None:
+        """
+        drop every target and level to zero immediately
+        :return: None
+        """
+        total = len(self.target)
+        self.target = [0] * total
+        self.level = [0] * total
+        self.peak = [0] * total
+
+    def levels(self, _position: str) -> list:
+        """
+        get current levels of position
+        :param _position: (String) position name
+        :return: (List) levels
+        """
+        start, end = self.offsets[_position]
+        return self.level[start:end]
+
+    def tick(self, _now: float, _dt: float) -> tuple:
+        """
+        advance every envelope by dt
+        :param _now: (Float) monotonic time
+        :param _dt: (Float) seconds since last tick
+        :return: (Tuple) (list of positions whose level changed, whether any envelope is still moving)
+        """
+        target = self.target
+        old = self.level
+
+        if self.timeout:
+            expire = _now - self.timeout
+            for i in [i for i, (t, u) in enumerate(zip(target, self.updated)) if t and u < expire]:
+                target[i] = 0
+                self.released[i] = self.updated[i] + self.timeout
+                self.peak[i] = old[i]
+
+        up = _dt / self.attack if self.attack else self.INSTANT
+        down = _dt / self.decay if self.decay else self.INSTANT
+        held = _now - self.hold
+
+        self.level = [
+            (t if l + t * up > t else l + t * up) if t >= l
+            else (l if r > held else (t if l - p * down < t else l - p * down))
+            for t, l, r, p in zip(target, old, self.released, self.peak)
+        ]
+
+        level = self.level
+        changed = [key for key, (start, end) in self.offsets.items() if level[start:end] != old[start:end]]
+
+        return changed, level != target
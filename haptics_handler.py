@@ -1,219 +1,104 @@
-from enum import Enum
-from bhaptics.better_haptic_player import BhapticsPosition
+from device_layout import DeviceLayouts
 from log import Flag
 
-INTENSITY = 100
+# prefix of avatar parameters that bridge is interested in
+PARAMETER_PREFIXES = ("bHapticsOSC_", "bOSC_v1_")
 
-PARAMETER_ADDRESS = {
+# parameters that are not related to motor
+CONTROL_PARAMETERS = ("bHapticsOSC_reset", "bHapticsOSC_Debug_Profile", "bHapticsOSC_Debug_Trace",
+                      "bHapticsOSC_Debug_Stats")
 
-}
+# bHapticsOSC_Pattern_<pattern name> plays pattern of library
+PATTERN_PREFIX = "bHapticsOSC_Pattern_"
 
-class HapticsHandler:
-    def __init__(self, haptics_player, show_log=False):
-        self.haptics_player = haptics_player
-        self.show_log = show_log
-
-
-    def vest_handler(self, _addr, *_args):
-        """
-        (STATIC) This works with dispatcher.
-
-        send feedback to vest when receive contact
-        :param _addr: VRC parameter address
-        :param _args: VRC parameter value
-        :return: NONE
-        """
-        num = _addr.split("_")[-1]
-        idx = int("".join(num)) - 1
-
-        if "bHapticsOSC_Vest_Back" in _addr:
-            self.haptics_player.set(BhapticsPosition.VestBack, idx, _args[0])
-
-            if self.show_log:
-                print(Flag.Info.value + "Position: VestBack idx: {} Value: {}".format(idx, _args[0]))
-        elif "bHapticsOSC_Vest_Front" in _addr:
-            idx = (3 - idx % 4) + (idx // 4 * 4)
 
-            self.haptics_player.set(BhapticsPosition.VestFront, idx, _args[0])
+def known_parameter_names(_layouts: DeviceLayouts) -> list:
+    """
+    list every avatar parameter name that known schema defines
+    :param _layouts: (DeviceLayouts) loaded device layouts
+    :return: (List) parameter names without path
+    """
+    return list(CONTROL_PARAMETERS) + _layouts.parameter_names()
 
-            if self.show_log:
-                print(Flag.Info.value + "Position: VestFront idx: {} Value: {}".format(idx, _args[0]))
 
-    def v1_vest_handler(self, _addr, *_args):
-        """
-        (STATIC)(Legacy) This works with dispatcher.
+class HapticsHandler:
+    def __init__(self, haptics_player, show_log=False, pattern_library=None, layouts=None):
+        self.haptics_player = haptics_player
+        self.show_log = show_log
+        self.pattern_library = pattern_library
+        self.layouts = layouts or haptics_player.layouts
 
-        send feedback to vest when receive contact
-        :param _addr: VRC parameter address
-        :param _args: VRC parameter value
-        :return: NONE
-        """
-        num = _addr.split("_")[-1]
-        idx = int("".join(num))
-        intensity = INTENSITY if _args[0] else 0
+        # device name -> number of motor parameters that are handled / out of layout
+        self.matched = {}
+        self.ignored = {}
 
-        if "v1_VestBack" in _addr:
-            self.haptics_player.set(BhapticsPosition.VestBack, idx, intensity)
-            if self.show_log:
-                print(Flag.Info.value + "Position: VestBack idx: {} Value: {}".format(idx, _args[0]))
-        elif "v1_VestFront" in _addr:
-            self.haptics_player.set(BhapticsPosition.VestFront, idx, intensity)
-            if self.show_log:
-                print(Flag.Info.value + "Position: VestFront idx: {} Value: {}".format(idx, _args[0]))
+        # <pattern>
+        self.pattern_active = {}
+        self.pattern_angle = 0
+        # </pattern>
 
-    def head_handler(self, _addr, *_args):
+    def motor_handler(self, _addr, *_args):
         """
         (STATIC) This works with dispatcher.
 
-        send feedback to head when receive contact
+        send feedback to motor that device layouts map the parameter to
         :param _addr: VRC parameter address
         :param _args: VRC parameter value
         :return: NONE
         """
-        num = _addr.split("_")[-1]
-        idx = int("".join(num)) - 1
-        idx = 5 - idx  # reverse index
-
-        self.haptics_player.set(BhapticsPosition.Head, idx, _args[0])
-
-        if self.show_log:
-            print(Flag.Info.value + "Position: Head idx: {} Value: {}".format(idx, _args[0]))
-
-    def v1_head_handler(self, _addr, *_args):
-        """
-        (STATIC) (Legacy) This works with dispatcher.
-        send feedback to head when receive contact
+        route = self.layouts.routes.get(_addr)
+        if route is None:
+            family = self.layouts.family_of(_addr)
+            self.ignored[family] = self.ignored.get(family, 0) + 1
+            return
 
-        :param _addr: VRC parameter address
-        :param _args: VRC parameter value
-        :return: NONE
-        """
-        num = _addr.split("_")[-1]
-        idx = int("".join(num))
-        intensity = INTENSITY if _args[0] else 0
+        position, idx, binary, family = route
+        self.matched[family] = self.matched.get(family, 0) + 1
+        # legacy schema only knows on and off
+        value = bool(_args[0]) if binary else _args[0]
 
-        self.haptics_player.set(BhapticsPosition.Head, idx, intensity)
+        self.haptics_player.set(position, idx, value)
 
         if self.show_log:
-            print(Flag.Info.value + "Position: Head idx: {} Value: {}".format(idx, _args[0]))
-
-    def arm_handler(self, _addr, *_args):
-        """
-        (STATIC) This works with dispatcher.
-
-        send feedback to arms when receive contact
-        :param _addr: VRC parameter address
-        :param _args: VRC parameter value
-        :return: NONE
-        """
-        num = _addr.split("_")[-1]
-        idx = int("".join(num)) - 1
-
-        if "bHapticsOSC_Arm_Left" in _addr:
-            self.haptics_player.set(BhapticsPosition.ForearmL, idx, _args[0])
-
-            if self.show_log:
-                print(Flag.Info.value + "Position: ForearmL idx: {} Value: {}".format(idx, _args[0]))
-        elif "bHapticsOSC_Arm_Right" in _addr:
-            self.haptics_player.set(BhapticsPosition.ForearmR, idx, _args[0])
-
-            if self.show_log:
-                print(Flag.Info.value + "Position: ForearmR idx: {} Value: {}".format(idx, _args[0]))
-
-    def v1_arm_handler(self, _addr, *_args):
-        """
-        (STATIC) This works with dispatcher.
-
-        send feedback to arms when receive contact
-        :param _addr: VRC parameter address
-        :param _args: VRC parameter value
-        :return: NONE
-        """
-        num = _addr.split("_")[-1]
-        idx = int("".join(num))
-        intensity = INTENSITY if _args[0] else 0
-
-        if "v1_ForearemL" in _addr:
-            self.haptics_player.set(BhapticsPosition.ForearmL, idx, intensity)
-
-            if self.show_log:
-                print(Flag.Info.value + "Position: ForearmL: {} Value: {}".format(idx, _args[0]))
-        elif "v1_ForearemR" in _addr:
-            self.haptics_player.set(BhapticsPosition.ForearmR, idx, intensity)
-
-            if self.show_log:
-                print(Flag.Info.value + "Position: ForearmR: {} Value: {}".format(idx, _args[0]))
+            print(Flag.Info.value + "Position: {} idx: {} Value: {}".format(position.value, idx, _args[0]))
 
-    def hand_handler(self, _addr, *_args):
+    def pattern_handler(self, _addr, *_args):
         """
         (STATIC) This works with dispatcher.
 
-        send feedback to hands when receive contact
+        play pattern when parameter becomes true (or positive).
+        float value is used as intensity scale
         :param _addr: VRC parameter address
         :param _args: VRC parameter value
         :return: NONE
         """
-        num = _addr.split("_")[-1]
-        idx = int("".join(num)) - 1
-
-        if "bHapticsOSC_Hand_Left" in _addr:
-            self.haptics_player.set(BhapticsPosition.HandL, idx, _args[0])
-
-            if self.show_log:
-                print(Flag.Info.value + "Position: HandL idx: {} Value: {}".format(idx, _args[0]))
-        elif "bHapticsOSC_Hand_Right" in _addr:
-            self.haptics_player.set(BhapticsPosition.HandR, idx, _args[0])
-
-            if self.show_log:
-                print(Flag.Info.value + "Position: HandR idx: {} Value: {}".format(idx, _args[0]))
-
-    def foot_handler(self, _addr, *_args):
-        """
-        (STATIC) This works with dispatcher.
+        if self.pattern_library is None:
+            return
 
-        send feedback to feet when receive contact
-        :param _addr: VRC parameter address
-        :param _args: VRC parameter value
-        :return: NONE
-        """
-        num = _addr.split("_")[-1]
-        idx = int("".join(num)) - 1
+        name = _addr.split(PATTERN_PREFIX, 1)[-1]
+        value = _args[0]
+        active = bool(value)
 
-        if "bHapticsOSC_Foot_Left" in _addr:
-            self.haptics_player.set(BhapticsPosition.FootL, idx, _args[0])
+        # play only on rising edge
+        if active and not self.pattern_active.get(name, False):
+            intensity = 1.0 if type(value) is bool else float(value)
+            played = self.pattern_library.play(name, intensity, 1.0, self.pattern_angle)
 
             if self.show_log:
-                print(Flag.Info.value + "Position: FootL idx: {} Value: {}".format(idx, _args[0]))
-        elif "bHapticsOSC_Foot_Right" in _addr:
-            idx = 2 - idx  # reverse index
+                print(Flag.Info.value + "Pattern: {} played: {} Value: {}".format(name, played, value))
 
-            self.haptics_player.set(BhapticsPosition.FootR, idx, _args[0])
-
-            if self.show_log:
-                print(Flag.Info.value + "Position: HandR idx: {} Value: {}".format(idx, _args[0]))
+        self.pattern_active[name] = active
 
-    def glove_handler(self, _addr, *_args):
+    def pattern_angle_handler(self, _addr, *_args):
         """
         (STATIC) This works with dispatcher.
 
-        send feedback to glove when receive contact
+        set rotation of patterns played after (0.0 ~ 1.0 -> 0 ~ 360 degree)
         :param _addr: VRC parameter address
         :param _args: VRC parameter value
         :return: NONE
         """
-        num = _addr.split("_")[-1]
-        idx = int("".join(num)) - 1
-
-        if "bHapticsOSC_GloveL" in _addr:
-            self.haptics_player.set(BhapticsPosition.GloveL, idx, _args[0])
-
-            if self.show_log:
-                print(Flag.Info.value + "Position: GloveR idx: {} Value: {} \033".format(idx, _args[0]))
-        elif "bHapticsOSC_GloveR" in _addr:
-            self.haptics_player.set(BhapticsPosition.GloveR, idx, _args[0])
-
-            if self.show_log:
-                print(Flag.Info.value + "Position: GloveR idx: {} Value: {} \033".format(idx, _args[0]))
+        self.pattern_angle = float(_args[0]) * 360
 
     def avi_changed_handler(self, _addr, *_args):
         self.haptics_player.reset()
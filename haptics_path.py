@@ -0,0 +1,50 @@
+MAX_DENSITY = 0.3
+MAX_POINTS = 3
+
+
+def to_path_points(_intensities: list, _grid: tuple, _coordinates: list, _max_density: float = MAX_DENSITY,
+                   _max_points: int = MAX_POINTS):
+    """
+    convert active motors of position into few weighted path points.
+
+    adjacent active motors become one point at their intensity weighted center.
+    :param _intensities: (List) intensity by motor index
+    :param _grid: (Tuple) (columns, rows) of motor grid. motor index is row * columns + column
+    :param _coordinates: (List) (x, y) by motor index
+    :param _max_density: [optional] (Float) ratio of active motors above which dot frame is used
+    :param _max_points: [optional] (Int) number of points above which dot frame is used
+    :return: (List) path points, None if dot frame should be used instead
+    """
+    columns, rows = _grid
+    active = {i for i, v in enumerate(_intensities) if v > 0}
+
+    if not active or len(active) > _max_density * len(_intensities):
+        return None
+
+    points = []
+
+    while active:
+        # flood fill one group of neighboring motors
+        stack = [active.pop()]
+        group = []
+        while stack:
+            i = stack.pop()
+            group.append(i)
+            col, row = i % columns, i // columns
+            for n in [r * columns + c for r in (row - 1, row, row + 1) for c in (col - 1, col, col + 1)
+                      if 0 <= r < rows and 0 <= c < columns]:
+                if n in active:
+                    active.remove(n)
+                    stack.append(n)
+
+        if len(points) == _max_points:
+            return None
+
+        weight = sum(_intensities[i] for i in group)
+        points.append({
+            "x": sum(_coordinates[i][0] * _intensities[i] for i in group) / weight,
+            "y": sum(_coordinates[i][1] * _intensities[i] for i in group) / weight,
+            "intensity": max(_intensities[i] for i in group),
+        })
+
+    return points
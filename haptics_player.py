@@ -1,41 +1,114 @@
+import time
+from contextlib import contextmanager
 from bhaptics.better_haptic_player import BhapticsPosition
-from bhaptics import better_haptic_player as player
+from device_layout import DeviceLayouts
+from output_backend import OutputBackend, NullBackend
+from actuator_stats import ActuatorStats
+from haptics_envelope import EnvelopeEngine
+from haptics_path import to_path_points, MAX_DENSITY, MAX_POINTS
+from intensity_curve import IntensityCurves
+from tracing import Tracer, tracer
 
 class HapticsPlayer:
 
-    def __init__(self, _id, _name):
-        player.initialize(_id, _name)
-        self. positions = {key.value: list() for key in BhapticsPosition}
+    def __init__(self, _backend: OutputBackend = None, _layouts: DeviceLayouts = None, _tracer: Tracer = None):
+        # destination of frames, frames are dropped if omitted
+        self.backend = _backend or NullBackend(_encode=False)
+        # tracer of session, shared tracer if omitted
+        self.tracer = _tracer if _tracer is not None else tracer
+        # motor count and grid of every position
+        self.layouts = _layouts or DeviceLayouts()
+        self.positions = {
+            key.value: [{"index": i, "intensity": 0} for i in range(self.layouts.size_of(key.value))]
+            for key in BhapticsPosition
+        }
 
-        for key in self.positions.keys():
-            if key in ["VestBack", "VestFront"]:
-                self.positions[key] = [{"index": i, "intensity": 0} for i in range(20)]
-            elif key in ["Head", "ForearmL", "ForearmR", "GloveL", "GloveR"]:
-                self.positions[key] = [{"index": i, "intensity": 0} for i in range(6)]
-            elif key in ["HandL", "HandR", "FootL", "FootR"]:
-                self.positions[key] = [{"index": i, "intensity": 0} for i in range(3)]
+        # positions that changed since last take_dirty()
+        self.dirty = set()
+        # callbacks called once per committed change
+        self.listeners = []
+
+        # <transaction>
+        self.__depth = 0
+        self.__pending = {}
+        self.__pending_reset = False
+        # </transaction>
+
+        # response curve of each position, compiled into lookup tables
+        self.curves = IntensityCurves()
+
+        # number of updates absorbed by quantization / hysteresis
+        self.absorbed = 0
+
+        # set() changes target of envelope, update() moves positions toward it
+        self.envelope = EnvelopeEngine({key: len(dots) for key, dots in self.positions.items()})
+        # source of monotonic time, replaced by replay to run on recorded time
+        self.clock = time.monotonic
+        self.__last_update = self.clock()
+        # activity of every actuator
+        self.stats = ActuatorStats(self.envelope.offsets, lambda: self.clock())
+        # callbacks called with flat levels of every actuator whenever they change
+        self.level_listeners = []
+
+        # <output>
+        self.output_mode = "dot"  # "dot" or "path"
+        self.path_max_density = MAX_DENSITY
+        self.path_max_points = MAX_POINTS
+        # positions that are submitted
+        self.enabled = set(self.positions.keys())
+        # </output>
 
     def set(self, _position: BhapticsPosition, _index: int, _intensity) -> None:
         """
-        Updates the intensity value of a specific actuator position in the positions attribute
-        using the BhapticsPosition enumeration. The intensity value is determined by the type
-        and value of the `_intensity` parameter. If `_intensity` is of int type, its value is
-        directly assigned to the intensity of the specified actuator. If `_intensity` is a
-        boolean, the intensity is set to 100 if `_intensity` is True, or 0 if it is False.
+        Updates the intensity value of a specific actuator position using the BhapticsPosition
+        enumeration. The value is mapped through the response curve of the position: a boolean
+        is fully active or inactive, an integer is a percentage (0 ~ 100) and a float is
+        VRChat's normalized value (0.0 ~ 1.0). Updates that don't change the quantized value,
+        or change an active motor less than hysteresis of the position, are absorbed.
 
         :param _position: The position on the haptic device to be updated, represented as a
             BhapticsPosition enumeration.
         :param _index: The specific index of the actuator within the position to which the
             intensity should be applied.
-        :param _intensity: The intensity value for the actuator, which can be either an
-            integer or a boolean. An integer sets the exact intensity value, while a boolean
-            determines whether the intensity should be set as fully active (100) or inactive (0).
+        :param _intensity: The value received from VRChat, which can be a boolean, an integer
+            or a float.
         :return: None
         """
-        if type(_intensity) is not int:
-            self.positions[_position.value][_index]["intensity"] = _intensity
-        if type(_intensity) is bool:
-            self.positions[_position.value][_index]["intensity"] = 100 if _intensity else 0
+        start = self.tracer.start()
+        self.__set(_position.value, _index, _intensity)
+        if start:
+            self.tracer.end("HapticsPlayer.set", start, {"position": _position.value, "index": _index})
+
+    def __set(self, pos: str, _index: int, _intensity):
+        """
+        (PRIVATE) filter update of actuator and apply it, or keep it until transaction ends
+        """
+        self.stats.receive(pos, _index)
+        _intensity = self.curves.apply(pos, _intensity)
+        now = self.clock()
+
+        # <filter>
+        if self.__depth and (pos, _index) in self.__pending:
+            current = self.__pending[(pos, _index)]
+        elif self.__depth and self.__pending_reset:
+            current = 0
+        else:
+            current = self.envelope.target_of(pos, _index)
+
+        # same value, or small change of active motor (jitter) doesn't change state
+        if _intensity == current or (_intensity and current and
+                                     abs(_intensity - current) < self.curves.hysteresis.get(pos, self.curves.default_hysteresis)):
+            self.absorbed += 1
+            self.envelope.touch(pos, _index, now)
+            return
+        # </filter>
+
+        if self.__depth:
+            self.__pending[(pos, _index)] = _intensity
+            return
+
+        self.envelope.set(pos, _index, _intensity, now)
+        self.__notify()
 
     def reset(self):
         """
@@ -46,9 +119,111 @@ class HapticsPlayer:
 
         :return: None
         """
-        for obj in self.positions.values():
+        if self.__depth:
+            # updates before reset in the same transaction are discarded
+            self.__pending.clear()
+            self.__pending_reset = True
+            return
+
+        self.__reset()
+        self.__notify()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Apply every set() and reset() made inside the block at once when the block ends.
+
+        Readers never see half-applied state and listeners are notified once per transaction.
+        Transactions can be nested; changes are committed when the outermost one ends.
+
+        :return: context manager
+        """
+        self.__depth += 1
+        try:
+            yield self
+        finally:
+            self.__depth -= 1
+            if self.__depth == 0:
+                self.__commit()
+
+    def add_listener(self, _callback) -> None:
+        """
+        Register callback that is called without argument whenever state changes.
+
+        :param _callback: callable
+        :return: None
+        """
+        self.listeners.append(_callback)
+
+    def take_dirty(self) -> set:
+        """
+        Return positions changed since last call and clear them.
+
+        :return: set of position names
+        """
+        dirty = self.dirty
+        self.dirty = set()
+        return dirty
+
+    def __commit(self):
+        if not self.__pending and not self.__pending_reset:
+            return
+
+        if self.__pending_reset:
+            self.__reset()
+            self.__pending_reset = False
+
+        now = self.clock()
+        for (pos, index), intensity in self.__pending.items():
+            self.envelope.set(pos, index, intensity, now)
+        self.__pending.clear()
+
+        self.__notify()
+
+    def update(self, _now: float = None) -> bool:
+        """
+        Advance envelopes of every actuator and apply their levels to positions.
+
+        Positions whose intensity changed are marked dirty.
+
+        :param _now: [optional] monotonic time, current time if omitted
+        :return: True if some envelope is still moving and update() should be called again soon
+        """
+        if _now is None:
+            _now = self.clock()
+
+        # clock may have been replaced since last update
+        dt = max(_now - self.__last_update, 0)
+        changed, moving = self.envelope.tick(_now, dt)
+        self.stats.observe(self.envelope.level, dt)
+        self.__last_update = _now
+
+        for key in changed:
+            # player expects integer intensity, envelope moves in fractions
+            for dot, level in zip(self.positions[key], self.envelope.levels(key)):
+                dot["intensity"] = int(round(level))
+            self.dirty.add(key)
+
+        if changed:
+            self.__publish_levels()
+
+        return moving
+
+    def __reset(self):
+        self.envelope.reset()
+        for key, obj in self.positions.items():
             for pos in obj:
                 pos["intensity"] = 0
+            self.dirty.add(key)
+        self.__publish_levels()
+
+    def __publish_levels(self):
+        for callback in self.level_listeners:
+            callback(self.envelope.level)
+
+    def __notify(self):
+        for callback in self.listeners:
+            callback()
 
     def sumit_dot(self, _position: BhapticsPosition, _duration: int = 100):
         """
@@ -61,9 +236,39 @@ class HapticsPlayer:
             device where the feedback is applied.
         :type _position: BhapticsPosition
         :param _duration: Optional duration in milliseconds for how long the feedback
-            should last. Defaults to DEFAULT_DURATION.
+            should last. Defaults to 100.
         :type _duration: int
         :return: None
         """
         pos = _position.value
-        player.submit_dot(pos, pos, self.positions[pos], _duration)
\ No newline at end of file
+        self.backend.submit_dot(pos, pos, self.positions[pos], _duration)
+
+    def submit(self, _position: BhapticsPosition, _duration: int = 100):
+        """
+        Submit current state of the position with the frame type chosen by output mode.
+
+        In "path" mode, sparse contacts are sent as a few weighted path points and the player
+        interpolates between motors. Positions that are too dense, or that have no grid layout,
+        are sent as dot frames.
+
+        :param _position: A position object that determines the location on the haptic
+            device where the feedback is applied.
+        :type _position: BhapticsPosition
+        :param _duration: Optional duration in milliseconds for how long the feedback
+            should last.
+        :type _duration: int
+        :return: None
+        """
+        pos = _position.value
+
+        if pos not in self.enabled:
+            return
+
+        if self.output_mode == "path" and pos in self.layouts.grids:
+            points = to_path_points([dot["intensity"] for dot in self.positions[pos]], self.layouts.grids[pos],
+                                    self.layouts.coordinates[pos], self.path_max_density, self.path_max_points)
+            if points is not None:
+                self.backend.submit_path(pos, pos, points, _duration)
+                return
+
+        self.backend.submit_dot(pos, pos, self.positions[pos], _duration)
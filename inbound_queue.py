@@ -0,0 +1,117 @@
+from collections import deque
+
+# messages that are handled before contact updates. a truthy value also supersedes pending contact updates
+CONTROL_ADDRESSES = frozenset([
+    "/avatar/change",
+    "/avatar/parameters/bHapticsOSC_reset",
+])
+
+# messages that trigger something on change. they are never coalesced so that no edge is lost.
+# pattern angle is kept in the same order, so an angle sent before a trigger applies to it
+EVENT_PREFIXES = (
+    "/avatar/parameters/bHapticsOSC_Pattern_",
+    "/avatar/parameters/bHapticsOSC_PatternAngle",
+    "/avatar/parameters/bHapticsOSC_Debug_",
+)
+
+DEFAULT_CAPACITY = 256
+
+
+class CoalescingQueue:
+    def __init__(self, _capacity: int = DEFAULT_CAPACITY):
+        """
+        Inbound queue that keeps only the newest value of each address until it is drained.
+
+        work per drain is bounded by number of addresses, not by packet rate.
+        :param _capacity: (Int) maximum number of distinct addresses, and of control messages, held at once
+        """
+        self.capacity = _capacity
+        # address -> (args, client_address), insertion ordered
+        self.latest = {}
+        self.control = deque()
+        # callbacks called when queue becomes non-empty
+        self.listeners = []
+
+        self.received: int = 0
+        self.collapsed: int = 0
+        self.overflow: int = 0
+        self.drained: int = 0
+
+    def put(self, address: str, args: tuple, client_address: tuple) -> bool:
+        """
+        queue update of address, replacing pending one of same address.
+        control and event messages are kept in arrival order
+        :param address: (String) OSC address
+        :param args: (Tuple) OSC arguments
+        :param client_address: (Tuple) address of sender
+        :return: (Bool) False if table is full and caller must handle message by itself
+        """
+        was_empty = not self.latest and not self.control
+        self.received += 1
+
+        if address in CONTROL_ADDRESSES or address.startswith(EVENT_PREFIXES):
+            if len(self.control) >= self.capacity:
+                self.overflow += 1
+                return False
+            if address in CONTROL_ADDRESSES and args and args[0]:
+                # reset / avatar change makes earlier contact updates meaningless
+                self.collapsed += len(self.latest)
+                self.latest.clear()
+            self.control.append((address, args, client_address))
+        elif address in self.latest:
+            self.collapsed += 1
+            self.latest[address] = (args, client_address)
+        elif len(self.latest) < self.capacity:
+            self.latest[address] = (args, client_address)
+        else:
+            self.overflow += 1
+            return False
+
+        if was_empty:
+            for callback in self.listeners:
+                callback()
+
+        return True
+
+    def drain(self, _dispatch) -> int:
+        """
+        hand every queued update to dispatch, control messages first
+        :param _dispatch: callable (address, args, client_address)
+        :return: (Int) number of dispatched updates
+        """
+        control = self.control
+        latest = self.latest
+        self.control = deque()
+        self.latest = {}
+
+        for address, args, client_address in control:
+            _dispatch(address, args, client_address)
+
+        for address, (args, client_address) in latest.items():
+            _dispatch(address, args, client_address)
+
+        count = len(control) + len(latest)
+        self.drained += count
+        return count
+
+    def add_listener(self, _callback) -> None:
+        """
+        Register callback that is called without argument when queue becomes non-empty.
+
+        :param _callback: callable
+        :return: None
+        """
+        self.listeners.append(_callback)
+
+    def stats(self) -> dict:
+        """
+        get counters of queue
+        :return: (Dictionary) counters
+        """
+        return {
+            "received": self.received,
+            "collapsed": self.collapsed,
+            "overflow": self.overflow,
+            "drained": self.drained,
+            "pending": len(self.latest) + len(self.control),
+        }
@@ -0,0 +1,113 @@
+LUT_SIZE = 256
+MAX_INTENSITY = 100
+
+DEFAULT_CURVE = {
+    "gain": 1.0,
+    "gamma": 1.0,
+    "floor": 0,
+    "ceiling": MAX_INTENSITY,
+    "deadzone": 0.0,
+    # number of intensity steps device can render, output is rounded to them
+    "resolution": 20,
+    # change of active motor smaller than this is absorbed (intensity units). keep it below one step
+    # (MAX_INTENSITY / resolution), otherwise single step changes are lost and resolution is halved
+    "hysteresis": 4,
+}
+
+
+def compile_curve(gain: float = 1.0, gamma: float = 1.0, floor: float = 0, ceiling: float = MAX_INTENSITY,
+                  deadzone: float = 0.0, resolution: int = MAX_INTENSITY, hysteresis: float = 0) -> list:
+    """
+    compile response curve into lookup table indexed by normalized input (0.0 ~ 1.0) * LUT_SIZE
+
+    input inside deadzone is 0, the rest is scaled by gain, shaped by gamma, mapped into floor ~ ceiling
+    and rounded to resolution steps
+    :param gain: (Float) input multiplier
+    :param gamma: (Float) exponent of curve, above 1 makes light touch weaker
+    :param floor: (Float) lowest intensity of active motor
+    :param ceiling: (Float) highest intensity
+    :param deadzone: (Float) normalized input at or below which output is 0
+    :param resolution: (Int) number of intensity steps
+    :param hysteresis: (Float) not used by table, see IntensityCurves.hysteresis
+    :return: (List) integer intensities, LUT_SIZE + 1 entries
+    """
+    table = []
+    step = MAX_INTENSITY / resolution
+
+    for i in range(LUT_SIZE + 1):
+        x = i / LUT_SIZE
+        if x <= deadzone:
+            table.append(0)
+            continue
+
+        y = min(1.0, (x - deadzone) / (1.0 - deadzone) * gain) ** gamma
+        table.append(int(round(round((floor + (ceiling - floor) * y) / step) * step)))
+
+    return table
+
+
+class IntensityCurves:
+    def __init__(self, _curves: dict = None):
+        """
+        Response curves of every position, compiled into lookup tables.
+
+        :param _curves: [optional] (Dictionary) position name (or "default") -> curve parameters
+        """
+        self.curves = {}
+        self.default = compile_curve(**DEFAULT_CURVE)
+        self.tables = {}
+        # position name -> hysteresis
+        self.default_hysteresis = DEFAULT_CURVE["hysteresis"]
+        self.hysteresis = {}
+        self.configure(_curves or {})
+
+    def configure(self, _curves: dict) -> None:
+        """
+        compile curves. tables of unchanged curves are kept.
+        nothing is changed if any curve can't be compiled
+        :param _curves: (Dictionary) position name (or "default") -> curve parameters
+        :return: None
+        """
+        curves = {key: dict(DEFAULT_CURVE, **params) for key, params in _curves.items()}
+
+        default = self.default
+        if curves.get("default") != self.curves.get("default"):
+            default = compile_curve(**curves.get("default", DEFAULT_CURVE))
+
+        tables = {}
+        for key, params in curves.items():
+            if key == "default":
+                continue
+            if self.curves.get(key) == params and key in self.tables:
+                tables[key] = self.tables[key]
+            else:
+                tables[key] = compile_curve(**params)
+
+        self.curves = curves
+        self.default = default
+        self.tables = tables
+        self.default_hysteresis = curves.get("default", DEFAULT_CURVE)["hysteresis"]
+        self.hysteresis = {key: params["hysteresis"] for key, params in curves.items() if key != "default"}
+
+    def apply(self, _position: str, _value) -> int:
+        """
+        map OSC value to intensity of position
+
+        bool is 0 or 1, int is percentage (0 ~ 100) and float is VRChat's normalized value (0.0 ~ 1.0)
+        :param _position: (String) position name
+        :param _value: OSC value
+        :return: (Int) intensity
+        """
+        if type(_value) is bool:
+            x = 1.0 if _value else 0.0
+        elif type(_value) is int:
+            x = _value / MAX_INTENSITY
+        else:
+            x = _value
+
+        if not x > 0:
+            return 0
+        if x > 1:
+            x = 1
+
+        return self.tables.get(_position, self.default)[int(x * LUT_SIZE + 0.5)]
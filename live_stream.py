@@ -0,0 +1,137 @@
+import json
+import threading
+import time
+from urllib.parse import urlsplit, parse_qs
+
+CONTENT_TYPE = "text/event-stream"
+DEFAULT_RATE = 10.0
+MAX_RATE = 60.0
+# seconds without change before comment is sent, which also detects closed subscribers
+KEEPALIVE = 15.0
+
+
+class LiveState:
+    def __init__(self, _offsets: dict):
+        """
+        Latest actuator levels, streamed to HTTP subscribers as Server-Sent Events.
+
+        publish() only replaces the snapshot, so it never waits for subscribers. each subscriber
+        runs on its own HTTP thread, sends at most its own rate and always sends the newest
+        snapshot, so states that arrive while it is slow are skipped instead of queued.
+        :param _offsets: (Dictionary) position name -> (start, end) in flat levels, as EnvelopeEngine
+        """
+        self.offsets = _offsets
+        self.sequence = 0
+        self.timestamp = time.time()
+        self.levels = [0] * max((end for _start, end in _offsets.values()), default=0)
+        self.subscribers = 0
+        self.__condition = threading.Condition()
+
+    def publish(self, _levels: list) -> None:
+        """
+        replace snapshot with new levels and wake subscribers
+        :param _levels: (List) levels in flat layout
+        :return: None
+        """
+        levels = list(_levels)
+        with self.__condition:
+            self.levels = levels
+            self.timestamp = time.time()
+            self.sequence += 1
+            self.__condition.notify_all()
+
+    def wait(self, _sequence: int, _timeout: float):
+        """
+        wait until snapshot is newer than given sequence
+        :param _sequence: (Int) sequence of snapshot subscriber has
+        :param _timeout: (Float) seconds to wait
+        :return: (Tuple) (sequence, unix time, levels) or None on timeout
+        """
+        with self.__condition:
+            if not self.__condition.wait_for(lambda: self.sequence != _sequence, _timeout):
+                return None
+            return self.sequence, self.timestamp, self.levels
+
+    def serve(self, _request) -> None:
+        """
+        stream snapshots to HTTP request until client disconnects
+
+        query: rate=<frames per second, up to MAX_RATE>, positions=<comma separated position names>.
+        first event is "full" with every level of selected positions, then "delta" events carry
+        [index, level] of changed motors only and how many snapshots were skipped.
+        :param _request: (OSCQueryHTTPHandler) request handler
+        :return: None
+        """
+        query = parse_qs(urlsplit(_request.path).query)
+        try:
+            rate = min(float(query.get("rate", [DEFAULT_RATE])[0]), MAX_RATE)
+            if not rate > 0:
+                raise ValueError("rate must be positive")
+            names = [name for name in query.get("positions", [""])[0].split(",") if name] or list(self.offsets)
+            unknown = [name for name in names if name not in self.offsets]
+            if unknown:
+                raise ValueError(f"unknown positions {unknown}")
+        except ValueError as e:
+            _request.send_body(400, "text/plain", str(e).encode("utf-8"))
+            return
+
+        offsets = [(name, self.offsets[name]) for name in names]
+        interval = 1 / rate
+
+        _request.send_response(200)
+        _request.send_header("Content-type", CONTENT_TYPE)
+        _request.send_header("Cache-Control", "no-cache")
+        _request.send_header("Access-Control-Allow-Origin", "*")
+        _request.end_headers()
+        _request.close_connection = True
+
+        with self.__condition:
+            self.subscribers += 1
+            sequence, timestamp, sent = self.sequence, self.timestamp, self.levels
+
+        try:
+            self.__send(_request, "full", sequence, {
+                "t": round(timestamp, 3),
+                "positions": {name: [round(level) for level in sent[start:end]] for name, (start, end) in offsets},
+            })
+            next_send = time.monotonic() + interval
+
+            while True:
+                delay = next_send - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+                snapshot = self.wait(sequence, KEEPALIVE)
+                if snapshot is None:
+                    _request.wfile.write(b": keepalive\n\n")
+                    _request.wfile.flush()
+                    continue
+
+                skipped = snapshot[0] - sequence - 1
+                sequence, timestamp, levels = snapshot
+                changes = {}
+                for name, (start, end) in offsets:
+                    motors = [[i, round(levels[start + i])] for i in range(end - start)
+                              if round(levels[start + i]) != round(sent[start + i])]
+                    if motors:
+                        changes[name] = motors
+                sent = levels
+
+                if changes:
+                    self.__send(_request, "delta", sequence,
+                                {"t": round(timestamp, 3), "skipped": skipped, "changes": changes})
+                    next_send = time.monotonic() + interval
+        except OSError:
+            # client disconnected
+            pass
+        finally:
+            with self.__condition:
+                self.subscribers -= 1
+
+    @staticmethod
+    def __send(_request, _event: str, _sequence: int, _data: dict):
+        """
+        (PRIVATE) write one Server-Sent Event
+        """
+        _request.wfile.write(f"event: {_event}\nid: {_sequence}\ndata: {json.dumps(_data)}\n\n".encode("utf-8"))
+        _request.wfile.flush()
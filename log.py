@@ -3,4 +3,5 @@ from enum import Enum
 class Flag(Enum):
     Info = "\033[34m[INFO]\033[0m "
     Debug = "\033[32m[Debug]\033[0m "
-    Warn = "\033[33m[Warning]\033[0m "
\ No newline at end of file
+    Warn = "\033[33m[Warning]\033[0m "
+    Error = "\033[31m[Error]\033[0m "
\ No newline at end of file
@@ -1,23 +1,65 @@
 import os
 import asyncio
 import json
-import errno
 import socket
 import time
 import psutil
 import requests
+import signal
 import sys
+import threading
+import argparse
+import ipaddress
+import multiprocessing
+
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit, parse_qs
 
 from log import Flag
-from pythonosc import udp_client, osc_server, dispatcher
-from tinyoscquery.query import OSCQueryBrowser, OSCQueryClient
+from pythonosc import dispatcher, osc_bundle_builder, osc_message_builder
+from zeroconf.asyncio import AsyncZeroconf
+from tinyoscquery.query import OSCQueryBrowser, OSCQueryClient, OSCQUERY_SERVICE_TYPE
 from tinyoscquery.queryservice import OSCQueryService, OSCAccess
-from bhaptics.better_haptic_player import BhapticsPosition, connected_positions
+from bhaptics.better_haptic_player import BhapticsPosition
 from haptics_player import HapticsPlayer
-from haptics_handler import HapticsHandler
-
-DEFAULT_DURATION = 100
-INTENSITY = 100
+from output_backend import create_backend
+from device_layout import DeviceLayouts
+from haptics_handler import HapticsHandler, PARAMETER_PREFIXES, known_parameter_names
+from osc_fastpath import FastOSCRouter, FastOSCProtocol
+from inbound_queue import CoalescingQueue
+from osc_recorder import OSCRecorder
+from metrics import MetricsRegistry, CONTENT_TYPE
+from profiler import ProfileController
+from tracing import Tracer
+from shared_state import SharedStateWriter
+from live_stream import LiveState
+from pattern_library import PatternLibrary
+from config import Config, ConfigWatcher, CONFIG_FILE
+from discovery_cache import DiscoveryCache
+
+APP_ID = "per.Guideung.bHapticsOSCQ"
+MIN_FRAME_INTERVAL = 0.02
+MAX_BUNDLE_SIZE = 4096
+STATUS_PREFIX = "bHapticsOSC_Status_"
+METRICS_PATH = "/metrics"
+PROFILE_PATH = "/profile"
+PROFILE_PARAMETER = "/avatar/parameters/bHapticsOSC_Debug_Profile"
+TRACE_PATH = "/trace"
+TRACE_PARAMETER = "/avatar/parameters/bHapticsOSC_Debug_Trace"
+STATS_PATH = "/stats"
+STATS_PARAMETER = "/avatar/parameters/bHapticsOSC_Debug_Stats"
+LIVE_PATH = "/live"
+RESTART_DELAY = 5.0
+# parameter nodes queried at once on avatar change
+PRMT_QUERY_WORKERS = 8
+# seconds waited before each try to reopen lost LISTEN stream
+LISTEN_RETRY_DELAYS = (1, 2, 4, 8, 16)
+# seconds between checks of discovered services while VRChat client isn't found
+DISCOVERY_POLL = 0.25
+
+# guards VRChat client ports claimed by sessions
+CLAIM_LOCK = threading.Lock()
 
 class OSCQuery:
     @staticmethod
@@ -34,10 +76,28 @@ class OSCQuery:
 
         return False
 
-    def __init__(self):
+    def __init__(self, _layouts: DeviceLayouts, _name: str = "bHapticsOSCQ", _client_name: str = "VRChat-Client",
+                 _claimed: set = None, _zeroconf=None, _cache: DiscoveryCache = None):
+        """
+        Advertise OSCQuery service and find VRChat client. blocks until client is found
+        :param _layouts: (DeviceLayouts) layouts whose parameters are queried
+        :param _name: [optional] (String) name of advertised service
+        :param _client_name: [optional] (String) part of service name of VRChat client to serve
+        :param _claimed: [optional] (Set) ports of VRChat clients served by other sessions, found port is added
+        :param _zeroconf: [optional] (Zeroconf) instance shared by every session, service creates its own if omitted
+        :param _cache: [optional] (DiscoveryCache) result of last run, tried before discovery and updated
+        """
+        self.layouts = _layouts
         self.http_port: int = 0
         self.osc_port: int = 0
         self.vrchat_client_port = None
+        self.vrchat_client = None
+        # HOST_INFO of VRChat client, None if it can't be read
+        self.host_info = None
+
+        # keep-alive connections to VRChat's OSCQuery server, shared by parameter queries
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=PRMT_QUERY_WORKERS))
 
         if not OSCQuery.__check_process_is_running():
             print(Flag.Warn.value + "VRC isn't running waiting...")
@@ -47,54 +107,140 @@ class OSCQuery:
             except KeyboardInterrupt:
                 sys.exit(0)
 
+        if _cache is not None and not _cache.load():
+            print(Flag.Info.value + "no usable discovery cache, VRChat client will be discovered")
+
+        # ports of last run are reused if they are free, so VRChat can keep sending to them
         # find free udp port and set osc_port
-        self.__get_free_udp_port()
+        self.__get_free_udp_port(_cache.osc_port if _cache is not None else None)
         # find free tcp port and set http_port
-        self.__get_free_tcp_port()
+        self.__get_free_tcp_port(_cache.http_port if _cache is not None else None)
 
-        self.oscQueryService = OSCQueryService("bHapticsOSCQ", self.http_port, self.osc_port)
+        # zeroconf probing takes seconds, so it doesn't delay oscjson server
+        self.oscQueryService = OSCQueryService(_name, self.http_port, self.osc_port, zeroconf=_zeroconf,
+                                               background=True)
         self.oscQueryService.advertise_endpoint("/avatar/parameters/MuteSelf", False, OSCAccess.WRITEONLY_VALUE)
 
-        self.browser = OSCQueryBrowser()
-        # wait for discovery
-        time.sleep(2)
+        # only OSCQuery services are needed, and only until VRChat client is found.
+        # browsing starts before cached endpoint is checked, so stale cache costs no extra time
+        self.browser = OSCQueryBrowser(_zeroconf, [OSCQUERY_SERVICE_TYPE])
+
+        claimed = _claimed if _claimed is not None else set()
+        host_info = None
+        if _cache is not None:
+            cached = _cache.validate(self.session, _client_name)
+            if cached is not None and self.__claim(cached[0], claimed):
+                host_info = cached[1]
+                print(Flag.Info.value + f"VRChat port restored from cache: {self.vrchat_client_port} "
+                                        f"({self.vrchat_client.service_info.name})")
 
         while self.vrchat_client_port is None:
             for service_info in self.browser.get_discovered_oscquery():
                 client = OSCQueryClient(service_info)
 
-                if 'VRChat-Client' in client.service_info.name:
-                    self.vrchat_client_port = client.service_info.port
-                    print(Flag.Info.value + f"VRChat port found: {self.vrchat_client_port}")
+                if _client_name in client.service_info.name and self.__claim(client, claimed):
+                    print(Flag.Info.value + f"VRChat port found: {self.vrchat_client_port} ({client.service_info.name})")
+                    break
+            else:
+                time.sleep(DISCOVERY_POLL)
 
-                time.sleep(1)
+        self.browser.close()
+        self.browser = None
+
+        if host_info is None:
+            host_info = self.__get_host_info()
+        self.host_info = host_info
+
+        if _cache is not None:
+            _cache.remember(self.vrchat_client, host_info, self.osc_port, self.http_port)
+            _cache.save()
 
-    def __get_free_udp_port(self):
+    def close(self):
         """
-        (PRIVATE) set udp port
-        :return: NONE
+        stop browsing, unregister OSCQuery service and close connections to VRChat.
+        blocks while zeroconf goodbye is sent, so it must not be called on event loop
+        """
+        if self.browser is not None:
+            self.browser.close()
+            self.browser = None
+        self.oscQueryService.close()
+        self.session.close()
+
+    def __claim(self, _client: OSCQueryClient, _claimed: set) -> bool:
+        """
+        (PRIVATE) serve VRChat client unless other session serves it
+        :param _client: (OSCQueryClient) client of VRChat's OSCQuery service
+        :param _claimed: (Set) ports of VRChat clients served by sessions
+        :return: (Bool) True if client is claimed
         """
+        with CLAIM_LOCK:
+            if _client.service_info.port in _claimed:
+                return False
+            _claimed.add(_client.service_info.port)
 
-        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as udp_socket:
-            udp_socket.bind(('localhost', 0))
-            port = udp_socket.getsockname()[1]
+        self.vrchat_client = _client
+        self.vrchat_client_port = _client.service_info.port
+        return True
 
-            self.osc_port = port
+    def get_vrchat_osc_port(self, _default: int) -> int:
+        """
+        get port that VRChat client receives OSC on, as its HOST_INFO tells
+        :param _default: (Int) port used when HOST_INFO doesn't have it
+        :return: (Int) port number
+        """
+        port = (self.host_info or {}).get("OSC_PORT")
+        if type(port) is int and 0 < port < 65536:
+            return port
+        return _default
 
-            print(Flag.Info.value + "getting OSC port has been completed")
+    def __get_host_info(self):
+        """
+        (PRIVATE) get HOST_INFO of VRChat client
+        :return: (Dictionary) HOST_INFO, None if it can't be read
+        """
+        try:
+            response = self.session.get(f"{self.vrchat_client._get_query_root()}/HOST_INFO", timeout=2)
+            if response.status_code == 200:
+                return response.json()
+        except (requests.exceptions.RequestException, ValueError):
+            pass
 
-    def __get_free_tcp_port(self):
+        return None
+
+    def __get_free_udp_port(self, _preferred: int = None):
+        """
+        (PRIVATE) set udp port
+        :param _preferred: [optional] (Int) port to use if it's free
+        :return: NONE
+        """
+        for port in ((_preferred, 0) if _preferred else (0,)):
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as udp_socket:
+                try:
+                    udp_socket.bind(('localhost', port))
+                except OSError:
+                    continue
+                self.osc_port = udp_socket.getsockname()[1]
+                break
+
+        print(Flag.Info.value + "getting OSC port has been completed")
+
+    def __get_free_tcp_port(self, _preferred: int = None):
         """
         (PRIVATE) set tcp port
+        :param _preferred: [optional] (Int) port to use if it's free
         :return: NONE
         """
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as tcp_socket:
-            tcp_socket.bind(('localhost', 0))
-            tcp_socket.listen(1)
-            port = tcp_socket.getsockname()[1]
-
-            self.http_port = port
-            print(Flag.Info.value + "getting TCP port has been completed")
+        for port in ((_preferred, 0) if _preferred else (0,)):
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as tcp_socket:
+                try:
+                    tcp_socket.bind(('localhost', port))
+                except OSError:
+                    continue
+                tcp_socket.listen(1)
+                self.http_port = tcp_socket.getsockname()[1]
+                break
+
+        print(Flag.Info.value + "getting TCP port has been completed")
 
     # <method that returns class variable>
     def get_osc_port(self) -> int:
@@ -119,7 +265,7 @@ class OSCQuery:
 
         try:
             while True:
-                response = requests.get(f"http://127.0.0.1:{self.vrchat_client_port}/avatar/change", timeout=5)
+                response = self.session.get(f"http://127.0.0.1:{self.vrchat_client_port}/avatar/change", timeout=5)
 
                 if response.status_code == 200:
                     json_data = response.json()
@@ -135,99 +281,68 @@ class OSCQuery:
 
     def get_avatar_prmt(self) -> dict:
         """
-        get current avatar's parameters
-        :return: (Dictionary) parameters
-        """
-        response = requests.get(f"http://127.0.0.1:{self.vrchat_client_port}/avatar/parameters")
-
-        if response.status_code == 200:
-            prmt = response.json()
-            return prmt
-    # </method that returns class variable>
+        get current avatar's bHaptics parameters
 
+        parameter nodes that known schema defines are queried concurrently.
+        if none of them is found, whole parameter tree is fetched once and filtered by prefix
+        :return: (Dictionary) parameters, None if they can't be fetched
+        """
+        try:
+            prmt = self.__query_known_prmt()
+        except requests.exceptions.RequestException as e:
+            print(Flag.Warn.value + f"Error while querying parameters: {e}")
+            prmt = None
 
-class Config:
-    CONFIG_VERSION = 2
-
-    def __init__(self):
-        # <NETWORK>
-        self.ip_addr: str = "127.0.0.1"
-        # </NETWORK>
+        if not prmt or not prmt["CONTENTS"]:
+            prmt = self.__fetch_filtered_prmt()
 
-        if self.load() == errno.ENOENT:
-            print(Flag.Info.value + "there's no config file. now create new one.")
-            self.save()
+        return prmt
 
-    def load(self, _file: str = "./config.json") -> int:
+    def __query_known_prmt(self) -> dict:
         """
-        load config file
-        :param _file: [optional] (String) file path that have setting value (json format)
-        :return: (Int) errno more information see this page https://docs.python.org/3/library/errno.html
+        (PRIVATE) query parameter nodes of known schema concurrently, PRMT_QUERY_WORKERS at once
+        :return: (Dictionary) parameters that avatar has
         """
-        try:
-            with open(_file, 'r', encoding='utf-8') as f:
-                raw = json.load(f)
+        url = f"http://127.0.0.1:{self.vrchat_client_port}/avatar/parameters/"
 
-                self.ip_addr = raw["NETWORK"]["ip"]
+        def query(name: str):
+            response = self.session.get(url + name, timeout=5)
+            if response.status_code == 200:
+                return name, response.json()
+            return name, None
 
-                if self.CONFIG_VERSION != raw["CONFIG_VERSION"]:
-                    print(Flag.Info.value + "Config file version is not match. Now create new one. \033")
-                    self.save()
+        with ThreadPoolExecutor(max_workers=PRMT_QUERY_WORKERS) as executor:
+            results = executor.map(query, known_parameter_names(self.layouts))
+            contents = {name: node for name, node in results if node is not None}
 
-                return 0
-        except IOError as e:
-            return e.errno
-        except KeyError:
-            print(Flag.Warn.value + "Config file is not correct format. Now create new one. \033")
-            self.save()
-        except Exception as e:
-            raise e
+        return {"FULL_PATH": "/avatar/parameters", "CONTENTS": contents}
 
-    def save(self, _file: str = "./config.json") -> int:
+    def __fetch_filtered_prmt(self) -> dict:
         """
-        create or update config file
-        :param _file: [optional] (String) file path that config file saved
-        :return: (Int) errno, You can get more information from this page https://docs.python.org/3/library/errno.html
+        (PRIVATE) fetch whole parameter tree and keep the parameters that have bHaptics prefix
+        :return: (Dictionary) parameters, None if they can't be fetched
         """
-
         try:
-            with open(_file, "w", encoding='utf-8') as f:
-                f.write(self.tojson())
-                print(Flag.Info.value + '**CONFIG DATA SAVE COMPLETE**')
-                return 0
-        except IOError as e:
-            return e.errno
-        except Exception as e:
-            print(e)
-            raise e
-
-    def tojson(self) -> str:
-        """
-        convert config class to json
-        :return: (String) convert class variable to json format string
-        """
-
-        d_net = {
-            "ip": self.ip_addr,
-        }
-
-        result = {
-            "CONFIG_VERSION": self.CONFIG_VERSION,
-            "NETWORK": d_net,
-        }
-
-        return json.dumps(result, sort_keys=False, indent=4)
+            response = self.session.get(f"http://127.0.0.1:{self.vrchat_client_port}/avatar/parameters", timeout=5)
+            if response.status_code != 200:
+                return None
+            prmt = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(Flag.Warn.value + f"Error while fetching parameters: {e}")
+            return None
 
-    def todict(self):
-        s_json: str = self.tojson()
-        return json.loads(s_json)
+        contents = prmt.get("CONTENTS", {})
+        prmt["CONTENTS"] = {name: node for name, node in contents.items() if name.startswith(PARAMETER_PREFIXES)}
+        return prmt
+    # </method that returns class variable>
 
 
 class AvatarConfig:
-    def __init__(self):
-        self.avatar_id = oscq.get_current_avatar()
+    def __init__(self, _oscq: OSCQuery):
+        self.oscq = _oscq
+        self.avatar_id = _oscq.get_current_avatar()
         self.avatar_name = self.__get_avatar_name()
-        self.avatar_prmt = oscq.get_avatar_prmt()
+        self.avatar_prmt = _oscq.get_avatar_prmt()
 
     def __get_avatar_name(self) -> str:
         """
@@ -246,15 +361,15 @@ class AvatarConfig:
                         avatar_name = raw['name']
                         return avatar_name
 
-    def update(self, _avatar_id: str):
+    def update(self, _avatar_id: str = None):
         """
         update avatarConfig
-        :param _avatar_id: (String) changed avatar id
+        :param _avatar_id: [optional] (String) changed avatar id, current avatar is queried if omitted
         :return: None
         """
-        self.avatar_id = _avatar_id
+        self.avatar_id = _avatar_id if _avatar_id is not None else self.oscq.get_current_avatar()
         self.avatar_name = self.__get_avatar_name()
-        self.avatar_prmt = oscq.get_avatar_prmt()
+        self.avatar_prmt = self.oscq.get_avatar_prmt()
 
     def get(self) -> tuple:
         """
@@ -269,44 +384,31 @@ class AvatarConfig:
 
 class Receiver:
     @staticmethod
-    def build_dispatcher():
+    def build_dispatcher(handler: HapticsHandler):
         """
         (STATIC) build dispatcher for receiver
 
+        :param handler: (HapticsHandler) handler that dispatcher calls
         :return: dispatcher object
         """
         d = dispatcher.Dispatcher()
 
-        handler = HapticsHandler(haptics_player)
-
         d.map("/avatar/change", handler.avi_changed_handler)
         d.map("/avatar/parameters/bHapticsOSC_reset", handler.reset_handler)
 
-        d.map("/avatar/parameters/bHapticsOSC_Head*", handler.head_handler)
-        d.map("/avatar/parameters/bHapticsOSC_Arm*", handler.arm_handler)
-        d.map("/avatar/parameters/bHapticsOSC_Hand*", handler.hand_handler)
-        d.map("/avatar/parameters/bHapticsOSC_Foot*", handler.foot_handler)
-        d.map("/avatar/parameters/bHapticsOSC_Glove*",handler.glove_handler)
-        d.map("/avatar/parameters/bHapticsOSC_Vest*", handler.vest_handler)
+        # motor parameters of every schema that device layouts define
+        for prefix in handler.layouts.parameters:
+            d.map(f"/avatar/parameters/{prefix}*", handler.motor_handler)
 
-        # <V1 Parameters>
-        d.map("/avatar/parameters/bOSC_v1_Vest*", handler.v1_vest_handler)
-        d.map("/avatar/parameters/bOSC_v1_Head*", handler.v1_head_handler)
-        d.map("/avatar/parameters/bOSC_v1_Forearm*", handler.v1_arm_handler)
-        #</V1 Parameters>
+        d.map("/avatar/parameters/bHapticsOSC_Pattern_*", handler.pattern_handler)
+        d.map("/avatar/parameters/bHapticsOSC_PatternAngle", handler.pattern_angle_handler)
 
         return d
 
-    def __init__(self, _dispatcher: dispatcher.Dispatcher, _ip: str = "127.0.0.1", _port: int = 9001):
+    def __init__(self, _router: FastOSCRouter, _ip: str = "127.0.0.1", _port: int = 9001):
         self.ip = _ip
         self.port = _port
-        self.dispatcher = _dispatcher
-
-        self.server = osc_server.AsyncIOOSCUDPServer(
-            (self.ip, self.port),
-            self.dispatcher,
-            asyncio.get_running_loop()
-        )
+        self.router = _router
 
         self.transport = None
         self.protocol = None
@@ -318,30 +420,227 @@ class Receiver:
         run receiver
         :return: transport
         """
-        self.transport, self.protocol = await self.server.create_serve_endpoint()
+        loop = asyncio.get_running_loop()
+        self.transport, self.protocol = await loop.create_datagram_endpoint(
+            lambda: FastOSCProtocol(self.router),
+            local_addr=(self.ip, self.port)
+        )
 
         return self.transport
 
 
+class ListenReceiver:
+    def __init__(self, _router: FastOSCRouter, _client: OSCQueryClient, _layouts: DeviceLayouts, _fallback=None):
+        """
+        Create receiver that subscribes bHaptics parameters with OSCQuery LISTEN extension.
+
+        lost stream is reopened after LISTEN_RETRY_DELAYS. if every retry fails, fallback receiver is started.
+        :param _router: (FastOSCRouter) router that handles received packets
+        :param _client: (OSCQueryClient) client of VRChat's OSCQuery service
+        :param _layouts: (DeviceLayouts) layouts whose parameters are subscribed
+        :param _fallback: [optional] coroutine function that starts other receiver and returns its transport
+        """
+        self.router = _router
+        self.client = _client
+        self.layouts = _layouts
+        self.fallback = _fallback
+        self.stream = None
+        # transport of fallback receiver
+        self.transport = None
+        self.closed = False
+        self.__dropped = None
+        self.__watcher = None
+
+    async def start(self):
+        """
+        open websocket and LISTEN to bHaptics parameters
+        :return: self, None if VRChat doesn't support LISTEN extension
+        """
+        self.__dropped = asyncio.Event()
+
+        if await self.__open() is None:
+            return None
+
+        self.__watcher = asyncio.create_task(self.__watch())
+        return self
+
+    def close(self):
+        """
+        close stream, or fallback receiver
+        :return: None
+        """
+        self.closed = True
+        if self.__watcher is not None:
+            self.__watcher.cancel()
+        if self.stream is not None:
+            self.stream.close()
+        if self.transport is not None:
+            self.transport.close()
+
+    async def __open(self):
+        """
+        (PRIVATE) open stream and LISTEN to bHaptics parameters
+        :return: stream, None if it can't be opened
+        """
+        loop = asyncio.get_running_loop()
+        client_address = (self.client._get_ip_str(), self.client.service_info.port)
+        dropped = self.__dropped
+
+        def on_packet(data: bytes):
+            # handlers are always called on event loop
+            loop.call_soon_threadsafe(self.router.handle_packet, data, client_address)
+
+        try:
+            stream = await loop.run_in_executor(None, self.client.open_listen_stream, on_packet, None,
+                                                lambda: loop.call_soon_threadsafe(dropped.set))
+        except Exception as e:
+            print(Flag.Warn.value + f"Error while opening LISTEN stream: {e}")
+            return None
+
+        if stream is None:
+            print(Flag.Warn.value + "VRChat doesn't answer or doesn't support LISTEN extension")
+            return None
+
+        try:
+            stream.listen("/avatar/change")
+            for name in known_parameter_names(self.layouts):
+                stream.listen("/avatar/parameters/" + name)
+        except Exception as e:
+            stream.close()
+            print(Flag.Warn.value + f"Error while subscribing parameters: {e}")
+            return None
+
+        self.stream = stream
+        print(Flag.Info.value + f"listening bHaptics parameters ({stream.url})")
+        return stream
+
+    async def __watch(self):
+        """
+        (PRIVATE) reopen stream whenever it is lost, start fallback receiver if it can't be reopened
+        """
+        while True:
+            await self.__dropped.wait()
+            self.__dropped.clear()
+            print(Flag.Warn.value + "LISTEN stream is lost, reconnecting...")
+
+            for delay in LISTEN_RETRY_DELAYS:
+                await asyncio.sleep(delay)
+                if await self.__open() is not None:
+                    break
+            else:
+                self.stream = None
+                if self.fallback is not None:
+                    print(Flag.Warn.value + "LISTEN stream can't be reopened, receiving parameters with UDP")
+                    self.transport = await self.fallback()
+                return
+
+
 class Sender:
     def __init__(self, _ip: str = "127.0.0.1", _port: int = 9000):
         """
         Create instance that Send OSC packet to server.
+
+        parameters are staged with queue() and sent together as one bundle by flush().
+        values that are same as last sent one are not sent again.
         :param _ip: (String) server ip address that send OSC packet
         :param _port: (Int) server ip port that send OSC packet
         """
-        self.client = udp_client.SimpleUDPClient(_ip, _port)
-        print(Flag.Info.value + f"Client has been created ({_ip}:{_port})")
+        self.ip = _ip
+        self.port = _port
+        self.transport = None
+
+        # full path -> value
+        self.pending = {}
+        self.last_sent = {}
 
-    def update(self, _ip: str, _port: int):
+    async def start(self):
+        """
+        open datagram transport
+        :return: transport
+        """
+        loop = asyncio.get_running_loop()
+        self.transport, _ = await loop.create_datagram_endpoint(
+            asyncio.DatagramProtocol,
+            remote_addr=(self.ip, self.port)
+        )
+        print(Flag.Info.value + f"Client has been created ({self.ip}:{self.port})")
+
+        return self.transport
+
+    async def update(self, _ip: str, _port: int):
         """
         Update client destination
         :param _ip: (String) server ip address that send OSC packet
         :param _port: (Int) server ip port that send OSC packet
         :return:
         """
-        self.client = udp_client.SimpleUDPClient(_ip, _port)
-        print(Flag.Info.value + f"Client has been updated ({_ip}:{_port})")
+        if self.transport is not None:
+            self.transport.close()
+
+        self.ip = _ip
+        self.port = _port
+        self.last_sent.clear()
+        await self.start()
+
+    def invalidate(self):
+        """
+        forget last sent values, so that next flush() sends every staged parameter.
+        avatar that was just loaded doesn't have values that were sent to previous one
+        :return: None
+        """
+        self.last_sent.clear()
+
+    def close(self):
+        """
+        close datagram transport
+        :return: None
+        """
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+    def queue(self, ctx, prmt: str, path: str = "/avatar/parameters/"):
+        """
+        stage parameter to be sent with next flush()
+        :param ctx: context to send
+        :param prmt: VRC parameter name
+        :param path: (Optional) parameter path
+        """
+        self.pending[path + prmt] = ctx
+
+    def flush(self) -> int:
+        """
+        send every staged parameter that changed, packed into OSC bundles
+        :return: (Int) number of sent parameters
+        """
+        changed = [(path, ctx) for path, ctx in self.pending.items()
+                   if path not in self.last_sent or self.last_sent[path] != ctx
+                   or type(self.last_sent[path]) is not type(ctx)]
+        self.pending.clear()
+
+        if not changed or self.transport is None:
+            return 0
+
+        bundle = osc_bundle_builder.OscBundleBuilder(osc_bundle_builder.IMMEDIATELY)
+        size = 0
+
+        for path, ctx in changed:
+            builder = osc_message_builder.OscMessageBuilder(path)
+            builder.add_arg(ctx)
+            message = builder.build()
+
+            if size + message.size > MAX_BUNDLE_SIZE:
+                self.transport.sendto(bundle.build().dgram)
+                bundle = osc_bundle_builder.OscBundleBuilder(osc_bundle_builder.IMMEDIATELY)
+                size = 0
+
+            bundle.add_content(message)
+            size += message.size + 4
+            self.last_sent[path] = ctx
+
+        self.transport.sendto(bundle.build().dgram)
+
+        return len(changed)
 
     async def send(self, ctx, prmt: str, path: str = "/avatar/parameters/", print_info: bool = True):
         """
@@ -351,42 +650,705 @@ class Sender:
         :param path: (Optional) parameter path
         :param print_info (Optional) print info or not
         """
-        full_path = path + prmt
-        self.client.send_message(full_path, ctx)
+        self.queue(ctx, prmt, path)
+        self.flush()
 
         if print_info:
             print(Flag.Info.value + f"SEND COMPLETE prm: {prmt} - ctx: ({type(ctx)}) {ctx}")
 
 
-async def loop():
-    print(Flag.Info.value + "START SENDING")
+async def in_daemon_thread(_func, *_args):
+    """
+    call blocking function in new daemon thread
+    :param _func: callable
+    :param _args: arguments of callable
+    :return: result of callable
+    """
+    loop_ = asyncio.get_running_loop()
+    future = loop_.create_future()
 
-    while True:
-        for pos in BhapticsPosition:
-            haptics_player.sumit_dot(pos)
+    def resolve(_setter, _value):
+        if not future.done():
+            _setter(_value)
 
-        await asyncio.sleep(0.1)
+    def target():
+        try:
+            result = _func(*_args)
+        except BaseException as e:
+            loop_.call_soon_threadsafe(resolve, future.set_exception, e)
+        else:
+            loop_.call_soon_threadsafe(resolve, future.set_result, result)
 
-async def main():
-    d = Receiver.build_dispatcher()
-    receiver = Receiver(d, config.ip_addr, oscq.get_osc_port())
-    transport = await receiver.start()
+    threading.Thread(target=target, daemon=True).start()
+    return await future
 
-    await asyncio.gather(loop())
 
-    transport.close()
+class BridgeSession:
+    def __init__(self, _config: Config, _layouts: DeviceLayouts, _profiler: ProfileController,
+                 _claimed: set = None, _zeroconf=None, _app_id: str = APP_ID):
+        """
+        One bridge between a VRChat client and an output backend.
+
+        every session has its own OSC port, OSCQuery service, haptics state and output connection,
+        so several sessions can share one event loop without sharing state.
+        :param _config: (Config) config of session
+        :param _layouts: (DeviceLayouts) device layouts, read only and shared between sessions
+        :param _profiler: (ProfileController) profiler of process
+        :param _claimed: [optional] (Set) ports of VRChat clients served by sessions of this process
+        :param _zeroconf: [optional] (Zeroconf) instance shared by sessions of this process
+        :param _app_id: [optional] (String) application id for bHaptics Player
+        """
+        self.config = _config
+        self.layouts = _layouts
+        self.profiler = _profiler
+        self.claimed = _claimed
+        self.zeroconf = _zeroconf
+        self.app_id = _app_id
+        self.name = _config.service_name
+        # spans of this session only, configured by its TRACE section
+        self.tracer = Tracer()
+
+        self.metrics = MetricsRegistry()
+        self.backend = None
+        self.haptics_player = None
+        self.pattern_library = None
+        self.haptics_handler = None
+        self.shared_state = None
+        self.live_state = None
+        self.oscq = None
+        # parameters of current avatar, loaded on its own thread
+        self.avatar = None
+        self.avatar_lock = threading.Lock()
+        # set while session runs, loaded parameter values are applied through them
+        self.event_loop = None
+        self.router = None
+
+    async def publish_status(self, _sender: Sender, _router: FastOSCRouter):
+        """
+        publish bridge status to avatar parameters at capped rate
+        :param _sender: (Sender) sender to VRChat
+        :param _router: (FastOSCRouter) router whose queue is watched for overload
+        """
+        await _sender.start()
+        last_dropped = 0
+        backend = self.backend
 
-if __name__ == '__main__':
-    app_id = "per.Guideung.bHapticsOSCQ"
-    app_name = "bHapticsOSCQ"
-    show_log: bool = True
+        try:
+            while True:
+                stats = backend.get_send_stats()
+                dropped = stats["stale"] + (_router.queue.overflow if _router.queue is not None else 0)
+
+                for pos in BhapticsPosition:
+                    _sender.queue(pos.value in backend.connected_positions, STATUS_PREFIX + "Connected_" + pos.value)
+                _sender.queue(min(len(backend.active_keys), 255), STATUS_PREFIX + "ActiveKeys")
+                _sender.queue(dropped > last_dropped, STATUS_PREFIX + "Overload")
+                _sender.flush()
 
-    config = Config()
+                last_dropped = dropped
+                await asyncio.sleep(1 / self.config.status_rate)
+        finally:
+            _sender.close()
+
+    def load_avatar(self, _avatar_id: str = None) -> None:
+        """
+        query bHaptics parameters of current avatar and report them.
+        blocks on VRChat's OSCQuery server, so it runs on its own thread
+        :param _avatar_id: [optional] (String) id sent with /avatar/change, current avatar is queried if omitted
+        """
+        with self.avatar_lock:
+            if self.avatar is None:
+                self.avatar = AvatarConfig(self.oscq)
+            else:
+                self.avatar.update(_avatar_id)
+            avatar_id, avatar_name, prmt = self.avatar.get()
+
+        count = len(prmt["CONTENTS"]) if prmt else 0
+        if count:
+            print(Flag.Info.value + f"avatar {avatar_name or avatar_id} has {count} bHaptics parameters")
+        else:
+            print(Flag.Warn.value + f"avatar {avatar_name or avatar_id} has no bHaptics parameters")
+
+        if count and self.event_loop is not None:
+            self.event_loop.call_soon_threadsafe(self.apply_avatar_prmt, prmt["CONTENTS"])
+
+    def apply_avatar_prmt(self, _contents: dict) -> None:
+        """
+        set actuators to values of loaded motor parameters, so state matches avatar without waiting for changes.
+        control parameters are skipped, their value is a trigger and not a state
+        :param _contents: (Dictionary) parameter name -> OSCQuery node
+        """
+        if self.router is None:
+            return
 
-    haptics_player = HapticsPlayer(app_id, app_name)
-    oscq = OSCQuery()
+        motors = set(self.layouts.parameter_names())
+        with self.haptics_player.transaction():
+            for name, node in _contents.items():
+                value = node.get("VALUE") if isinstance(node, dict) else None
+                if name in motors and value:
+                    self.router.dispatch(f"/avatar/parameters/{name}", tuple(value), None)
 
+    def avatar_changed_handler(self, _addr, *_args):
+        """
+        reload parameters of avatar on /avatar/change without blocking event loop
+        """
+        avatar_id = _args[0] if _args and isinstance(_args[0], str) else None
+        threading.Thread(target=self.load_avatar, args=(avatar_id,), daemon=True).start()
+
+    def register_metrics(self, _router: FastOSCRouter) -> None:
+        """
+        register metrics of session. counters kept by each part are read only when metrics are scraped
+        :param _router: (FastOSCRouter) router of received packets
+        """
+        registry = self.metrics
+        haptics_handler = self.haptics_handler
+        backend = self.backend
+
+        def received_by_family() -> dict:
+            received = dict(haptics_handler.matched)
+            for family, count in list(haptics_handler.ignored.items()):
+                received[family] = received.get(family, 0) + count
+            return received
+
+        def position_stat(key: str) -> dict:
+            return {position: stats[key] for position, stats in list(backend.position_stats.items())}
+
+        registry.collect("packets_received_total", "OSC packets received", "counter", lambda: _router.received)
+        registry.collect("packets_ignored_total", "OSC packets dropped by address prefix", "counter",
+                         lambda: _router.ignored)
+        registry.collect("messages_received_total", "motor parameters received per device", "counter",
+                         received_by_family, ("family",))
+        registry.collect("messages_matched_total", "motor parameters mapped to motor per device", "counter",
+                         lambda: dict(haptics_handler.matched), ("family",))
+        registry.collect("messages_ignored_total", "motor parameters out of layout per device", "counter",
+                         lambda: dict(haptics_handler.ignored), ("family",))
+        registry.collect("handler_errors_total", "exceptions raised by OSC handlers", "counter",
+                         lambda: _router.errors)
+        registry.collect("packets_fallback_total", "OSC messages decoded by pythonosc instead of fast path", "counter",
+                         lambda: _router.fallback)
+        registry.collect("bundles_received_total", "OSC bundles received", "counter", lambda: _router.bundles)
+        registry.collect("packets_malformed_total", "OSC messages and bundles dropped because they can't be decoded",
+                         "counter", lambda: _router.malformed)
+        if _router.queue is not None:
+            queue = _router.queue
+            registry.collect("queue_overflow_total", "messages that didn't fit in inbound queue", "counter",
+                             lambda: queue.overflow)
+            registry.collect("queue_collapsed_total", "messages replaced by newer one of same address before drain",
+                             "counter", lambda: queue.collapsed)
+            registry.collect("queue_drained_total", "messages handed from inbound queue to handlers", "counter",
+                             lambda: queue.drained)
+            registry.collect("queue_pending", "messages waiting in inbound queue", "gauge",
+                             lambda: queue.stats()["pending"])
+        registry.collect("updates_absorbed_total", "motor updates absorbed by quantization and hysteresis", "counter",
+                         lambda: self.haptics_player.absorbed)
+
+        registry.collect("frames_submitted_total", "frames submitted to output backend per position", "counter",
+                         lambda: position_stat("submitted"), ("position",))
+        registry.collect("frames_sent_total", "frames sent to output backend per position", "counter",
+                         lambda: position_stat("sent"), ("position",))
+        registry.collect("bytes_sent_total", "bytes of frames sent to output backend per position", "counter",
+                         lambda: position_stat("bytes"), ("position",))
+        registry.collect("frames_stale_total", "frames dropped because they were too late", "counter",
+                         lambda: backend.send_stats["stale"])
+        registry.collect("frames_superseded_total", "queued frames replaced by newer frame of same key", "counter",
+                         lambda: backend.send_stats["superseded"])
+        registry.collect("requests_dropped_total", "requests dropped because send queue was full or connection was lost",
+                         "counter", lambda: backend.send_stats["dropped"])
+        registry.collect("send_blocked_seconds_total", "time send thread spent blocked in socket send", "counter",
+                         lambda: backend.send_stats["blocked_seconds"])
+        registry.collect("send_max_blocked_seconds", "longest single blocked socket send", "gauge",
+                         lambda: backend.send_stats["max_blocked_seconds"])
+        registry.collect("send_queue_depth", "frames and requests waiting to be sent", "gauge",
+                         lambda: backend.get_send_stats()["queue_depth"])
+        registry.collect("player_reconnects_total", "reconnections to bHaptics Player", "counter",
+                         lambda: max(backend.connection_id - 1, 0))
+        registry.collect("connected_devices", "devices connected to bHaptics Player", "gauge",
+                         lambda: len(backend.connected_positions))
+        registry.collect("device_connected", "whether position is connected to bHaptics Player", "gauge",
+                         lambda: {pos.value: int(pos.value in backend.connected_positions) for pos in BhapticsPosition},
+                         ("position",))
+        registry.collect("live_subscribers", "subscribers of live state stream", "gauge",
+                         lambda: self.live_state.subscribers)
+
+    def start_profile(self, _mode: str = None, _seconds: float = None) -> bool:
+        """
+        start profiling window with PROFILING section of config
+        :param _mode: [optional] (String) profile mode, config value if omitted
+        :param _seconds: [optional] (Float) length of window, config value if omitted
+        :return: (Bool) False if profiling is already running
+        """
+        config = self.config
+        self.profiler.directory = config.profile_dir
+        return self.profiler.start(_mode or config.profile_mode, _seconds or config.profile_seconds,
+                                   config.profile_interval_ms / 1000)
+
+    def add_debug_route(self, _path: str, _callback) -> None:
+        """
+        serve debug path from OSCQuery server to clients that NETWORK.debug_routes allows.
+        OSCQuery server listens on every interface, so by default only local clients are served
+        :param _path: (String) request path
+        :param _callback: callable called with request handler
+        """
+        def on_request(request):
+            mode = self.config.debug_routes
+            if mode == "off":
+                request.send_body(404, "text/plain", b"debug routes are disabled\n")
+                return
+            if mode == "local" and not ipaddress.ip_address(request.client_address[0]).is_loopback:
+                request.send_body(403, "text/plain", b"debug routes are only served to local clients\n")
+                return
+            _callback(request)
+
+        self.oscq.oscQueryService.add_route(_path, on_request)
+
+    def install_profile_triggers(self, _dispatcher: dispatcher.Dispatcher) -> None:
+        """
+        let profiling be started by HTTP request to OSCQuery server and debug avatar parameter
+        :param _dispatcher: dispatcher of received parameters
+        """
+        def on_request(request):
+            query = parse_qs(urlsplit(request.path).query)
+            try:
+                seconds = float(query["seconds"][0]) if "seconds" in query else None
+                started = self.start_profile(query.get("mode", [None])[0], seconds)
+            except ValueError as e:
+                request.send_body(400, "text/plain", str(e).encode("utf-8"))
+                return
+
+            if started:
+                request.send_body(202, "text/plain", b"profiling started\n")
+            else:
+                request.send_body(409, "text/plain", b"profiling is already running\n")
+
+        self.add_debug_route(PROFILE_PATH, on_request)
+        _dispatcher.map(PROFILE_PARAMETER, lambda _addr, *_args: _args and _args[0] and self.start_profile())
+
+    def dump_trace(self) -> None:
+        """
+        write spans of tracer to Chrome Trace Event JSON file in profile directory
+        """
+        path = os.path.join(self.config.profile_dir, time.strftime(f"trace-{self.name}-%Y%m%d-%H%M%S.json"))
+        self.tracer.dump(path)
+        print(Flag.Info.value + f"trace is written to {path}")
+
+    def install_trace_triggers(self, _dispatcher: dispatcher.Dispatcher) -> None:
+        """
+        let trace be downloaded from OSCQuery server and dumped by debug avatar parameter
+        :param _dispatcher: dispatcher of received parameters
+        """
+        self.add_debug_route(
+            TRACE_PATH, lambda request: request.send_body(200, "application/json", self.tracer.dumps().encode("utf-8")))
+        _dispatcher.map(TRACE_PARAMETER, lambda _addr, *_args: _args and _args[0] and self.dump_trace())
+
+    def dump_stats(self) -> None:
+        """
+        write actuator statistics as JSON, CSV and heatmap of every device to profile directory
+        """
+        stats = self.haptics_player.stats
+        directory = self.config.profile_dir
+        base = os.path.join(directory, time.strftime(f"stats-{self.name}-%Y%m%d-%H%M%S"))
+        os.makedirs(directory, exist_ok=True)
+
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            f.write(stats.to_json())
+        with open(base + ".csv", "w", encoding="utf-8") as f:
+            f.write(stats.to_csv())
+        for device in sorted(set(self.layouts.families.values())):
+            with open(f"{base}-{device.replace(' ', '_')}.svg", "w", encoding="utf-8") as f:
+                f.write(stats.heatmap(self.layouts, device))
+
+        print(Flag.Info.value + f"actuator statistics are written to {base}.*")
+
+    def install_stats_triggers(self, _dispatcher: dispatcher.Dispatcher) -> None:
+        """
+        serve actuator statistics from OSCQuery server and dump them by debug avatar parameter
+
+        /stats.json, /stats.csv and /stats.svg?device=<device name>&metric=<metric>
+        :param _dispatcher: dispatcher of received parameters
+        """
+        stats = self.haptics_player.stats
+
+        def on_heatmap(request):
+            query = parse_qs(urlsplit(request.path).query)
+            try:
+                body = stats.heatmap(self.layouts, query.get("device", ["TactSuit"])[0],
+                                     query.get("metric", ["on_time"])[0])
+            except ValueError as e:
+                request.send_body(400, "text/plain", str(e).encode("utf-8"))
+                return
+            request.send_body(200, "image/svg+xml", body.encode("utf-8"))
+
+        self.add_debug_route(
+            STATS_PATH + ".json", lambda request: request.send_body(200, "application/json", stats.to_json().encode("utf-8")))
+        self.add_debug_route(
+            STATS_PATH + ".csv", lambda request: request.send_body(200, "text/csv", stats.to_csv().encode("utf-8")))
+        self.add_debug_route(STATS_PATH + ".svg", on_heatmap)
+        _dispatcher.map(STATS_PARAMETER, lambda _addr, *_args: _args and _args[0] and self.dump_stats())
+
+    async def loop(self, _router: FastOSCRouter):
+        print(Flag.Info.value + f"START SENDING ({self.name})")
+        haptics_player = self.haptics_player
+
+        changed = asyncio.Event()
+        haptics_player.add_listener(changed.set)
+        if _router.queue is not None:
+            _router.queue.add_listener(changed.set)
+        loop_ = asyncio.get_running_loop()
+        next_tick = loop_.time()
+
+        tick_seconds = self.metrics.histogram("tick_seconds", "time spent on one output loop iteration")
+        tick_overruns = self.metrics.counter("tick_overruns_total", "output loop iterations longer than frame interval")
+
+        while True:
+            start = time.perf_counter()
+            span = self.tracer.start()
+            config = self.config
+
+            if _router.queue is not None:
+                with haptics_player.transaction():
+                    _router.queue.drain(_router.dispatch)
+
+            moving = haptics_player.update()
+            now = loop_.time()
+
+            if now >= next_tick:
+                # refresh every position before previous frame ends
+                haptics_player.take_dirty()
+                for pos in BhapticsPosition:
+                    haptics_player.submit(pos, config.frame_duration)
+                next_tick = now + 1 / config.tick_rate
+            else:
+                # send changed positions without waiting for next tick
+                for pos in haptics_player.take_dirty():
+                    haptics_player.submit(BhapticsPosition(pos), config.frame_duration)
+
+            elapsed = time.perf_counter() - start
+            tick_seconds.observe(elapsed)
+            if elapsed > MIN_FRAME_INTERVAL:
+                tick_overruns.inc()
+                self.tracer.instant("tick.overrun", {"seconds": elapsed, "session": self.name})
+            if span:
+                self.tracer.end("tick", span, {"session": self.name})
+
+            changed.clear()
+            timeout = MIN_FRAME_INTERVAL if moving else next_tick - loop_.time()
+            try:
+                await asyncio.wait_for(changed.wait(), timeout)
+                await asyncio.sleep(MIN_FRAME_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    def share_state(self, _enabled: bool, _name: str):
+        """
+        start, stop or rename shared memory export of actuator levels
+        :param _enabled: (Bool) export levels
+        :param _name: (String) name of shared memory block
+        """
+        haptics_player = self.haptics_player
+
+        if self.shared_state is not None:
+            haptics_player.level_listeners.remove(self.shared_state.publish)
+            self.shared_state.close()
+            self.shared_state = None
+
+        if not _enabled:
+            return
+
+        try:
+            self.shared_state = SharedStateWriter(haptics_player.envelope.offsets, self.config.expand(_name))
+        except (OSError, ValueError) as e:
+            print(Flag.Warn.value + f"can't share actuator state as {self.config.expand(_name)}: {e}")
+            return
+        self.shared_state.publish(haptics_player.envelope.level)
+        haptics_player.level_listeners.append(self.shared_state.publish)
+
+    def apply_config(self, _new: Config, _old: Config = None):
+        """
+        apply config to running session. only changed parts are recompiled.
+        curves are compiled before anything is swapped in, so session is left as it was if it raises
+        :param _new: (Config) config to apply
+        :param _old: [optional] (Config) config applied before
+        """
+        haptics_player = self.haptics_player
+
+        haptics_player.curves.configure(_new.curves)
+        self.config = _new
+        haptics_player.envelope.configure(_new.attack_ms, _new.hold_ms, _new.decay_ms, _new.timeout_ms)
+        haptics_player.output_mode = _new.output_mode
+        haptics_player.path_max_density = _new.path_max_density
+        haptics_player.path_max_points = _new.path_max_points
+        haptics_player.enabled = set(_new.enabled_devices)
+        self.haptics_handler.show_log = _new.log_level == "debug"
+        self.tracer.configure(_new.trace_enabled, _new.trace_capacity)
+
+        if _old is None or (_new.shared_enabled, _new.shared_name) != (_old.shared_enabled, _old.shared_name):
+            self.share_state(_new.shared_enabled, _new.shared_name)
+
+        if _old is not None:
+            if (_new.input_mode, _new.honor_timetag, _new.record_file, _new.ip_addr) != \
+                    (_old.input_mode, _old.honor_timetag, _old.record_file, _old.ip_addr):
+                print(Flag.Warn.value + "NETWORK and INPUT changes are applied after restart")
+            if (_new.output_backends, _new.frame_file, _new.player_url) != \
+                    (_old.output_backends, _old.frame_file, _old.player_url):
+                print(Flag.Warn.value + "OUTPUT.backends and OUTPUT.frame_file changes are applied after restart")
+
+    async def start(self):
+        """
+        connect output backend, load patterns and find VRChat client.
+        blocking parts run in executor, so other sessions on same event loop keep running
+        """
+        loop_ = asyncio.get_running_loop()
+        config = self.config
+
+        self.backend = await loop_.run_in_executor(
+            None, create_backend, config.output_backends, self.app_id, self.name, config.expand(config.frame_file),
+            config.player_url, self.tracer)
+        self.haptics_player = HapticsPlayer(self.backend, self.layouts, self.tracer)
+        self.pattern_library = PatternLibrary(self.backend)
+        await loop_.run_in_executor(None, self.pattern_library.load)
+        self.pattern_library.register_all()
+        self.haptics_handler = HapticsHandler(self.haptics_player, pattern_library=self.pattern_library)
+        self.live_state = LiveState(self.haptics_player.envelope.offsets)
+
+        # waiting for VRChat must not keep process alive on exit, so it doesn't run in executor
+        cache = DiscoveryCache(config.expand(config.discovery_cache)) if config.discovery_cache else None
+        self.oscq = await in_daemon_thread(OSCQuery, self.layouts, self.name, config.vrchat_client, self.claimed,
+                                           self.zeroconf, cache)
+
+    async def run(self):
+        transport = None
+        recorder = None
+        tasks = []
+
+        try:
+            await self.start()
+            config = self.config
+
+            self.apply_config(config)
+            watcher = ConfigWatcher(config)
+            watcher.add_listener(self.apply_config)
+
+            recorder = OSCRecorder(time.strftime(config.expand(config.record_file))) if config.record_file else None
+
+            status_sender = None
+            if config.status_enabled:
+                # STATUS.port is only used when VRChat doesn't tell its OSC port
+                status_sender = Sender(config.ip_addr, self.oscq.get_vrchat_osc_port(config.status_port))
+
+            d = Receiver.build_dispatcher(self.haptics_handler)
+            d.map("/avatar/change", self.avatar_changed_handler)
+            if status_sender is not None:
+                d.map("/avatar/change", lambda _addr, *_args: status_sender.invalidate())
+            self.install_profile_triggers(d)
+            self.install_trace_triggers(d)
+            self.install_stats_triggers(d)
+            router = FastOSCRouter(d, _transaction=self.haptics_player.transaction,
+                                   _honor_timetag=config.honor_timetag, _queue=CoalescingQueue(), _recorder=recorder,
+                                   _tracer=self.tracer)
+
+            service = self.oscq.oscQueryService
+            self.register_metrics(router)
+            service.add_route(METRICS_PATH, lambda request: request.send_body(
+                200, CONTENT_TYPE, self.metrics.render().encode("utf-8")))
+            self.haptics_player.level_listeners.append(self.live_state.publish)
+            self.add_debug_route(LIVE_PATH, self.live_state.serve)
+
+            self.event_loop = asyncio.get_running_loop()
+            self.router = router
+            threading.Thread(target=self.load_avatar, daemon=True).start()
+
+            receiver = Receiver(router, config.ip_addr, self.oscq.get_osc_port())
+            if config.input_mode == "websocket":
+                transport = await ListenReceiver(router, self.oscq.vrchat_client, self.layouts, receiver.start).start()
+
+            if transport is None:
+                transport = await receiver.start()
+
+            tasks = [asyncio.create_task(self.loop(router)), asyncio.create_task(watcher.run())]
+            if status_sender is not None:
+                tasks.append(asyncio.create_task(self.publish_status(status_sender, router)))
+
+            await asyncio.gather(*tasks)
+        finally:
+            # gather doesn't cancel the others when one fails, they would keep driving closed player
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.router = None
+            if transport is not None:
+                transport.close()
+            if recorder is not None:
+                recorder.close()
+            if self.haptics_player is not None:
+                self.share_state(False, self.config.shared_name)
+            if self.backend is not None:
+                self.backend.close()
+            if self.oscq is not None:
+                if self.claimed is not None:
+                    self.claimed.discard(self.oscq.vrchat_client_port)
+                await asyncio.get_running_loop().run_in_executor(None, self.oscq.close)
+
+
+class BridgeSupervisor:
+    def __init__(self, _config_files: list):
+        """
+        Run one session per config file on one event loop and restart sessions that fail.
+
+        sessions don't share state, so failure or stall of one output connection doesn't reach the others.
+        :param _config_files: (List) config file of every session
+        """
+        self.configs = BridgeSupervisor.load_configs(_config_files)
+        self.layouts = DeviceLayouts()
+        self.profiler = ProfileController(self.configs[0].profile_dir)
+        # VRChat client ports that sessions serve
+        self.claimed = set()
+        # zeroconf of every session, runs on event loop
+        self.zeroconf = None
+        self.sessions = []
+
+    @staticmethod
+    def load_configs(_config_files: list) -> list:
+        """
+        read config of every session and check that names and files only one session may use are not shared
+        :param _config_files: (List) config file of every session
+        :return: (List) Config of every file
+        """
+        if len(_config_files) == 1:
+            configs = [Config(_config_files[0])]
+        else:
+            # defaults written over broken file would take name of another session, so broken file stops start
+            configs = []
+            for file in _config_files:
+                try:
+                    configs.append(Config.read(file))
+                except (IOError, KeyError, TypeError, ValueError) as e:
+                    raise ValueError(f"config file {file} can't be used: {e!r}") from e
+
+        # (setting, value) -> config file
+        owners = {}
+        for config in configs:
+            resources = [("NETWORK.name", config.service_name)]
+            if config.shared_enabled:
+                resources.append(("SHARED_STATE.name", config.expand(config.shared_name)))
+            if "file" in config.output_backends:
+                resources.append(("OUTPUT.frame_file", config.expand(config.frame_file)))
+            if config.record_file:
+                resources.append(("INPUT.record_file", config.expand(config.record_file)))
+            if config.discovery_cache:
+                resources.append(("NETWORK.discovery_cache", config.expand(config.discovery_cache)))
+
+            for resource in resources:
+                if resource in owners:
+                    raise ValueError(f"{resource[0]} {resource[1]} of {config.file} is used by {owners[resource]}")
+                owners[resource] = config.file
+
+        return configs
+
+    @staticmethod
+    def check_workers(_configs: list) -> None:
+        """
+        check that sessions can be spread over processes.
+        claimed VRChat clients are only known inside one process, so every session must name its own client
+        :param _configs: (List) Config of every session
+        :return: None
+        """
+        for config in _configs:
+            for other in _configs:
+                # vrchat_client is matched as part of service name
+                if other is not config and config.vrchat_client in other.vrchat_client:
+                    raise ValueError(f"NETWORK.vrchat_client {config.vrchat_client} of {config.file} also matches "
+                                     f"{other.vrchat_client} of {other.file}, which can't be told apart across workers")
+
+    async def supervise(self, _config: Config):
+        """
+        run session of config, starting new one after RESTART_DELAY when it fails
+        :param _config: (Config) config of session
+        """
+        while True:
+            session = BridgeSession(_config, self.layouts, self.profiler, self.claimed, self.zeroconf.zeroconf)
+            self.sessions.append(session)
+            try:
+                await session.run()
+                return
+            except Exception as e:
+                print(Flag.Warn.value + f"session {session.name} stopped ({e!r}), restarting in {RESTART_DELAY} seconds")
+            finally:
+                self.sessions.remove(session)
+                _config = session.config
+            await asyncio.sleep(RESTART_DELAY)
+
+    def start_profile(self) -> bool:
+        if not self.sessions:
+            return False
+        return self.sessions[0].start_profile()
+
+    async def run(self):
+        loop_ = asyncio.get_running_loop()
+        # cProfile mode profiles event loop thread
+        self.profiler.loop = loop_
+
+        # profiler takes locks, so it's started on event loop and never inside signal handler
+        if hasattr(signal, "SIGUSR1"):
+            loop_.add_signal_handler(signal.SIGUSR1, self.start_profile)
+        elif hasattr(signal, "SIGBREAK"):
+            # SIGBREAK (Ctrl+Break) on Windows, whose event loop has no add_signal_handler
+            signal.signal(signal.SIGBREAK, lambda _signum, _frame: loop_.call_soon_threadsafe(self.start_profile))
+
+        self.zeroconf = AsyncZeroconf()
+        try:
+            await asyncio.gather(*(self.supervise(config) for config in self.configs))
+        finally:
+            await self.zeroconf.async_close()
+
+
+def run_sessions(_config_files: list):
+    """
+    run supervisor of given config files until interrupted
+    :param _config_files: (List) config file of every session
+    """
+    try:
+        asyncio.run(BridgeSupervisor(_config_files).run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+
+    parser = argparse.ArgumentParser(description="bridge VRChat avatar parameters to bHaptics devices")
+    parser.add_argument("configs", nargs="*", default=[CONFIG_FILE],
+                        help="config file of every session, one session per file")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of processes that sessions are spread over")
+    args = parser.parse_args()
+
+    workers = max(1, min(args.workers, len(args.configs)))
+    if workers == 1:
+        run_sessions(args.configs)
+        sys.exit(0)
+
+    # every worker only sees its own configs, so they are checked together before forking
+    BridgeSupervisor.check_workers(BridgeSupervisor.load_configs(args.configs))
+
+    processes = [multiprocessing.Process(target=run_sessions, args=(args.configs[i::workers],), name=f"worker-{i}")
+                 for i in range(workers)]
+    for process in processes:
+        process.start()
+
+    # profile signal is meant for sessions. without handler it would stop this process
+    def forward(_signum, _frame):
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, _signum)
+
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, forward)
+    elif hasattr(signal, "SIGBREAK"):
+        # Ctrl+Break already reaches every worker of console
+        signal.signal(signal.SIGBREAK, signal.SIG_IGN)
     try:
-        asyncio.run(main())
+        for process in processes:
+            process.join()
     except KeyboardInterrupt:
-        sys.exit(0)
\ No newline at end of file
+        for process in processes:
+            process.join()
+    sys.exit(0)
@@ -5,7 +5,7 @@ a = Analysis(
     ['main.py'],
     pathex=[],
     binaries=[],
-    datas=[],
+    datas=[('layouts', 'layouts')],
     hiddenimports=['zeroconf._utils.ipaddress', 'zeroconf._handlers.answers', 'zeroconf'],
     hookspath=[],
     hooksconfig={},
@@ -0,0 +1,211 @@
+from bisect import bisect_left
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# default buckets of histogram in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25)
+
+
+def format_labels(_names: tuple, _values: tuple) -> str:
+    """
+    format label set of sample
+    :param _names: (Tuple) label names
+    :param _values: (Tuple) label values
+    :return: (String) {name="value",...} or empty string
+    """
+    if not _names:
+        return ""
+
+    pairs = []
+    for name, value in zip(_names, _values):
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def format_value(_value) -> str:
+    if _value == float("inf"):
+        return "+Inf"
+    if type(_value) is bool:
+        return "1" if _value else "0"
+    return repr(_value) if type(_value) is float else str(_value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, _name: str, _help: str, _labels: tuple = ()):
+        """
+        Value that only goes up.
+
+        inc() is a plain addition, so every child must be updated from one thread only.
+        :param _name: (String) metric name
+        :param _help: (String) description
+        :param _labels: [optional] (Tuple) label names
+        """
+        self.name = _name
+        self.help = _help
+        self.label_names = _labels
+        self.value = 0
+        # label values -> child
+        self.children = {}
+
+    def labels(self, *_values):
+        """
+        get child of label values, created on first use
+        :return: child with same interface
+        """
+        child = self.children.get(_values)
+        if child is None:
+            child = self.__class__(self.name, self.help)
+            self.children[_values] = child
+        return child
+
+    def inc(self, _amount=1) -> None:
+        self.value += _amount
+
+    def samples(self) -> list:
+        """
+        get samples of metric
+        :return: (List) (suffix, label names, label values, value)
+        """
+        if not self.label_names:
+            return [("", (), (), self.value)]
+        return [("", self.label_names, values, child.value) for values, child in list(self.children.items())]
+
+
+class Gauge(Counter):
+    """
+    Value that goes up and down.
+    """
+    kind = "gauge"
+
+    def set(self, _value) -> None:
+        self.value = _value
+
+    def dec(self, _amount=1) -> None:
+        self.value -= _amount
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, _name: str, _help: str, _buckets: tuple = DEFAULT_BUCKETS):
+        """
+        Distribution of observed values in fixed buckets.
+
+        :param _name: (String) metric name
+        :param _help: (String) description
+        :param _buckets: [optional] (Tuple) upper bounds of buckets, in ascending order
+        """
+        self.name = _name
+        self.help = _help
+        self.bounds = tuple(_buckets)
+        # count of each bucket (not cumulative), last one is +Inf
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, _value) -> None:
+        self.counts[bisect_left(self.bounds, _value)] += 1
+        self.sum += _value
+        self.count += 1
+
+    def samples(self) -> list:
+        """
+        get samples of metric
+        :return: (List) (suffix, label names, label values, value)
+        """
+        result = []
+        total = 0
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            total += count
+            result.append(("_bucket", ("le",), (format_value(bound),), total))
+
+        result.append(("_sum", (), (), self.sum))
+        result.append(("_count", (), (), self.count))
+        return result
+
+
+class Collected:
+    def __init__(self, _name: str, _help: str, _kind: str, _collect, _labels: tuple = ()):
+        """
+        Metric whose value is read from somewhere else only when it is scraped.
+
+        :param _name: (String) metric name
+        :param _help: (String) description
+        :param _kind: (String) "counter" or "gauge"
+        :param _collect: callable returning value, or (Dictionary) label values -> value if labels are given
+        :param _labels: [optional] (Tuple) label names
+        """
+        self.name = _name
+        self.help = _help
+        self.kind = _kind
+        self.collect = _collect
+        self.label_names = _labels
+
+    def samples(self) -> list:
+        """
+        get samples of metric
+        :return: (List) (suffix, label names, label values, value)
+        """
+        if not self.label_names:
+            return [("", (), (), self.collect())]
+
+        result = []
+        for values, value in self.collect().items():
+            if not isinstance(values, tuple):
+                values = (values,)
+            result.append(("", self.label_names, values, value))
+        return result
+
+
+class MetricsRegistry:
+    def __init__(self, _prefix: str = "bhaptics_osc_"):
+        """
+        Metrics of bridge, rendered in Prometheus text format.
+
+        metrics are plain numbers updated in place, nothing is formatted until render() is called.
+        :param _prefix: [optional] (String) prefix of every metric name
+        """
+        self.prefix = _prefix
+        self.metrics = {}
+
+    def __add(self, _metric):
+        if _metric.name in self.metrics:
+            raise ValueError(f"metric {_metric.name} is already registered")
+        self.metrics[_metric.name] = _metric
+        return _metric
+
+    def counter(self, _name: str, _help: str, _labels: tuple = ()) -> Counter:
+        return self.__add(Counter(self.prefix + _name, _help, _labels))
+
+    def gauge(self, _name: str, _help: str, _labels: tuple = ()) -> Gauge:
+        return self.__add(Gauge(self.prefix + _name, _help, _labels))
+
+    def histogram(self, _name: str, _help: str, _buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self.__add(Histogram(self.prefix + _name, _help, _buckets))
+
+    def collect(self, _name: str, _help: str, _kind: str, _collect, _labels: tuple = ()) -> Collected:
+        return self.__add(Collected(self.prefix + _name, _help, _kind, _collect, _labels))
+
+    def render(self) -> str:
+        """
+        render every metric in Prometheus text format
+        :return: (String) exposition text
+        """
+        lines = []
+
+        for metric in list(self.metrics.values()):
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                lines.append(f"# {metric.name} is not available: {e}")
+                continue
+
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, names, values, value in samples:
+                lines.append(f"{metric.name}{suffix}{format_labels(names, values)} {format_value(value)}")
+
+        return "\n".join(lines) + "\n"
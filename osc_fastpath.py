@@ -0,0 +1,302 @@
+import asyncio
+import contextlib
+import struct
+import time
+
+from pythonosc import dispatcher, osc_message
+from log import Flag
+from tracing import tracer
+
+# raw address prefixes of the messages that bridge handles. everything else is dropped before decoding
+ACCEPT_PREFIXES = (
+    b"/avatar/parameters/bHapticsOSC_",
+    b"/avatar/parameters/bOSC_v1_",
+    b"/avatar/change",
+)
+BUNDLE_PREFIX = b"#bundle\0"
+
+# type tag strings of single argument messages that fast path decodes
+TAG_FLOAT = b",f\0\0"
+TAG_INT = b",i\0\0"
+TAG_TRUE = b",T\0\0"
+TAG_FALSE = b",F\0\0"
+
+MAX_CACHED_ADDRESSES = 1024
+# bundles nested deeper than this are rejected
+MAX_BUNDLE_DEPTH = 8
+
+# seconds between 1900-01-01 (NTP epoch) and 1970-01-01
+NTP_DELTA = 2208988800
+IMMEDIATELY = 1
+
+_float = struct.Struct(">f")
+_int = struct.Struct(">i")
+_timetag = struct.Struct(">Q")
+
+
+def decode_message(data: bytes):
+    """
+    decode OSC message that has single float/int/bool argument
+
+    :param data: (Bytes) OSC message
+    :return: (Tuple) (address, args), None if message is not simple enough for fast path
+    """
+    end = data.find(b"\0")
+    if end < 0:
+        return None
+
+    tag_start = (end + 4) & ~3
+    tag = data[tag_start:tag_start + 4]
+    arg_start = tag_start + 4
+
+    try:
+        if tag == TAG_FLOAT and len(data) == arg_start + 4:
+            value = _float.unpack_from(data, arg_start)[0]
+        elif tag == TAG_INT and len(data) == arg_start + 4:
+            value = _int.unpack_from(data, arg_start)[0]
+        elif tag == TAG_TRUE and len(data) == arg_start:
+            value = True
+        elif tag == TAG_FALSE and len(data) == arg_start:
+            value = False
+        else:
+            return None
+
+        return data[:end].decode("utf-8"), (value,)
+    except (struct.error, UnicodeDecodeError):
+        return None
+
+
+def decode_bundle(data: bytes):
+    """
+    split OSC bundle into its timetag and elements
+
+    :param data: (Bytes) OSC bundle
+    :return: (Tuple) (timetag, list of element bytes)
+    :raise: osc_message.ParseError if element size doesn't fit in bundle
+    """
+    timetag = _timetag.unpack_from(data, len(BUNDLE_PREFIX))[0]
+    elements = []
+
+    pos = len(BUNDLE_PREFIX) + 8
+    while pos + 4 <= len(data):
+        size = _int.unpack_from(data, pos)[0]
+        pos += 4
+        if size <= 0 or pos + size > len(data):
+            raise osc_message.ParseError(f"invalid bundle element size {size} at {pos - 4}")
+        elements.append(data[pos:pos + size])
+        pos += size
+
+    return timetag, elements
+
+
+def timetag_to_time(timetag: int) -> float:
+    """
+    convert NTP timetag to unix time
+    :param timetag: (Int) 64bit NTP timetag
+    :return: (Float) unix time
+    """
+    return (timetag >> 32) - NTP_DELTA + (timetag & 0xFFFFFFFF) / 2 ** 32
+
+
+class FastOSCRouter:
+    def __init__(self, _dispatcher: dispatcher.Dispatcher, _prefixes: tuple = ACCEPT_PREFIXES,
+                 _transaction=None, _honor_timetag: bool = False, _queue=None, _recorder=None, _tracer=None):
+        """
+        Route OSC packets to dispatcher's handlers.
+
+        packets whose address doesn't start with one of prefixes are rejected before decoding,
+        and single argument messages are decoded without pythonosc.
+        messages of a bundle are handled inside one transaction.
+        if queue is given, messages are put into it instead of being dispatched immediately.
+        :param _dispatcher: dispatcher object
+        :param _prefixes: (Tuple) accepted address prefixes (bytes)
+        :param _transaction: [optional] callable that returns context manager wrapping a bundle
+        :param _honor_timetag: [optional] (Bool) delay bundles until their timetag
+        :param _queue: [optional] (CoalescingQueue) inbound queue drained by output loop
+        :param _recorder: [optional] (OSCRecorder) log that every accepted packet is recorded to
+        :param _tracer: [optional] (Tracer) tracer of session, shared tracer if omitted
+        """
+        self.dispatcher = _dispatcher
+        self.prefixes = _prefixes
+        self.transaction = _transaction if _transaction is not None else contextlib.nullcontext
+        self.honor_timetag = _honor_timetag
+        self.queue = _queue
+        self.recorder = _recorder
+        self.tracer = _tracer if _tracer is not None else tracer
+        # address -> handlers, to skip pattern matching of dispatcher
+        self.handlers = {}
+
+        self.received: int = 0
+        self.ignored: int = 0
+        self.fallback: int = 0
+        self.bundles: int = 0
+        self.errors: int = 0
+        self.malformed: int = 0
+
+    def handle_packet(self, data: bytes, client_address: tuple):
+        """
+        handle raw OSC packet
+        :param data: (Bytes) OSC packet
+        :param client_address: (Tuple) address of sender
+        :return: None
+        """
+        self.received += 1
+        start = self.tracer.start()
+
+        try:
+            self.__handle_packet(data, client_address)
+        finally:
+            if start:
+                self.tracer.end("osc.receive", start, {"bytes": len(data)})
+
+    def __handle_packet(self, data: bytes, client_address: tuple):
+        """
+        (PRIVATE) decode packet and deliver its message
+        """
+        if data.startswith(BUNDLE_PREFIX):
+            self.handle_bundle(data, client_address)
+            return
+
+        if not data.startswith(self.prefixes):
+            self.ignored += 1
+            return
+
+        message = decode_message(data)
+        if message is None:
+            self.fallback += 1
+            try:
+                msg = osc_message.OscMessage(data)
+            except osc_message.ParseError as e:
+                self.malformed += 1
+                print(Flag.Warn.value + f"Malformed OSC message: {e}")
+                return
+            message = (msg.address, tuple(msg.params))
+
+        if self.recorder is not None:
+            self.recorder.record([message])
+
+        self.deliver(message[0], message[1], client_address)
+
+    def handle_bundle(self, data: bytes, client_address: tuple):
+        """
+        handle every message of OSC bundle as one transaction
+        :param data: (Bytes) OSC bundle
+        :param client_address: (Tuple) address of sender
+        :return: None
+        """
+        self.bundles += 1
+        messages = []
+
+        try:
+            timetag = self.__collect(data, messages)
+        except (struct.error, osc_message.ParseError) as e:
+            self.malformed += 1
+            print(Flag.Warn.value + f"Malformed OSC bundle: {e}")
+            return
+
+        if not messages:
+            return
+
+        if self.recorder is not None:
+            self.recorder.record(messages)
+
+        if self.honor_timetag and timetag != IMMEDIATELY:
+            delay = timetag_to_time(timetag) - time.time()
+            if delay > 0:
+                asyncio.get_running_loop().call_later(delay, self.__apply, messages, client_address)
+                return
+
+        self.__apply(messages, client_address)
+
+    def __collect(self, data: bytes, messages: list, depth: int = 0) -> int:
+        """
+        (PRIVATE) decode accepted messages of bundle (and nested bundles) into messages.
+        malformed message is skipped, other messages of bundle are kept
+        :return: (Int) timetag of bundle
+        :raise: osc_message.ParseError if bundles are nested deeper than MAX_BUNDLE_DEPTH
+        """
+        if depth > MAX_BUNDLE_DEPTH:
+            raise osc_message.ParseError(f"bundles are nested deeper than {MAX_BUNDLE_DEPTH}")
+        timetag, elements = decode_bundle(data)
+
+        for element in elements:
+            if element.startswith(BUNDLE_PREFIX):
+                self.__collect(element, messages, depth + 1)
+            elif not element.startswith(self.prefixes):
+                self.ignored += 1
+            else:
+                message = decode_message(element)
+                if message is None:
+                    self.fallback += 1
+                    try:
+                        msg = osc_message.OscMessage(element)
+                    except osc_message.ParseError as e:
+                        self.malformed += 1
+                        print(Flag.Warn.value + f"Malformed OSC message in bundle: {e}")
+                        continue
+                    message = (msg.address, tuple(msg.params))
+                messages.append(message)
+
+        return timetag
+
+    def __apply(self, messages: list, client_address: tuple):
+        with self.transaction():
+            for address, args in messages:
+                self.deliver(address, args, client_address)
+
+    def deliver(self, address: str, args: tuple, client_address: tuple):
+        """
+        put message into queue, or dispatch it if there's no queue or queue is full
+        :param address: (String) OSC address
+        :param args: (Tuple) OSC arguments
+        :param client_address: (Tuple) address of sender
+        :return: None
+        """
+        if self.queue is None or not self.queue.put(address, args, client_address):
+            self.dispatch(address, args, client_address)
+
+    def dispatch(self, address: str, args: tuple, client_address: tuple):
+        """
+        invoke handlers mapped to address
+        :param address: (String) OSC address
+        :param args: (Tuple) OSC arguments
+        :param client_address: (Tuple) address of sender
+        :return: None
+        """
+        handlers = self.handlers.get(address)
+        if handlers is None:
+            handlers = tuple(self.dispatcher.handlers_for_address(address))
+            if len(self.handlers) < MAX_CACHED_ADDRESSES:
+                self.handlers[address] = handlers
+
+        for handler in handlers:
+            start = self.tracer.start()
+            try:
+                if handler.needs_reply_address:
+                    if handler.args:
+                        handler.callback(client_address, address, handler.args, *args)
+                    else:
+                        handler.callback(client_address, address, *args)
+                else:
+                    if handler.args:
+                        handler.callback(address, handler.args, *args)
+                    else:
+                        handler.callback(address, *args)
+            except Exception as e:
+                self.errors += 1
+                print(Flag.Warn.value + f"Error while handling {address}: {e}")
+
+            if start:
+                self.tracer.end("dispatch." + getattr(handler.callback, "__name__", "handler"), start, {"address": address})
+
+
+class FastOSCProtocol(asyncio.DatagramProtocol):
+    def __init__(self, _router: FastOSCRouter):
+        """
+        datagram protocol that hands every datagram to router
+        :param _router: (FastOSCRouter) router
+        """
+        self.router = _router
+
+    def datagram_received(self, data: bytes, addr: tuple) -> None:
+        self.router.handle_packet(data, addr)
@@ -0,0 +1,256 @@
+import mmap
+import os
+import struct
+import time
+
+from log import Flag
+
+MAGIC = b"BOSCLOG\0"
+FORMAT_VERSION = 1
+
+# header: magic, version, unix time of start
+HEADER = struct.Struct("<8sHd")
+# address definition: kind, address id, length of utf-8 address that follows. string values share the table
+ADDRESS = struct.Struct("<cHH")
+# message: kind, seconds since start, address id, type tag, packed value
+MESSAGE = struct.Struct("<cdHc4s")
+# bundle: kind, seconds since start, number of messages that follow
+BUNDLE = struct.Struct("<cdH")
+
+KIND_ADDRESS = b"A"
+KIND_MESSAGE = b"M"
+KIND_BUNDLE = b"B"
+
+# type tags of packed value
+TAG_FLOAT = b"f"
+TAG_INT = b"i"
+TAG_TRUE = b"T"
+TAG_FALSE = b"F"
+TAG_NONE = b"N"
+TAG_STRING = b"s"
+
+MAX_ADDRESSES = 0xFFFF
+WRITE_BUFFER = 1 << 16
+FLUSH_INTERVAL = 1.0
+
+_float = struct.Struct("<f")
+_int = struct.Struct("<i")
+_empty = b"\0\0\0\0"
+
+
+def pack_value(_args: tuple, _intern):
+    """
+    pack OSC arguments into type tag and 4 bytes
+    :param _args: (Tuple) OSC arguments
+    :param _intern: callable that returns id of string, None if there's no more id
+    :return: (Tuple) (tag, packed value), None if arguments can't be recorded
+    """
+    if not _args:
+        return TAG_NONE, _empty
+    if len(_args) > 1:
+        return None
+
+    value = _args[0]
+    if value is True:
+        return TAG_TRUE, _empty
+    if value is False:
+        return TAG_FALSE, _empty
+    if type(value) is float:
+        return TAG_FLOAT, _float.pack(value)
+    if type(value) is int and -0x80000000 <= value <= 0x7FFFFFFF:
+        return TAG_INT, _int.pack(value)
+    if type(value) is str:
+        string_id = _intern(value)
+        if string_id is not None:
+            return TAG_STRING, _int.pack(string_id)
+
+    return None
+
+
+def unpack_value(_tag: bytes, _packed: bytes, _strings: dict) -> tuple:
+    """
+    unpack type tag and 4 bytes into OSC arguments
+    :param _tag: (Bytes) type tag
+    :param _packed: (Bytes) packed value
+    :param _strings: (Dictionary) id -> interned string
+    :return: (Tuple) OSC arguments
+    """
+    if _tag == TAG_FLOAT:
+        return _float.unpack(_packed)
+    if _tag == TAG_INT:
+        return _int.unpack(_packed)
+    if _tag == TAG_TRUE:
+        return (True,)
+    if _tag == TAG_FALSE:
+        return (False,)
+    if _tag == TAG_STRING:
+        return (_strings[_int.unpack(_packed)[0]],)
+    return ()
+
+
+class OSCRecorder:
+    def __init__(self, _file: str):
+        """
+        Append-only binary log of received OSC messages.
+
+        every message is stored as monotonic time since start, interned address id and packed value.
+        file is written through buffer and flushed at most once per FLUSH_INTERVAL.
+        :param _file: (String) log file path
+        """
+        self.file = _file
+        self.start = time.monotonic()
+        # address -> id
+        self.addresses = {}
+
+        self.recorded: int = 0
+        self.skipped: int = 0
+
+        if os.path.dirname(_file):
+            os.makedirs(os.path.dirname(_file), exist_ok=True)
+        self.__f = open(_file, "wb", buffering=WRITE_BUFFER)
+        self.__f.write(HEADER.pack(MAGIC, FORMAT_VERSION, time.time()))
+        self.__last_flush = self.start
+
+        print(Flag.Info.value + f"recording OSC session to {_file}")
+
+    def record(self, _messages: list) -> None:
+        """
+        append packet to log. packet of more than one message is recorded as bundle
+        :param _messages: (List) (address, args) of packet
+        :return: None
+        """
+        if self.__f is None:
+            return
+
+        now = time.monotonic()
+        ts = now - self.start
+        records = []
+
+        for address, args in _messages:
+            address_id = self.__intern(address)
+            value = pack_value(args, self.__intern)
+            if value is None or address_id is None:
+                self.skipped += 1
+                continue
+            records.append(MESSAGE.pack(KIND_MESSAGE, ts, address_id, *value))
+
+        if not records:
+            return
+
+        if len(_messages) > 1:
+            self.__f.write(BUNDLE.pack(KIND_BUNDLE, ts, len(records)))
+        self.__f.write(b"".join(records))
+        self.recorded += len(records)
+
+        if now - self.__last_flush > FLUSH_INTERVAL:
+            self.__f.flush()
+            self.__last_flush = now
+
+    def __intern(self, _address: str):
+        """
+        (PRIVATE) get id of address (or string value), writing its definition when it's new
+        :return: (Int) address id, None if there's no more id
+        """
+        address_id = self.addresses.get(_address)
+        if address_id is not None:
+            return address_id
+
+        if len(self.addresses) >= MAX_ADDRESSES:
+            return None
+
+        address_id = len(self.addresses)
+        encoded = _address.encode("utf-8")
+        self.__f.write(ADDRESS.pack(KIND_ADDRESS, address_id, len(encoded)) + encoded)
+        self.addresses[_address] = address_id
+        return address_id
+
+    def close(self) -> None:
+        """
+        flush and close log file
+        :return: None
+        """
+        if self.__f is None:
+            return
+
+        self.__f.close()
+        self.__f = None
+        print(Flag.Info.value + f"{self.recorded} OSC messages are recorded to {self.file}")
+
+
+class OSCLogReader:
+    def __init__(self, _file: str):
+        """
+        Read OSC log written by OSCRecorder.
+
+        file is memory-mapped, so log doesn't need to fit in memory.
+        :param _file: (String) log file path
+        :raise: ValueError if file is not OSC log
+        """
+        self.file = _file
+        self.__f = open(_file, "rb")
+        self.__map = mmap.mmap(self.__f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self.__map) < HEADER.size:
+            self.close()
+            raise ValueError(f"{_file} is not OSC log")
+
+        magic, version, self.started = HEADER.unpack_from(self.__map, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"{_file} is not OSC log of version {FORMAT_VERSION}")
+
+    def __iter__(self):
+        """
+        iterate packets in recorded order. incomplete record at the end of file is ignored
+        :return: iterator of (seconds since start, list of (address, args))
+        """
+        data = self.__map
+        size = len(data)
+        pos = HEADER.size
+        addresses = {}
+        # messages remaining in current bundle
+        bundle = None
+        remaining = 0
+
+        try:
+            while pos < size:
+                kind = data[pos:pos + 1]
+
+                if kind == KIND_ADDRESS:
+                    _kind, address_id, length = ADDRESS.unpack_from(data, pos)
+                    pos += ADDRESS.size
+                    if pos + length > size:
+                        return
+                    addresses[address_id] = data[pos:pos + length].decode("utf-8")
+                    pos += length
+                elif kind == KIND_BUNDLE:
+                    _kind, ts, remaining = BUNDLE.unpack_from(data, pos)
+                    pos += BUNDLE.size
+                    bundle = (ts, [])
+                elif kind == KIND_MESSAGE:
+                    _kind, ts, address_id, tag, packed = MESSAGE.unpack_from(data, pos)
+                    pos += MESSAGE.size
+                    message = (addresses[address_id], unpack_value(tag, packed, addresses))
+
+                    if bundle is None:
+                        yield ts, [message]
+                    else:
+                        bundle[1].append(message)
+                        remaining -= 1
+                        if remaining == 0:
+                            yield bundle
+                            bundle = None
+                else:
+                    raise ValueError(f"{self.file} has unknown record at {pos}")
+        except struct.error:
+            return
+
+    def close(self) -> None:
+        """
+        unmap and close log file
+        :return: None
+        """
+        if self.__map is not None:
+            self.__map.close()
+            self.__map = None
+        self.__f.close()
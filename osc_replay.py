@@ -0,0 +1,207 @@
+import argparse
+import json
+import os
+import socket
+import time
+
+from pythonosc import osc_bundle_builder, osc_message_builder
+
+from log import Flag
+from osc_recorder import OSCLogReader
+
+# same pacing as output loop of bridge
+FRAME_INTERVAL = 0.02
+REFRESH_INTERVAL = 0.1
+# longest time replay keeps ticking after last packet while envelopes are moving
+MAX_TAIL = 10.0
+
+
+def paced(_reader: OSCLogReader, _speed: float = 1.0):
+    """
+    iterate packets of log, waiting so that they are spaced like they were recorded
+    :param _reader: (OSCLogReader) log
+    :param _speed: [optional] (Float) replay speed, 2.0 is twice as fast and 0 is as fast as possible
+    :return: iterator of (seconds since start, list of (address, args))
+    """
+    start = time.perf_counter()
+
+    for ts, messages in _reader:
+        if _speed > 0:
+            delay = start + ts / _speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        yield ts, messages
+
+
+def encode_packet(_messages: list) -> bytes:
+    """
+    encode packet of log into OSC datagram. more than one message becomes bundle
+    :param _messages: (List) (address, args)
+    :return: (Bytes) OSC datagram
+    """
+    built = []
+    for address, args in _messages:
+        msg = osc_message_builder.OscMessageBuilder(address=address)
+        for arg in args:
+            msg.add_arg(arg)
+        built.append(msg.build())
+
+    if len(built) == 1:
+        return built[0].dgram
+
+    bundle = osc_bundle_builder.OscBundleBuilder(osc_bundle_builder.IMMEDIATELY)
+    for msg in built:
+        bundle.add_content(msg)
+    return bundle.build().dgram
+
+
+def replay_udp(_reader: OSCLogReader, _ip: str, _port: int, _speed: float = 1.0) -> int:
+    """
+    send packets of log to running bridge
+    :param _reader: (OSCLogReader) log
+    :param _ip: (String) ip of bridge
+    :param _port: (Int) OSC port of bridge
+    :param _speed: [optional] (Float) replay speed, 0 is as fast as possible
+    :return: (Int) number of sent packets
+    """
+    sent = 0
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        for _ts, messages in paced(_reader, _speed):
+            sock.sendto(encode_packet(messages), (_ip, _port))
+            sent += 1
+
+    return sent
+
+
+class DirectReplay:
+    def __init__(self, _haptics_player, _router, _frame_interval: float = FRAME_INTERVAL,
+                 _refresh_interval: float = REFRESH_INTERVAL):
+        """
+        Replay log straight into handlers, without sockets, and capture output frames.
+
+        haptics player runs on recorded time, so captured frames are the same on every replay
+        whatever the speed is.
+        :param _haptics_player: (HapticsPlayer) player whose state is captured
+        :param _router: (FastOSCRouter) router that dispatches messages to handlers
+        :param _frame_interval: [optional] (Float) seconds between frames while envelopes are moving
+        :param _refresh_interval: [optional] (Float) seconds between ticks while nothing moves
+        """
+        self.haptics_player = _haptics_player
+        self.router = _router
+        self.frame_interval = _frame_interval
+        self.refresh_interval = _refresh_interval
+
+        self.now = 0.0
+        self.next_tick = 0.0
+        self.moving = False
+        # {"t", "position", "intensity"} of every position change
+        self.frames = []
+
+        _haptics_player.clock = lambda: self.now
+        _haptics_player.stats.reset()
+
+    def run(self, _reader: OSCLogReader, _speed: float = 0) -> list:
+        """
+        replay every packet of log
+        :param _reader: (OSCLogReader) log
+        :param _speed: [optional] (Float) replay speed, 0 is as fast as possible
+        :return: (List) captured frames
+        """
+        for ts, messages in paced(_reader, _speed):
+            self.__advance(ts)
+            self.now = ts
+
+            if len(messages) == 1:
+                self.router.dispatch(messages[0][0], messages[0][1], None)
+            else:
+                with self.haptics_player.transaction():
+                    for address, args in messages:
+                        self.router.dispatch(address, args, None)
+
+            self.__tick()
+
+        end = self.now + MAX_TAIL
+        while self.moving and self.next_tick <= end:
+            self.__advance(self.next_tick)
+
+        return self.frames
+
+    def __advance(self, _until: float):
+        """
+        (PRIVATE) tick on recorded time until given time
+        """
+        while self.next_tick <= _until:
+            self.now = self.next_tick
+            self.__tick()
+
+    def __tick(self):
+        """
+        (PRIVATE) advance envelopes and capture changed positions
+        """
+        self.moving = self.haptics_player.update(self.now)
+
+        for pos in sorted(self.haptics_player.take_dirty()):
+            self.frames.append({
+                "t": round(self.now, 6),
+                "position": pos,
+                "intensity": [dot["intensity"] for dot in self.haptics_player.positions[pos]],
+            })
+
+        self.next_tick = self.now + (self.frame_interval if self.moving else self.refresh_interval)
+
+
+def replay_direct(_reader: OSCLogReader, _config_file: str = None, _speed: float = 0) -> list:
+    """
+    replay log into new haptics player that isn't connected to bHaptics Player
+    :param _reader: (OSCLogReader) log
+    :param _config_file: [optional] (String) config whose envelope, curves and tick rate are used
+    :param _speed: [optional] (Float) replay speed, 0 is as fast as possible
+    :return: (List) captured frames
+    """
+    from config import Config
+    from device_layout import DeviceLayouts
+    from haptics_handler import HapticsHandler
+    from haptics_player import HapticsPlayer
+    from main import Receiver
+    from osc_fastpath import FastOSCRouter
+
+    haptics_player = HapticsPlayer(_layouts=DeviceLayouts())
+    handler = HapticsHandler(haptics_player)
+    router = FastOSCRouter(Receiver.build_dispatcher(handler), _transaction=haptics_player.transaction)
+    refresh_interval = REFRESH_INTERVAL
+
+    if _config_file is not None:
+        config = Config.read(_config_file)
+        haptics_player.envelope.configure(config.attack_ms, config.hold_ms, config.decay_ms, config.timeout_ms)
+        haptics_player.curves.configure(config.curves)
+        refresh_interval = 1 / config.tick_rate
+
+    return DirectReplay(haptics_player, router, _refresh_interval=refresh_interval).run(_reader, _speed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="replay OSC session log recorded by bHapticsOSCQ")
+    parser.add_argument("log", help="log file recorded with INPUT.record_file")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed, 0 is as fast as possible")
+    parser.add_argument("--udp", metavar="IP:PORT", help="send packets to running bridge")
+    parser.add_argument("--frames", metavar="FILE", help="replay into handlers and write output frames (json lines)")
+    parser.add_argument("--config", metavar="FILE", help="config used by --frames replay")
+    args = parser.parse_args()
+
+    reader = OSCLogReader(args.log)
+    try:
+        if args.udp:
+            ip, port = args.udp.rsplit(":", 1)
+            count = replay_udp(reader, ip, int(port), args.speed)
+            print(Flag.Info.value + f"{count} packets are sent to {args.udp}")
+        elif args.frames:
+            config_file = args.config if args.config or not os.path.exists("./config.json") else "./config.json"
+            frames = replay_direct(reader, config_file, args.speed)
+            with open(args.frames, "w", encoding="utf-8") as f:
+                for frame in frames:
+                    f.write(json.dumps(frame) + "\n")
+            print(Flag.Info.value + f"{len(frames)} frames are written to {args.frames}")
+        else:
+            parser.error("either --udp or --frames is required")
+    finally:
+        reader.close()
@@ -0,0 +1,482 @@
+import json
+import mmap
+import os
+import struct
+import time
+
+from log import Flag
+from tracing import tracer
+
+BACKENDS = ("bhaptics", "null", "file")
+DEFAULT_FRAME_FILE = "frames/{name}-%Y%m%d-%H%M%S.bfrm"
+
+# every position that bHaptics Player knows, reported as connected by sinks without device
+ALL_POSITIONS = ("Vest", "VestFront", "VestBack", "ForearmL", "ForearmR", "Head",
+                 "HandL", "HandR", "FootL", "FootR", "GloveL", "GloveR")
+
+
+def new_send_stats() -> dict:
+    return {
+        "sent": 0,
+        "superseded": 0,
+        "stale": 0,
+        "dropped": 0,
+        "blocked_seconds": 0.0,
+        "max_blocked_seconds": 0.0,
+    }
+
+
+class OutputBackend:
+    # name used in OUTPUT.backends of config
+    name = None
+
+    def __init__(self):
+        """
+        Destination of haptic frames. HapticsPlayer and PatternLibrary only talk to this interface.
+
+        subclasses implement submit(), register_project() and submit_registered(). submit() is called
+        from event loop, so it must not block on I/O.
+        """
+        # incremented whenever backend loses registered patterns (e.g. reconnection)
+        self.connection_id = 0
+        self.connected_positions = set()
+        self.active_keys = set()
+        self.send_stats = new_send_stats()
+        # frame key (position) -> {"submitted", "sent", "bytes"}
+        self.position_stats = {}
+        # tracer of session that backend belongs to
+        self.tracer = tracer
+
+    def submit(self, _key: str, _frame: dict) -> None:
+        """
+        submit frame. newer frame of same key may replace one that isn't sent yet
+        :param _key: (String) frame key
+        :param _frame: (Dictionary) frame with position, dotPoints or pathPoints and durationMillis
+        :return: None
+        """
+        raise NotImplementedError
+
+    def register_project(self, _key: str, _project: dict) -> None:
+        """
+        register pattern project of .tact file
+        :param _key: (String) pattern key
+        :param _project: (Dictionary) project
+        :return: None
+        """
+        raise NotImplementedError
+
+    def submit_registered(self, _key: str, _alt_key: str = None, _scale_option: dict = None,
+                          _rotation_option: dict = None) -> None:
+        """
+        play registered pattern
+        :param _key: (String) pattern key
+        :param _alt_key: [optional] (String) key of this play, so that it can be played over itself
+        :param _scale_option: [optional] (Dictionary) {"intensity", "duration"}
+        :param _rotation_option: [optional] (Dictionary) {"offsetAngleX", "offsetY"}
+        :return: None
+        """
+        raise NotImplementedError
+
+    def submit_dot(self, _key: str, _position: str, _dot_points: list, _duration_millis: int) -> None:
+        self.submit(_key, {"position": _position, "dotPoints": _dot_points, "durationMillis": _duration_millis})
+
+    def submit_path(self, _key: str, _position: str, _path_points: list, _duration_millis: int) -> None:
+        self.submit(_key, {"position": _position, "pathPoints": _path_points, "durationMillis": _duration_millis})
+
+    def get_send_stats(self) -> dict:
+        """
+        :return: (Dictionary) send_stats with queue_depth
+        """
+        stats = dict(self.send_stats)
+        stats["queue_depth"] = 0
+        return stats
+
+    def is_playing(self) -> bool:
+        return len(self.active_keys) > 0
+
+    def close(self) -> None:
+        pass
+
+    def _count(self, _key: str, _sent: bool, _bytes: int = 0) -> None:
+        """
+        (PROTECTED) count frame of key in position_stats
+        """
+        stats = self.position_stats.get(_key)
+        if stats is None:
+            stats = self.position_stats[_key] = {"submitted": 0, "sent": 0, "bytes": 0}
+        stats["submitted"] += 1
+        if _sent:
+            stats["sent"] += 1
+            stats["bytes"] += _bytes
+
+
+class NullBackend(OutputBackend):
+    name = "null"
+
+    def __init__(self, _encode: bool = True):
+        """
+        Sink that drops frames after counting and timing them, for load tests without bHaptics Player.
+
+        every position is reported as connected.
+        :param _encode: [optional] (Bool) encode frames to JSON like bHaptics Player backend, so that
+            profiles of bridge include that cost
+        """
+        super().__init__()
+        self.encode = _encode
+        self.connected_positions = set(ALL_POSITIONS)
+        self.connection_id = 1
+        # monotonic time of first and last frame
+        self.first = None
+        self.last = None
+
+    def submit(self, _key: str, _frame: dict) -> None:
+        start = time.perf_counter()
+        size = len(json.dumps({"Submit": [{"Type": "frame", "Key": _key, "Frame": _frame}]})) if self.encode else 0
+        spent = time.perf_counter() - start
+
+        self.last = time.monotonic()
+        if self.first is None:
+            self.first = self.last
+
+        self.send_stats["sent"] += 1
+        self.send_stats["blocked_seconds"] += spent
+        if spent > self.send_stats["max_blocked_seconds"]:
+            self.send_stats["max_blocked_seconds"] = spent
+        self._count(_key, True, size)
+
+    def register_project(self, _key: str, _project: dict) -> None:
+        pass
+
+    def submit_registered(self, _key: str, _alt_key: str = None, _scale_option: dict = None,
+                          _rotation_option: dict = None) -> None:
+        pass
+
+    def frame_rate(self) -> float:
+        """
+        :return: (Float) frames per second between first and last frame
+        """
+        if self.first is None or self.last == self.first:
+            return 0.0
+        return self.send_stats["sent"] / (self.last - self.first)
+
+
+MAGIC = b"BHFRLOG\0"
+FORMAT_VERSION = 1
+
+# header: magic, version, unix time of start
+HEADER = struct.Struct("<8sHd")
+# key definition: kind, key id, length of utf-8 key that follows
+KEY = struct.Struct("<cHH")
+# frame: kind, seconds since start, key id, durationMillis, number of points that follow
+FRAME = struct.Struct("<cdHHB")
+# dot point: index, intensity
+DOT = struct.Struct("<BB")
+# path point: x, y, intensity
+PATH = struct.Struct("<ffB")
+# other request: kind, seconds since start, length of JSON that follows
+REQUEST = struct.Struct("<cdI")
+
+KIND_KEY = b"K"
+KIND_DOT = b"D"
+KIND_PATH = b"P"
+KIND_REQUEST = b"J"
+
+MAX_KEYS = 0xFFFF
+MAX_POINTS = 0xFF
+WRITE_BUFFER = 1 << 16
+FLUSH_INTERVAL = 1.0
+
+
+def _byte(_value) -> int:
+    return min(max(int(round(_value)), 0), 0xFF)
+
+
+class FileBackend(OutputBackend):
+    name = "file"
+
+    def __init__(self, _file: str):
+        """
+        Sink that appends every frame to compact binary log, readable with FrameLogReader.
+
+        dot frames take 2 bytes per motor and path frames 9 bytes per point, after 14 bytes of frame header.
+        every position is reported as connected.
+        :param _file: (String) log file path
+        """
+        super().__init__()
+        self.file = _file
+        self.connected_positions = set(ALL_POSITIONS)
+        self.connection_id = 1
+        self.start = time.monotonic()
+        # key -> id
+        self.keys = {}
+
+        if os.path.dirname(_file):
+            os.makedirs(os.path.dirname(_file), exist_ok=True)
+        self.__f = open(_file, "wb", buffering=WRITE_BUFFER)
+        self.__f.write(HEADER.pack(MAGIC, FORMAT_VERSION, time.time()))
+        self.__last_flush = self.start
+
+        print(Flag.Info.value + f"writing frames to {_file}")
+
+    def submit(self, _key: str, _frame: dict) -> None:
+        if self.__f is None:
+            return
+
+        key_id = self.__intern(_key)
+        if key_id is None:
+            self._count(_key, False)
+            return
+
+        now = time.monotonic()
+        duration = min(int(_frame.get("durationMillis") or 0), 0xFFFF)
+        if "pathPoints" in _frame:
+            points = _frame["pathPoints"][:MAX_POINTS]
+            body = b"".join(PATH.pack(p["x"], p["y"], _byte(p["intensity"])) for p in points)
+            kind = KIND_PATH
+        else:
+            points = _frame["dotPoints"][:MAX_POINTS]
+            body = b"".join(DOT.pack(p["index"], _byte(p["intensity"])) for p in points)
+            kind = KIND_DOT
+
+        record = FRAME.pack(kind, now - self.start, key_id, duration, len(points)) + body
+        self.__f.write(record)
+        self.send_stats["sent"] += 1
+        self._count(_key, True, len(record))
+        self.__flush(now)
+
+    def register_project(self, _key: str, _project: dict) -> None:
+        self.__request({"Register": [{"Key": _key, "Project": _project}]})
+
+    def submit_registered(self, _key: str, _alt_key: str = None, _scale_option: dict = None,
+                          _rotation_option: dict = None) -> None:
+        self.__request({"Submit": [{"Type": "key", "Key": _key, "Parameters": {
+            "altKey": _alt_key, "rotationOption": _rotation_option, "scaleOption": _scale_option}}]})
+
+    def __request(self, _request: dict):
+        """
+        (PRIVATE) write request other than frame as JSON
+        """
+        if self.__f is None:
+            return
+
+        now = time.monotonic()
+        encoded = json.dumps(_request).encode("utf-8")
+        self.__f.write(REQUEST.pack(KIND_REQUEST, now - self.start, len(encoded)) + encoded)
+        self.__flush(now)
+
+    def __intern(self, _key: str):
+        """
+        (PRIVATE) get id of key, writing its definition when it's new
+        :return: (Int) key id, None if there's no more id
+        """
+        key_id = self.keys.get(_key)
+        if key_id is not None:
+            return key_id
+
+        if len(self.keys) >= MAX_KEYS:
+            return None
+
+        key_id = len(self.keys)
+        encoded = _key.encode("utf-8")
+        self.__f.write(KEY.pack(KIND_KEY, key_id, len(encoded)) + encoded)
+        self.keys[_key] = key_id
+        return key_id
+
+    def __flush(self, _now: float):
+        if _now - self.__last_flush > FLUSH_INTERVAL:
+            self.__f.flush()
+            self.__last_flush = _now
+
+    def close(self) -> None:
+        """
+        flush and close log file
+        :return: None
+        """
+        if self.__f is None:
+            return
+
+        self.__f.close()
+        self.__f = None
+        print(Flag.Info.value + f"{self.send_stats['sent']} frames are written to {self.file}")
+
+
+class FrameLogReader:
+    def __init__(self, _file: str):
+        """
+        Read frame log written by FileBackend.
+
+        :param _file: (String) log file path
+        :raise: ValueError if file is not frame log
+        """
+        self.file = _file
+        self.__f = open(_file, "rb")
+        self.__map = mmap.mmap(self.__f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self.__map) < HEADER.size:
+            self.close()
+            raise ValueError(f"{_file} is not frame log")
+
+        magic, version, self.started = HEADER.unpack_from(self.__map, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"{_file} is not frame log of version {FORMAT_VERSION}")
+
+    def __iter__(self):
+        """
+        iterate records in written order. incomplete record at the end of file is ignored
+        :return: iterator of (seconds since start, key, frame), key is None for other requests
+        """
+        data = self.__map
+        size = len(data)
+        pos = HEADER.size
+        keys = {}
+
+        try:
+            while pos < size:
+                kind = data[pos:pos + 1]
+
+                if kind == KIND_KEY:
+                    _kind, key_id, length = KEY.unpack_from(data, pos)
+                    pos += KEY.size
+                    if pos + length > size:
+                        return
+                    keys[key_id] = data[pos:pos + length].decode("utf-8")
+                    pos += length
+                elif kind == KIND_DOT or kind == KIND_PATH:
+                    _kind, ts, key_id, duration, count = FRAME.unpack_from(data, pos)
+                    pos += FRAME.size
+                    if kind == KIND_DOT:
+                        points = [{"index": i, "intensity": v} for i, v in DOT.iter_unpack(data[pos:pos + DOT.size * count])]
+                        pos += DOT.size * count
+                        field = "dotPoints"
+                    else:
+                        points = [{"x": x, "y": y, "intensity": v}
+                                  for x, y, v in PATH.iter_unpack(data[pos:pos + PATH.size * count])]
+                        pos += PATH.size * count
+                        field = "pathPoints"
+                    if pos > size:
+                        return
+                    key = keys[key_id]
+                    yield ts, key, {"position": key, field: points, "durationMillis": duration}
+                elif kind == KIND_REQUEST:
+                    _kind, ts, length = REQUEST.unpack_from(data, pos)
+                    pos += REQUEST.size
+                    if pos + length > size:
+                        return
+                    yield ts, None, json.loads(data[pos:pos + length])
+                    pos += length
+                else:
+                    raise ValueError(f"{self.file} has unknown record at {pos}")
+        except struct.error:
+            return
+
+    def close(self) -> None:
+        """
+        unmap and close log file
+        :return: None
+        """
+        if self.__map is not None:
+            self.__map.close()
+            self.__map = None
+        self.__f.close()
+
+
+class FanOutBackend(OutputBackend):
+    name = "fanout"
+
+    def __init__(self, _backends: list):
+        """
+        Send every frame and request to several backends.
+
+        connected positions and active keys are union of backends, statistics are their sum.
+        :param _backends: (List) OutputBackend
+        """
+        # every state is derived from backends, so OutputBackend.__init__ isn't called
+        self.backends = list(_backends)
+
+    @property
+    def connection_id(self):
+        return sum(backend.connection_id for backend in self.backends)
+
+    @property
+    def connected_positions(self):
+        return set().union(*(backend.connected_positions for backend in self.backends))
+
+    @property
+    def active_keys(self):
+        return set().union(*(backend.active_keys for backend in self.backends))
+
+    @property
+    def send_stats(self):
+        stats = new_send_stats()
+        for backend in self.backends:
+            for key, value in backend.send_stats.items():
+                stats[key] = max(stats[key], value) if key == "max_blocked_seconds" else stats[key] + value
+        return stats
+
+    @property
+    def position_stats(self):
+        merged = {}
+        for backend in self.backends:
+            for key, stats in list(backend.position_stats.items()):
+                target = merged.setdefault(key, {"submitted": 0, "sent": 0, "bytes": 0})
+                for field, value in stats.items():
+                    target[field] += value
+        return merged
+
+    def submit(self, _key: str, _frame: dict) -> None:
+        for backend in self.backends:
+            backend.submit(_key, _frame)
+
+    def register_project(self, _key: str, _project: dict) -> None:
+        for backend in self.backends:
+            backend.register_project(_key, _project)
+
+    def submit_registered(self, _key: str, _alt_key: str = None, _scale_option: dict = None,
+                          _rotation_option: dict = None) -> None:
+        for backend in self.backends:
+            backend.submit_registered(_key, _alt_key, _scale_option, _rotation_option)
+
+    def get_send_stats(self) -> dict:
+        stats = self.send_stats
+        stats["queue_depth"] = sum(backend.get_send_stats()["queue_depth"] for backend in self.backends)
+        return stats
+
+    def close(self) -> None:
+        for backend in self.backends:
+            backend.close()
+
+
+def create_backend(_names: list, _app_id: str, _app_name: str, _frame_file: str = DEFAULT_FRAME_FILE,
+                   _player_url: str = None, _tracer=None) -> OutputBackend:
+    """
+    create backend from OUTPUT.backends of config. more than one name makes fan-out backend
+    :param _names: (List) names in BACKENDS
+    :param _app_id: (String) application id for bHaptics Player
+    :param _app_name: (String) application name for bHaptics Player
+    :param _frame_file: [optional] (String) strftime path of file backend log
+    :param _player_url: [optional] (String) websocket url of bHaptics Player, local player if omitted
+    :param _tracer: [optional] (Tracer) tracer of session, shared tracer if omitted
+    :return: (OutputBackend) backend
+    :raise: ValueError if name is unknown
+    """
+    backends = []
+    for name in _names:
+        if name == "bhaptics":
+            from bhaptics.better_haptic_player import BhapticsV2Backend
+            if _player_url is None:
+                backends.append(BhapticsV2Backend(_app_id, _app_name))
+            else:
+                backends.append(BhapticsV2Backend(_app_id, _app_name, _player_url))
+        elif name == "null":
+            backends.append(NullBackend())
+        elif name == "file":
+            backends.append(FileBackend(time.strftime(_frame_file)))
+        else:
+            raise ValueError(f"output backend must be one of {BACKENDS}")
+        if _tracer is not None:
+            backends[-1].tracer = _tracer
+
+    if len(backends) == 1:
+        return backends[0]
+    return FanOutBackend(backends)
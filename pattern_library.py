@@ -0,0 +1,103 @@
+import os
+import json
+import hashlib
+
+from output_backend import OutputBackend
+from log import Flag
+
+PATTERN_DIR = "./patterns"
+PATTERN_EXT = ".tact"
+
+
+class PatternLibrary:
+    def __init__(self, _backend: OutputBackend, _directory: str = PATTERN_DIR):
+        """
+        Library of .tact patterns that are registered to output backend and played by key.
+
+        patterns are cached by content hash, so unchanged files are parsed and registered only once.
+        :param _backend: (OutputBackend) backend that patterns are registered to
+        :param _directory: (String) directory that has .tact files
+        """
+        self.backend = _backend
+        self.directory = _directory
+
+        # pattern name -> key
+        self.patterns = {}
+        # key (content hash) -> project
+        self.projects = {}
+
+        # keys registered to current connection of backend
+        self.registered = set()
+        self.connection_id = None
+
+    def load(self) -> int:
+        """
+        load every .tact file in directory
+        :return: (Int) number of loaded patterns
+        """
+        patterns = {}
+
+        if not os.path.isdir(self.directory):
+            self.patterns = patterns
+            return 0
+
+        for filename in sorted(os.listdir(self.directory)):
+            name, ext = os.path.splitext(filename)
+            if ext.lower() != PATTERN_EXT:
+                continue
+
+            try:
+                with open(os.path.join(self.directory, filename), 'rb') as f:
+                    raw = f.read()
+
+                key = "bHapticsOSCQ_" + hashlib.sha1(raw).hexdigest()[:16]
+                if key not in self.projects:
+                    self.projects[key] = json.loads(raw)["project"]
+
+                patterns[name] = key
+            except (IOError, ValueError, KeyError) as e:
+                print(Flag.Warn.value + f"Couldn't load pattern {filename}: {e}")
+
+        self.patterns = patterns
+        print(Flag.Info.value + f"{len(patterns)} patterns loaded")
+
+        return len(patterns)
+
+    def register_all(self) -> None:
+        """
+        register loaded patterns that current connection of backend doesn't have yet
+        :return: None
+        """
+        if self.connection_id != self.backend.connection_id:
+            self.connection_id = self.backend.connection_id
+            self.registered.clear()
+
+        for key in set(self.patterns.values()) - self.registered:
+            self.backend.register_project(key, self.projects[key])
+            self.registered.add(key)
+
+    def play(self, _name: str, _intensity: float = 1.0, _duration: float = 1.0,
+             _offset_angle_x: float = 0, _offset_y: float = 0) -> bool:
+        """
+        play registered pattern
+        :param _name: (String) pattern name (file name without extension)
+        :param _intensity: [optional] (Float) intensity scale
+        :param _duration: [optional] (Float) duration scale
+        :param _offset_angle_x: [optional] (Float) rotation around body in degree
+        :param _offset_y: [optional] (Float) vertical offset
+        :return: (Bool) False if there's no pattern with that name
+        """
+        key = self.patterns.get(_name)
+        if key is None:
+            return False
+
+        if key not in self.registered or self.connection_id != self.backend.connection_id:
+            self.register_all()
+
+        self.backend.submit_registered(
+            key, _name,
+            {"intensity": _intensity, "duration": _duration},
+            {"offsetAngleX": _offset_angle_x, "offsetY": _offset_y}
+        )
+
+        return True
@@ -0,0 +1,201 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+
+from log import Flag
+
+PROFILE_MODES = ("sample", "cprofile")
+DEFAULT_DIRECTORY = "./profiles"
+DEFAULT_SECONDS = 10
+# longer windows are cut to this, so one request can't hold profiler indefinitely
+MAX_SECONDS = 120
+DEFAULT_INTERVAL = 0.005
+TOP_FUNCTIONS = 25
+
+
+def frame_name(_code) -> str:
+    """
+    get readable name of code object
+    :param _code: code object of frame
+    :return: (String) function (file:line)
+    """
+    return f"{_code.co_name} ({os.path.basename(_code.co_filename)}:{_code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    def __init__(self, _interval: float = DEFAULT_INTERVAL):
+        """
+        Statistical profiler that samples stacks of every thread from its own thread.
+
+        profiled threads are not instrumented, so overhead is one stack walk per thread per interval.
+        stacks can only be taken while threads release the GIL, so short pure Python work between
+        I/O calls is under-represented. cProfile mode shows it exactly.
+        :param _interval: [optional] (Float) seconds between samples
+        """
+        self.interval = _interval
+        # (thread name, stack from outermost) -> number of samples
+        self.stacks = {}
+        self.samples = 0
+
+    def run(self, _seconds: float) -> None:
+        """
+        sample stacks for given time, blocking caller
+        :param _seconds: (Float) length of window
+        :return: None
+        """
+        me = threading.get_ident()
+        end = time.monotonic() + _seconds
+        names = {}
+
+        while time.monotonic() < end:
+            frames = sys._current_frames()
+            if len(names) != len(frames):
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+            for ident, frame in frames.items():
+                if ident == me:
+                    continue
+
+                stack = []
+                while frame is not None:
+                    stack.append(frame_name(frame.f_code))
+                    frame = frame.f_back
+                stack.reverse()
+
+                key = (names.get(ident, str(ident)), tuple(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+
+            self.samples += 1
+            time.sleep(self.interval)
+
+    def folded(self) -> str:
+        """
+        get samples in collapsed stack format that flame graph tools read
+        :return: (String) one "thread;outer;...;inner count" line per stack
+        """
+        return "".join(f"{';'.join((thread,) + stack)} {count}\n"
+                       for (thread, stack), count in sorted(self.stacks.items()))
+
+    def summary(self, _top: int = TOP_FUNCTIONS) -> str:
+        """
+        get functions that appear most in samples
+        :param _top: [optional] (Int) number of functions
+        :return: (String) table of self and total samples
+        """
+        own = {}
+        total = {}
+        threads = {}
+
+        for (thread, stack), count in self.stacks.items():
+            threads[thread] = threads.get(thread, 0) + count
+            if stack:
+                own[stack[-1]] = own.get(stack[-1], 0) + count
+            for name in set(stack):
+                total[name] = total.get(name, 0) + count
+
+        lines = [f"{self.samples} samples every {self.interval * 1000:g} ms", "", "samples by thread"]
+        for thread, count in sorted(threads.items(), key=lambda item: -item[1]):
+            lines.append(f"{count:>8}  {thread}")
+
+        lines += ["", f"top {_top} functions by self samples", f"{'self':>8} {'total':>8}  function"]
+        for name, count in sorted(own.items(), key=lambda item: -item[1])[:_top]:
+            lines.append(f"{count:>8} {total[name]:>8}  {name}")
+
+        return "\n".join(lines) + "\n"
+
+
+class ProfileController:
+    def __init__(self, _directory: str = DEFAULT_DIRECTORY, _loop=None):
+        """
+        Run one profiling window at a time on request and write its result to files.
+
+        nothing is installed until start() is called, so disabled profiler costs nothing.
+        :param _directory: [optional] (String) directory that dumps are written to
+        :param _loop: [optional] event loop that cProfile mode profiles
+        """
+        self.directory = _directory
+        self.loop = _loop
+        self.__lock = threading.Lock()
+        self.__running = False
+
+    @property
+    def running(self) -> bool:
+        return self.__running
+
+    def start(self, _mode: str = "sample", _seconds: float = DEFAULT_SECONDS,
+              _interval: float = DEFAULT_INTERVAL) -> bool:
+        """
+        start profiling window in background. can be called from any thread
+        :param _mode: [optional] (String) "sample" profiles every thread by sampling,
+            "cprofile" traces every call of event loop thread
+        :param _seconds: [optional] (Float) length of window, at most MAX_SECONDS
+        :param _interval: [optional] (Float) seconds between samples of "sample" mode
+        :return: (Bool) False if a window is already running
+        """
+        if _mode not in PROFILE_MODES:
+            raise ValueError(f"profile mode must be one of {PROFILE_MODES}")
+        if _mode == "cprofile" and self.loop is None:
+            raise ValueError("cprofile mode needs event loop")
+        if not _seconds > 0:
+            raise ValueError("profile seconds must be positive")
+        _seconds = min(_seconds, MAX_SECONDS)
+
+        with self.__lock:
+            if self.__running:
+                return False
+            self.__running = True
+
+        print(Flag.Info.value + f"profiling ({_mode}) for {_seconds} seconds")
+        target = self.__sample if _mode == "sample" else self.__cprofile
+        threading.Thread(target=target, args=(_seconds, _interval), name="profiler", daemon=True).start()
+        return True
+
+    def __sample(self, _seconds: float, _interval: float):
+        try:
+            profiler = SamplingProfiler(_interval)
+            profiler.run(_seconds)
+            self.__write("folded", profiler.folded(), profiler.summary())
+        finally:
+            self.__running = False
+
+    def __cprofile(self, _seconds: float, _interval: float):
+        try:
+            profile = cProfile.Profile()
+            # profile must be enabled and disabled on the thread it traces
+            self.loop.call_soon_threadsafe(profile.enable)
+            time.sleep(_seconds)
+            done = threading.Event()
+            self.loop.call_soon_threadsafe(lambda: (profile.disable(), done.set()))
+            done.wait()
+
+            out = io.StringIO()
+            stats = pstats.Stats(profile, stream=out)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_FUNCTIONS)
+            stats.sort_stats(pstats.SortKey.TIME).print_stats(TOP_FUNCTIONS)
+
+            path = self.__write("prof", None, out.getvalue())
+            stats.dump_stats(path)
+        finally:
+            self.__running = False
+
+    def __write(self, _extension: str, _dump, _summary: str) -> str:
+        """
+        (PRIVATE) write dump and summary, and print summary
+        :return: (String) path of dump
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, time.strftime("profile-%Y%m%d-%H%M%S"))
+
+        path = f"{base}.{_extension}"
+        if _dump is not None:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(_dump)
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            f.write(_summary)
+
+        print(Flag.Info.value + f"profile is written to {path}\n" + _summary)
+        return path
@@ -0,0 +1,233 @@
+import os
+import struct
+import sys
+import time
+from multiprocessing import shared_memory
+
+import psutil
+
+from log import Flag
+
+# Layout of shared memory block (little endian)
+#
+#   0  magic       4s  b"BHST"
+#   4  version     H   FORMAT_VERSION
+#   6  positions   H   number of entries in position table
+#   8  sequence    Q   odd while writer is updating, incremented by 2 on every update
+#  16  timestamp   d   unix time of last update
+#  24  actuators   I   number of actuator bytes
+#  28  writer      I   process id of writer
+#  32  position table, one ENTRY per position:
+#        name      12s ascii position name, null padded
+#        offset    H   index of first actuator in actuator bytes
+#        count     H   number of actuators
+#  32 + positions * ENTRY.size
+#      actuator bytes, one byte (intensity 0 ~ 100) per actuator
+#
+# readers copy what they need, then check that sequence is even and unchanged (seqlock).
+
+DEFAULT_NAME = "bHapticsOSCQ_state"
+MAGIC = b"BHST"
+FORMAT_VERSION = 1
+
+HEADER = struct.Struct("<4sHHQdII")
+SEQUENCE = struct.Struct("<Q")
+TIMESTAMP = struct.Struct("<d")
+ENTRY = struct.Struct("<12sHH")
+
+SEQUENCE_OFFSET = 8
+TIMESTAMP_OFFSET = 16
+
+MAX_RETRY = 100
+
+
+def block_size(_positions: int, _actuators: int) -> int:
+    """
+    get size of shared memory block
+    :param _positions: (Int) number of positions
+    :param _actuators: (Int) number of actuators of every position
+    :return: (Int) bytes
+    """
+    return HEADER.size + ENTRY.size * _positions + _actuators
+
+
+class SharedStateWriter:
+    def __init__(self, _offsets: dict, _name: str = DEFAULT_NAME):
+        """
+        Publish actuator levels into shared memory block that local processes can read.
+
+        :param _offsets: (Dictionary) position name -> (start, end) in flat levels, as EnvelopeEngine
+        :param _name: [optional] (String) name of shared memory block
+        """
+        self.name = _name
+        self.total = max((end for _start, end in _offsets.values()), default=0)
+        size = block_size(len(_offsets), self.total)
+
+        try:
+            self.shm = shared_memory.SharedMemory(_name, create=True, size=size)
+        except FileExistsError:
+            stale = shared_memory.SharedMemory(_name)
+            try:
+                writer = SharedStateWriter.__live_writer(stale)
+            except ValueError:
+                writer = None
+                owner = "other program"
+            else:
+                owner = f"running bridge (pid {writer})" if writer is not None else None
+            if owner is not None:
+                if sys.platform != "win32":
+                    # block isn't ours, resource tracker must not remove it at exit
+                    from multiprocessing import resource_tracker
+                    resource_tracker.unregister(stale._name, "shared_memory")
+                stale.close()
+                raise FileExistsError(f"shared memory {_name} is used by {owner}")
+
+            # left by bridge that didn't exit cleanly
+            stale.close()
+            stale.unlink()
+            self.shm = shared_memory.SharedMemory(_name, create=True, size=size)
+
+        buf = self.shm.buf
+        self.data = HEADER.size + ENTRY.size * len(_offsets)
+        self.sequence = 0
+
+        HEADER.pack_into(buf, 0, MAGIC, FORMAT_VERSION, len(_offsets), 0, time.time(), self.total, os.getpid())
+        for i, (key, (start, end)) in enumerate(_offsets.items()):
+            ENTRY.pack_into(buf, HEADER.size + ENTRY.size * i, key.encode("ascii"), start, end - start)
+
+        print(Flag.Info.value + f"actuator state is shared as {_name}")
+
+    @staticmethod
+    def __live_writer(_shm: shared_memory.SharedMemory):
+        """
+        (PRIVATE STATIC) find writer of existing block that still runs
+        :param _shm: (SharedMemory) existing block
+        :return: (Int) process id of writer, None if block is stale
+        :raise: ValueError if block isn't actuator state
+        """
+        if _shm.size < HEADER.size:
+            raise ValueError("block is too small")
+        magic, _version, _positions, _sequence, timestamp, _actuators, writer = HEADER.unpack_from(_shm.buf, 0)
+        if magic != MAGIC:
+            raise ValueError("block has unknown magic")
+
+        # older blocks have no writer. pid can be reused, so process must be older than block
+        if not writer or not psutil.pid_exists(writer):
+            return None
+        try:
+            if psutil.Process(writer).create_time() > timestamp:
+                return None
+        except psutil.Error:
+            return None
+        return writer
+
+    def publish(self, _levels: list) -> None:
+        """
+        write levels of every actuator
+        :param _levels: (List) levels in flat layout
+        :return: None
+        """
+        buf = self.shm.buf
+        if buf is None:
+            return
+
+        self.sequence += 1
+        SEQUENCE.pack_into(buf, SEQUENCE_OFFSET, self.sequence)
+
+        buf[self.data:self.data + self.total] = bytes([int(level) for level in _levels])
+        TIMESTAMP.pack_into(buf, TIMESTAMP_OFFSET, time.time())
+
+        self.sequence += 1
+        SEQUENCE.pack_into(buf, SEQUENCE_OFFSET, self.sequence)
+
+    def close(self) -> None:
+        """
+        remove shared memory block
+        :return: None
+        """
+        if self.shm.buf is None:
+            return
+        self.shm.close()
+        self.shm.unlink()
+
+
+class SharedStateReader:
+    def __init__(self, _name: str = DEFAULT_NAME):
+        """
+        Read actuator levels that bridge publishes into shared memory.
+
+        :param _name: [optional] (String) name of shared memory block
+        :raise: FileNotFoundError if bridge isn't running, ValueError if block has unknown layout
+        """
+        self.shm = shared_memory.SharedMemory(_name)
+        if sys.platform != "win32":
+            # block belongs to bridge, resource tracker of reader must not remove it at exit
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+
+        magic, version, positions, _sequence, _timestamp, self.total, _writer = HEADER.unpack_from(self.shm.buf, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.shm.close()
+            raise ValueError(f"{_name} is not actuator state of version {FORMAT_VERSION}")
+
+        # position name -> (offset, count)
+        self.positions = {}
+        for i in range(positions):
+            name, offset, count = ENTRY.unpack_from(self.shm.buf, HEADER.size + ENTRY.size * i)
+            self.positions[name.rstrip(b"\0").decode("ascii")] = (offset, count)
+
+        self.data = HEADER.size + ENTRY.size * positions
+
+    def sequence(self) -> int:
+        """
+        get sequence counter, which changes on every update
+        :return: (Int) sequence
+        """
+        return SEQUENCE.unpack_from(self.shm.buf, SEQUENCE_OFFSET)[0]
+
+    def read(self) -> tuple:
+        """
+        read consistent snapshot of every actuator
+        :return: (Tuple) (sequence, unix time of update, Dictionary position name -> list of intensity)
+        :raise: TimeoutError if writer keeps updating during every try
+        """
+        buf = self.shm.buf
+
+        for _ in range(MAX_RETRY):
+            before = SEQUENCE.unpack_from(buf, SEQUENCE_OFFSET)[0]
+            if before & 1:
+                continue
+
+            data = bytes(buf[self.data:self.data + self.total])
+            timestamp = TIMESTAMP.unpack_from(buf, TIMESTAMP_OFFSET)[0]
+
+            if SEQUENCE.unpack_from(buf, SEQUENCE_OFFSET)[0] == before:
+                levels = {key: list(data[offset:offset + count]) for key, (offset, count) in self.positions.items()}
+                return before, timestamp, levels
+
+        raise TimeoutError("actuator state is being updated too often to read")
+
+    def close(self) -> None:
+        self.shm.close()
+
+
+if __name__ == "__main__":
+    # demo consumer: print level bars of every connected position while bridge runs
+    reader = SharedStateReader(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_NAME)
+    last = None
+
+    try:
+        while True:
+            sequence, timestamp, levels = reader.read()
+            if sequence != last:
+                last = sequence
+                lines = [f"sequence {sequence}  age {max(time.time() - timestamp, 0) * 1000:.0f} ms"]
+                for key, values in levels.items():
+                    if values:
+                        lines.append(f"{key:>10} " + " ".join(f"{v:3d}" for v in values))
+                print("\033[2J\033[H" + "\n".join(lines), flush=True)
+            time.sleep(0.05)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.close()
@@ -1,5 +1,6 @@
-import time
+import json, threading, time
 from zeroconf import ServiceBrowser, ServiceInfo, ServiceListener, Zeroconf
+from websocket import ABNF, WebSocketException, create_connection
 import requests
 
 from .shared.node import OSCQueryNode, OSC_Type_String_to_Python_Type, OSCAccess, OSCHostInfo
@@ -32,11 +33,39 @@ class OSCQueryListener(ServiceListener):
             self.oscjson_services[name] = zc.get_service_info(type_, name)
 
 
+OSCQUERY_SERVICE_TYPE = "_oscjson._tcp.local."
+OSC_SERVICE_TYPE = "_osc._udp.local."
+
+
 class OSCQueryBrowser(object):
-    def __init__(self) -> None:
+    """
+    Browse OSC and OSCQuery services on zeroconf until closed.
+
+    Attributes
+    ----------
+    zeroconf : Zeroconf, optional
+        Zeroconf instance shared with other services and browsers. The browser creates and
+        closes its own instance if omitted
+    service_types : list, optional
+        Service types to browse, both OSCQuery and OSC services by default
+    """
+
+    def __init__(self, zeroconf=None, service_types=(OSCQUERY_SERVICE_TYPE, OSC_SERVICE_TYPE)) -> None:
         self.listener = OSCQueryListener()
-        self.zc = Zeroconf()
-        self.browser = ServiceBrowser(self.zc, ["_oscjson._tcp.local.", "_osc._udp.local."], self.listener)
+        self._owns_zeroconf = zeroconf is None
+        self.zc = zeroconf if zeroconf is not None else Zeroconf()
+        self.browser = ServiceBrowser(self.zc, list(service_types), self.listener)
+
+    def close(self):
+        """
+        Stop browsing. Must not be called from the event loop that runs a shared asyncio zeroconf instance.
+        """
+        if self.browser is not None:
+            self.browser.cancel()
+            self.browser = None
+
+        if self._owns_zeroconf:
+            self.zc.close()
 
     def get_discovered_osc(self):
         return [oscsvc[1] for oscsvc in self.listener.osc_services.items()]
@@ -136,8 +165,34 @@ class OSCQueryClient(object):
         else:
             hi.osc_transport = "UDP"
 
+        # websocket is served on the oscjson http server unless stated otherwise
+        if 'WS_IP' in json:
+            hi.ws_ip = json['WS_IP']
+        else:
+            hi.ws_ip = self._get_ip_str()
+
+        if 'WS_PORT' in json:
+            hi.ws_port = json['WS_PORT']
+        else:
+            hi.ws_port = self.service_info.port
+
         return hi
 
+    def open_listen_stream(self, callback, host_info=None, on_close=None):
+        """
+        Opens a websocket to the service and returns a stream that LISTENs to nodes.
+        callback is called with raw OSC packet (bytes) from the stream's thread, and on_close
+        (if given) without argument when the connection is lost.
+        Returns None if the service does not support the LISTEN extension.
+        """
+        if host_info is None:
+            host_info = self.get_host_info()
+
+        if host_info is None or not host_info.extensions.get("LISTEN", False):
+            return None
+
+        return OSCQueryListenStream(f"ws://{host_info.ws_ip}:{host_info.ws_port}", callback, on_close)
+
     def _make_node_from_json(self, json):
         newNode = OSCQueryNode()
 
@@ -180,6 +235,52 @@ class OSCQueryClient(object):
 
 
 
+class OSCQueryListenStream(object):
+    """
+    A websocket connection that uses the OSCQuery LISTEN extension.
+    Value changes of the listened nodes are delivered to callback as raw OSC packets.
+
+    Attributes
+    ----------
+    on_close : callable, optional
+        Called from the stream's thread when the connection is lost, but not after close()
+    """
+
+    def __init__(self, url, callback, on_close=None) -> None:
+        self.url = url
+        self.callback = callback
+        self.on_close = on_close
+        self.closed = False
+        self.ws = create_connection(url)
+        self.thread = threading.Thread(target=self._recv_loop, daemon=True)
+        self.thread.start()
+
+    def listen(self, address):
+        self._send_command("LISTEN", address)
+
+    def ignore(self, address):
+        self._send_command("IGNORE", address)
+
+    def close(self):
+        self.closed = True
+        self.ws.close()
+
+    def _send_command(self, command, address):
+        self.ws.send(json.dumps({"COMMAND": command, "DATA": address}))
+
+    def _recv_loop(self):
+        while self.ws.connected:
+            try:
+                opcode, data = self.ws.recv_data()
+            except (WebSocketException, OSError):
+                break
+
+            if opcode == ABNF.OPCODE_BINARY:
+                self.callback(data)
+
+        if not self.closed and self.on_close is not None:
+            self.on_close()
+
 
 if __name__ == "__main__":
     browser = OSCQueryBrowser()
@@ -1,6 +1,8 @@
 from zeroconf import ServiceInfo, Zeroconf
-from http.server import SimpleHTTPRequestHandler, HTTPServer
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
 from .shared.node import OSCQueryNode, OSCHostInfo, OSCAccess
+from .shared.osc import encode_osc_message
+from .shared import wsframe
 import json, threading
 
 
@@ -16,27 +18,60 @@ class OSCQueryService(object):
         Desired TCP port number for the oscjson HTTP server
     oscPort : int
         Desired UDP port number for the osc server
+    zeroconf : Zeroconf, optional
+        Zeroconf instance shared with other services and browsers. The service creates and
+        closes its own instance if omitted
+    background : bool, optional
+        Register the zeroconf advertisements on a background thread, so the oscjson HTTP server
+        answers right away instead of after the probing that registration needs
     """
     
-    def __init__(self, serverName, httpPort, oscPort, oscIp="127.0.0.1") -> None:
+    def __init__(self, serverName, httpPort, oscPort, oscIp="127.0.0.1", zeroconf=None, background=False) -> None:
         self.serverName = serverName
         self.httpPort = httpPort
         self.oscPort = oscPort
         self.oscIp = oscIp
 
         self.root_node = OSCQueryNode("/", description="root node")
-        self.host_info = OSCHostInfo(serverName, {"ACCESS":True,"CLIPMODE":False,"RANGE":True,"TYPE":True,"VALUE":True}, 
-            self.oscIp, self.oscPort, "UDP")
+        self.host_info = OSCHostInfo(serverName, {"ACCESS":True,"CLIPMODE":False,"RANGE":True,"TYPE":True,"VALUE":True,"LISTEN":True},
+            self.oscIp, self.oscPort, "UDP", self.oscIp, self.httpPort)
 
-        self._zeroconf = Zeroconf()
-        self._startOSCQueryService()
-        self._advertiseOSCService()
+        self._owns_zeroconf = zeroconf is None
+        self._zeroconf = zeroconf if zeroconf is not None else Zeroconf()
+        self._service_infos = []
         self.http_server = OSCQueryHTTPServer(self.root_node, self.host_info, ('', self.httpPort), OSCQueryHTTPHandler)
-        self.http_thread = threading.Thread(target=self._startHTTPServer)
+        self.http_thread = threading.Thread(target=self._startHTTPServer, daemon=True)
         self.http_thread.start()
 
-    def __del__(self):
-        self._zeroconf.unregister_all_services()
+        self.register_thread = None
+        if background:
+            self.register_thread = threading.Thread(target=self._registerServices, daemon=True)
+            self.register_thread.start()
+        else:
+            self._registerServices()
+
+    def close(self):
+        """
+        Unregister the zeroconf advertisements of this service and stop the oscjson HTTP server.
+
+        Blocks while goodbye packets are sent, so it must not be called from the event loop that
+        runs a shared asyncio zeroconf instance.
+        """
+        if self.register_thread is not None:
+            self.register_thread.join()
+            self.register_thread = None
+
+        for info in self._service_infos:
+            self._zeroconf.unregister_service(info)
+        self._service_infos.clear()
+
+        if self.http_server is not None:
+            self.http_server.shutdown()
+            self.http_server.server_close()
+            self.http_server = None
+
+        if self._owns_zeroconf:
+            self._zeroconf.close()
 
     def add_node(self, node):
         self.root_node.add_child_node(node)
@@ -52,11 +87,52 @@ class OSCQueryService(object):
                 new_node.type_ = [type(v) for v in value]
         self.add_node(new_node)
 
+    def add_route(self, path, callback):
+        """
+        Serve a path that is not part of the OSC tree from the oscjson HTTP server.
+
+        Parameters
+        ----------
+        path : str
+            Request path, without query string
+        callback : callable
+            Called with the request handler on HTTP server thread. It writes the whole
+            response, e.g. with handler.send_body()
+        """
+        self.http_server.routes[path] = callback
+
+    def update_value(self, address, value):
+        """
+        Update value of an advertised node and stream it to the clients that LISTEN to it.
+
+        Parameters
+        ----------
+        address : str
+            Full path of the node
+        value
+            New value, or list of values
+        """
+        node = self.root_node.find_subnode(address)
+        if node is None:
+            raise Exception(f"Tried to update value of unknown node {address}!")
+
+        values = value if isinstance(value, list) else [value]
+        node.value = values
+        if node.type_ is None:
+            node.type_ = [type(v) for v in values]
+
+        self.http_server.stream_value(address, encode_osc_message(address, values))
+
+    def _registerServices(self):
+        self._startOSCQueryService()
+        self._advertiseOSCService()
+
     def _startOSCQueryService(self):
         oscqsDesc = {'txtvers': 1}
         oscqsInfo = ServiceInfo("_oscjson._tcp.local.", "%s._oscjson._tcp.local." % self.serverName, self.httpPort, 
         0, 0, oscqsDesc, "%s.oscjson.local." % self.serverName, addresses=["127.0.0.1"])
         self._zeroconf.register_service(oscqsInfo)
+        self._service_infos.append(oscqsInfo)
 
 
     def _startHTTPServer(self):
@@ -68,17 +144,83 @@ class OSCQueryService(object):
         0, 0, oscDesc, "%s.osc.local." % self.serverName, addresses=["127.0.0.1"])
 
         self._zeroconf.register_service(oscInfo)
+        self._service_infos.append(oscInfo)
+
 
+class OSCQueryHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
 
-class OSCQueryHTTPServer(HTTPServer):
     def __init__(self, root_node, host_info, server_address: tuple[str, int], RequestHandlerClass, bind_and_activate: bool = ...) -> None:
         super().__init__(server_address, RequestHandlerClass, bind_and_activate)
         self.root_node = root_node
         self.host_info = host_info
+        # address -> set of websocket connections that LISTEN to it
+        self.listeners = {}
+        self.listeners_lock = threading.Lock()
+        # path -> callback that writes response, for paths outside the OSC tree
+        self.routes = {}
+
+    def stream_value(self, address, packet):
+        with self.listeners_lock:
+            connections = list(self.listeners.get(address, ()))
+
+        for connection in connections:
+            connection.send_binary(packet)
+
+    def add_listener(self, address, connection):
+        with self.listeners_lock:
+            self.listeners.setdefault(address, set()).add(connection)
+
+    def remove_listener(self, address, connection):
+        with self.listeners_lock:
+            connections = self.listeners.get(address)
+            if connections is not None:
+                connections.discard(connection)
+                if not connections:
+                    del self.listeners[address]
+
+    def remove_connection(self, connection):
+        with self.listeners_lock:
+            for address in list(self.listeners):
+                self.listeners[address].discard(connection)
+                if not self.listeners[address]:
+                    del self.listeners[address]
+
+
+class OSCQueryWSConnection(object):
+    """
+    A websocket connection of a client that uses the LISTEN extension.
+    """
+
+    def __init__(self, wfile) -> None:
+        self.wfile = wfile
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def send_binary(self, payload):
+        self._send(wsframe.OPCODE_BINARY, payload)
+
+    def _send(self, opcode, payload):
+        if self.closed:
+            return
+
+        with self.lock:
+            try:
+                self.wfile.write(wsframe.encode_frame(opcode, payload))
+                self.wfile.flush()
+            except OSError:
+                self.closed = True
 
 
 class OSCQueryHTTPHandler(SimpleHTTPRequestHandler):
     def do_GET(self) -> None:
+        if self.headers.get("Upgrade", "").lower() == "websocket":
+            self._handle_websocket()
+            return
+        route = self.server.routes.get(self.path.split("?", 1)[0])
+        if route is not None:
+            route(self)
+            return
         if 'HOST_INFO' in self.path:
             self.send_response(200)
             self.send_header("Content-type", "text/json")
@@ -97,6 +239,60 @@ class OSCQueryHTTPHandler(SimpleHTTPRequestHandler):
             self.end_headers()
             self.wfile.write(bytes(str(node.to_json()), 'utf-8'))
 
+    def send_body(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header("Content-type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle_websocket(self):
+        key = self.headers.get("Sec-WebSocket-Key")
+        if key is None:
+            self.send_error(400, "Missing Sec-WebSocket-Key")
+            return
+
+        self.send_response(101, "Switching Protocols")
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", wsframe.accept_key(key))
+        self.end_headers()
+        self.wfile.flush()
+        self.close_connection = True
+
+        connection = OSCQueryWSConnection(self.wfile)
+        try:
+            while not connection.closed:
+                frame = wsframe.read_frame(self.rfile)
+                if frame is None:
+                    break
+
+                opcode, payload = frame
+                if opcode == wsframe.OPCODE_CLOSE:
+                    connection._send(wsframe.OPCODE_CLOSE, payload[:2])
+                    break
+                elif opcode == wsframe.OPCODE_PING:
+                    connection._send(wsframe.OPCODE_PONG, payload)
+                elif opcode == wsframe.OPCODE_TEXT:
+                    self._handle_ws_command(connection, payload)
+        except OSError:
+            pass
+        finally:
+            connection.closed = True
+            self.server.remove_connection(connection)
+
+    def _handle_ws_command(self, connection, payload):
+        try:
+            command = json.loads(payload)
+            name, address = command["COMMAND"], command["DATA"]
+        except (ValueError, KeyError, TypeError):
+            return
+
+        if name == "LISTEN":
+            self.server.add_listener(address, connection)
+        elif name == "IGNORE":
+            self.server.remove_listener(address, connection)
+
     def log_message(self, format, *args):
         pass
             
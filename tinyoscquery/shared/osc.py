@@ -0,0 +1,38 @@
+import struct
+
+
+def _pad(data: bytes) -> bytes:
+    # OSC strings are null terminated and padded to a multiple of 4 bytes
+    return data + b"\0" * (4 - len(data) % 4)
+
+
+def encode_osc_message(address, values) -> bytes:
+    '''
+    Encodes an OSC message with the given address and values.
+
+        Parameters:
+            address (str): OSC address of the message
+            values (list): Arguments of the message (bool, int, float or str)
+
+        Returns:
+            packet (bytes): Encoded OSC message
+    '''
+    type_tags = ","
+    arguments = b""
+
+    for value in values:
+        if isinstance(value, bool):
+            type_tags += "T" if value else "F"
+        elif isinstance(value, int):
+            type_tags += "i"
+            arguments += struct.pack(">i", value)
+        elif isinstance(value, float):
+            type_tags += "f"
+            arguments += struct.pack(">f", value)
+        elif isinstance(value, str):
+            type_tags += "s"
+            arguments += _pad(value.encode("utf-8"))
+        else:
+            raise Exception(f"Cannot encode {type(value)} to OSC argument!")
+
+    return _pad(address.encode("utf-8")) + _pad(type_tags.encode("utf-8")) + arguments
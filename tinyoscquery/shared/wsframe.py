@@ -0,0 +1,79 @@
+import base64, hashlib, struct
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OPCODE_TEXT = 0x1
+OPCODE_BINARY = 0x2
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+
+
+def accept_key(key):
+    '''
+    Computes Sec-WebSocket-Accept header value for the handshake.
+
+        Parameters:
+            key (str): Sec-WebSocket-Key header value sent by client
+
+        Returns:
+            accept (str): value for Sec-WebSocket-Accept header
+    '''
+    digest = hashlib.sha1((key + WS_GUID).encode("ascii")).digest()
+    return base64.b64encode(digest).decode("ascii")
+
+
+def encode_frame(opcode, payload) -> bytes:
+    '''
+    Encodes a single unmasked (server to client) websocket frame.
+
+        Parameters:
+            opcode (int): websocket opcode
+            payload (bytes): frame payload
+
+        Returns:
+            frame (bytes): encoded frame
+    '''
+    length = len(payload)
+    header = bytes([0x80 | opcode])
+
+    if length < 126:
+        header += bytes([length])
+    elif length < 65536:
+        header += bytes([126]) + struct.pack(">H", length)
+    else:
+        header += bytes([127]) + struct.pack(">Q", length)
+
+    return header + payload
+
+
+def read_frame(rfile):
+    '''
+    Reads a single websocket frame from a file-like object.
+
+        Parameters:
+            rfile: readable binary file-like object
+
+        Returns:
+            frame (tuple): (opcode, payload), or None when connection is closed
+    '''
+    head = rfile.read(2)
+    if len(head) < 2:
+        return None
+
+    opcode = head[0] & 0x0F
+    masked = head[1] & 0x80
+    length = head[1] & 0x7F
+
+    if length == 126:
+        length = struct.unpack(">H", rfile.read(2))[0]
+    elif length == 127:
+        length = struct.unpack(">Q", rfile.read(8))[0]
+
+    mask = rfile.read(4) if masked else None
+    payload = rfile.read(length)
+
+    if mask:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+    return opcode, payload
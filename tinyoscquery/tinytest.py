@@ -8,8 +8,13 @@ if __name__ == "__main__":
     print(oscqs.root_node)
 
     oscqs.add_node(OSCQueryNode("/testing/is/cool"))
+    oscqs.advertise_endpoint("/testing/value", 0.0)
 
     print(oscqs.root_node)
 
+    # Clients that LISTEN to /testing/value over websocket receive every update
+    value = 0.0
     while True:
-        time.sleep(1)
\ No newline at end of file
+        time.sleep(1)
+        value = (value + 0.1) % 1.0
+        oscqs.update_value("/testing/value", value)
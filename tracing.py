@@ -0,0 +1,145 @@
+import itertools
+import json
+import os
+import threading
+import time
+
+DEFAULT_CAPACITY = 65536
+
+
+class Tracer:
+    def __init__(self, _capacity: int = DEFAULT_CAPACITY):
+        """
+        Ring buffer of timed spans, dumped as Chrome Trace Event JSON (chrome://tracing, Perfetto).
+
+        buffer is allocated when tracing is first enabled and oldest spans are overwritten. slots are
+        claimed with an atomic counter, so spans can be recorded from any thread without lock.
+        usage: start = tracer.start() ... tracer.end("name", start). start() is 0 while disabled
+        and end() of such span does nothing.
+        :param _capacity: [optional] (Int) number of spans kept
+        """
+        self.enabled = False
+        self.capacity = _capacity
+        self.__allocate(0)
+
+    def __allocate(self, _capacity: int):
+        self.names = [None] * _capacity
+        self.starts = [0] * _capacity
+        self.ends = [0] * _capacity
+        self.threads = [0] * _capacity
+        self.args = [None] * _capacity
+        self.__counter = itertools.count()
+        self.__origin = time.perf_counter_ns()
+
+    def configure(self, _enabled: bool, _capacity: int = DEFAULT_CAPACITY) -> None:
+        """
+        enable or disable tracing. buffer is cleared when capacity changes
+        :param _enabled: (Bool) record spans
+        :param _capacity: [optional] (Int) number of spans kept
+        :return: None
+        """
+        if _enabled and (_capacity != self.capacity or not self.names):
+            self.enabled = False
+            self.capacity = _capacity
+            self.__allocate(_capacity)
+        self.enabled = _enabled
+
+    def start(self) -> int:
+        """
+        get start time of span
+        :return: (Int) perf_counter_ns, 0 if tracing is disabled
+        """
+        return time.perf_counter_ns() if self.enabled else 0
+
+    def end(self, _name: str, _start: int, _args: dict = None) -> None:
+        """
+        record span that started at start() and ends now
+        :param _name: (String) name of span
+        :param _start: (Int) value returned by start()
+        :param _args: [optional] (Dictionary) arguments shown with span
+        :return: None
+        """
+        if _start:
+            self.__record(_name, _start, time.perf_counter_ns(), _args)
+
+    def instant(self, _name: str, _args: dict = None) -> None:
+        """
+        record event without duration
+        :param _name: (String) name of event
+        :param _args: [optional] (Dictionary) arguments shown with event
+        :return: None
+        """
+        if self.enabled:
+            now = time.perf_counter_ns()
+            self.__record(_name, now, now, _args)
+
+    def __record(self, _name: str, _start: int, _end: int, _args):
+        i = next(self.__counter) % len(self.names)
+        self.names[i] = _name
+        self.starts[i] = _start
+        self.ends[i] = _end
+        self.threads[i] = threading.get_ident()
+        self.args[i] = _args
+
+    def events(self) -> list:
+        """
+        get recorded spans as trace events, oldest first
+        :return: (List) Chrome Trace Event dictionaries
+        """
+        pid = os.getpid()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        events = []
+        seen = set()
+
+        for i in range(len(self.names)):
+            name = self.names[i]
+            if name is None:
+                continue
+
+            tid = self.threads[i]
+            start, end = self.starts[i], self.ends[i]
+            event = {
+                "name": name,
+                "ph": "X" if end > start else "i",
+                "ts": (start - self.__origin) / 1000,
+                "pid": pid,
+                "tid": tid,
+            }
+            if end > start:
+                event["dur"] = (end - start) / 1000
+            else:
+                event["s"] = "t"
+            if self.args[i]:
+                event["args"] = self.args[i]
+            events.append(event)
+            seen.add(tid)
+
+        events.sort(key=lambda e: e["ts"])
+
+        for tid in seen:
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+                           "args": {"name": names.get(tid, str(tid))}})
+
+        return events
+
+    def dumps(self) -> str:
+        """
+        get recorded spans as Chrome Trace Event JSON
+        :return: (String) JSON
+        """
+        return json.dumps({"traceEvents": self.events(), "displayTimeUnit": "ms"})
+
+    def dump(self, _file: str) -> None:
+        """
+        write recorded spans to Chrome Trace Event JSON file
+        :param _file: (String) file path
+        :return: None
+        """
+        if os.path.dirname(_file):
+            os.makedirs(os.path.dirname(_file), exist_ok=True)
+        with open(_file, "w", encoding="utf-8") as f:
+            f.write(self.dumps())
+
+
+# default tracer of parts created without session tracer (tools, replay). every bridge session has its own
+tracer = Tracer()